@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""End-to-end benchmark of the controller against the local FlexFact
+stand-in: loops per second, Modbus transactions per loop and latency from
+a sensor edge to the next coil write.
+
+The plant is loaded and run by main, with the options of main.py for the
+loop (eg. -d, -n, -s, -a, --engine or --table) next to the ones of
+[build_parser].
+
+Usage: python benchmarks/bench_end_to_end.py [-d DEV] [-n NET] [-t SECONDS]
+"""
+import asyncio
+import random
+import sys
+import threading
+import time
+from argparse import ArgumentParser, Namespace
+from bisect import bisect_right
+from pathlib import Path
+from typing import List, Tuple, Union
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "src"))
+
+import cli  # noqa: E402
+import main as controller_main  # noqa: E402
+from modbus.server import FlexFactStandIn, parse_script  # noqa: E402
+from plants import Plant  # noqa: E402
+from scheduler import TickScheduler  # noqa: E402
+
+
+def build_parser() -> ArgumentParser:
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "-t", "--duration", type=float, help="seconds to run", default=10.0
+    )
+    parser.add_argument(
+        "-r",
+        "--edge-rate",
+        type=float,
+        help="random sensor edges per second",
+        default=20.0,
+    )
+    parser.add_argument(
+        "--script", help="replay a stand-in script instead of random edges"
+    )
+    parser.add_argument("--port", type=int, default=15020)
+    parser.add_argument("--seed", type=int, default=0)
+    return parser
+
+
+async def random_edges(standin: FlexFactStandIn, rate: float, seed: int):
+    generator = random.Random(seed)
+    addresses = sorted(
+        set(
+            trigger.address
+            for event in standin.inputs.values()
+            for trigger in event.triggers
+        )
+    )
+    while True:
+        await asyncio.sleep(generator.expovariate(rate))
+        address = generator.choice(addresses)
+        standin.set_input(address, not standin.get_input(address))
+
+
+def parse_args() -> Tuple[Namespace, Namespace]:
+    """Options of the benchmark, and the ones of main for the plant"""
+    parser = build_parser()
+    args, rest = parser.parse_known_args()
+    options = cli.build_parser().parse_args(rest)
+    for option in ("plants", "replay", "record", "journal", "live_view"):
+        if getattr(options, option) is not None:
+            parser.error(f"--{option.replace('_', '-')} isn't benchmarked")
+    if options.sleep <= 0:
+        parser.error("--sleep should be positive")
+    if options.device is None:
+        options.device = ROOT / "example" / "example.dev"
+    if options.net is None:
+        options.net = ROOT / "example" / "example.net"
+    return args, options
+
+
+class Stop(Exception):
+    """Ends the run of the benchmarked plant"""
+
+
+class TimedScheduler(TickScheduler):
+    """The scheduler of a plant, ending its run by raising [Stop] between
+    two loops once [duration] seconds have passed"""
+
+    def __init__(self, scheduler: TickScheduler, duration: float):
+        super().__init__(
+            scheduler.min_period, scheduler.max_period, scheduler.backoff
+        )
+        self.end = time.perf_counter() + duration
+
+    def delay(
+        self, active: bool = True, until: Union[float, None] = None
+    ) -> float:
+        if time.perf_counter() >= self.end:
+            raise Stop
+        return super().delay(active, until)
+
+
+def start_standin(args: Namespace, device_path: Path) -> FlexFactStandIn:
+    """Run the stand-in and its edges on their own thread and event loop."""
+    standin = FlexFactStandIn.from_device(
+        device_path, ("127.0.0.1", args.port)
+    )
+    ready = threading.Event()
+
+    async def run():
+        serving = asyncio.ensure_future(standin.serve())
+        await standin.started()
+        ready.set()
+        if args.script is not None:
+            await standin.replay(parse_script(args.script))
+        elif args.edge_rate > 0:
+            await random_edges(standin, args.edge_rate, args.seed)
+        await serving
+
+    threading.Thread(target=asyncio.run, args=(run(),), daemon=True).start()
+    ready.wait()
+    return standin
+
+
+def latencies(standin: FlexFactStandIn, since: float) -> List[float]:
+    """Time from each coil write to the last edge before it, each edge
+    counted at most once."""
+    edge_times = [t for t, _, _ in standin.edges if t >= since]
+    result = []
+    last_matched = -1
+    for written_at, _, _ in standin.coil_writes:
+        i = bisect_right(edge_times, written_at) - 1
+        if i > last_matched:
+            result.append(written_at - edge_times[i])
+            last_matched = i
+    return result
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def main():
+    args, options = parse_args()
+
+    standin = start_standin(args, options.device)
+    plant = controller_main.load_plant(
+        options,
+        Plant("", options.device, options.net, options.table, None, None),
+        None,
+    )
+    plant.address = ("127.0.0.1", args.port)
+
+    # Without an event log the controller only shows its header, which
+    # isn't part of the benchmark
+    start = time.perf_counter()
+    plant.scheduler = TimedScheduler(plant.scheduler, args.duration)
+    try:
+        if options.use_async:
+            asyncio.run(controller_main.run_async(plant))
+        else:
+            controller_main.run(plant)
+    except Stop:
+        pass
+    elapsed = time.perf_counter() - start
+
+    ticks = plant.metrics.ticks
+    edge_latencies = latencies(standin, start)
+    mode = "async" if options.use_async else "sync"
+    print("")
+    print(f"{mode}, {args.duration:g} s, period {options.sleep * 1000:g} ms")
+    print(f"loops: {ticks} ({ticks / elapsed:,.1f} /s)")
+    print(
+        "modbus transactions per loop:"
+        f" {plant.metrics.modbus.requests / max(ticks, 1):.2f}"
+    )
+    print(
+        f"edges: {len([t for t, _, _ in standin.edges if t >= start])},"
+        f" coil writes: {len(standin.coil_writes)}"
+    )
+    print(
+        "edge to coil write latency:"
+        f" p50 {percentile(edge_latencies, 0.5) * 1000:.2f} ms,"
+        f" p99 {percentile(edge_latencies, 0.99) * 1000:.2f} ms"
+        f" ({len(edge_latencies)} samples)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""Benchmark of the .net parser: parse time and peak memory on a net from
+generate.py.
+
+Usage: python benchmarks/bench_parser.py [-t TRANSITIONS] [-r REPEATS]
+"""
+import sys
+import tempfile
+import time
+import tracemalloc
+from argparse import ArgumentParser
+from pathlib import Path
+
+from generate import Shape, generate
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from parsers import network  # noqa: E402
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-t", "--transitions", type=int, default=100_000)
+    parser.add_argument("-r", "--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = Path(directory) / "generated.net"
+        # About one place per two transitions, so places have several arcs
+        net, _ = generate(
+            Shape(args.transitions, places=max(2, args.transitions // 2))
+        )
+        path.write_text(net)
+        size = path.stat().st_size
+
+        # Best of a few runs for the time, memory measured apart as tracing
+        # slows the parser down
+        elapsed = float("inf")
+        for _ in range(args.repeats):
+            start = time.perf_counter()
+            petri_network = network.parse(path)
+            elapsed = min(elapsed, time.perf_counter() - start)
+
+        del petri_network
+        tracemalloc.start()
+        petri_network = network.parse(path)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    arcs = sum(
+        len(t.input_arcs) + len(t.output_arcs)
+        for t in petri_network.transitions
+    )
+    print(
+        f"transitions: {len(petri_network.transitions)},"
+        f" places: {len(petri_network.places)}, arcs: {arcs},"
+        f" file: {size / 1e6:.1f} MB"
+    )
+    print(
+        f"parse: {elapsed:.3f} s"
+        f" ({len(petri_network.transitions) / elapsed:,.0f} transitions/s)"
+    )
+    print(f"peak memory: {peak / 1e6:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""Benchmark of the token game: firings per second and memory per place
+and arc of petri_net.py.
+
+Usage: python benchmarks/bench_petri_net.py [-p PLACES] [-f FIRINGS]
+"""
+import sys
+import time
+import tracemalloc
+from argparse import ArgumentParser
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from petri_net import (  # noqa: E402
+    InputArc,
+    InputArcTypes,
+    OutputArc,
+    PetriNet,
+    Place,
+    Tokens,
+    Transition,
+)
+
+
+def build_ring(size: int) -> PetriNet:
+    """A ring of [size] places holding one token every other place, each
+    transition also has a read arc and an inhibitor arc."""
+    places = [Place(f"p{i}", Tokens(i % 2)) for i in range(size)]
+    transitions = []
+    for i in range(size):
+        transition = Transition(f"t{i}")
+        transition.input_arcs.append(
+            InputArc(places[i], Tokens(1), InputArcTypes.REGULAR)
+        )
+        transition.input_arcs.append(
+            InputArc(places[(i + 2) % size], Tokens(0), InputArcTypes.READ)
+        )
+        transition.input_arcs.append(
+            InputArc(
+                places[(i + 1) % size], Tokens(2), InputArcTypes.INHIBITOR
+            )
+        )
+        transition.output_arcs.append(
+            OutputArc(places[(i + 1) % size], Tokens(1))
+        )
+        transitions.append(transition)
+
+    return PetriNet(places, transitions)
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-p", "--places", type=int, default=10_000)
+    parser.add_argument("-f", "--firings", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    tracemalloc.start()
+    petri_network = build_ring(args.places)
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    arcs = sum(
+        len(t.input_arcs) + len(t.output_arcs)
+        for t in petri_network.transitions
+    )
+
+    transitions = petri_network.transitions
+    attempts = fired = 0
+    start = time.perf_counter()
+    while fired < args.firings:
+        for transition in transitions:
+            attempts += 1
+            if transition.try_fire():
+                fired += 1
+    elapsed = time.perf_counter() - start
+
+    print(f"places: {args.places}, arcs: {arcs}")
+    print(f"memory: {memory / (args.places + arcs):.1f} B per place/arc")
+    print(f"firings: {fired / elapsed:,.0f} /s")
+    print(f"attempts: {attempts / elapsed:,.0f} /s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+"""Benchmark suite on generated nets of growing size: parse time, peak
+memory, time per loop and firings per second, saved to a results file that
+can be compared with the one of another commit.
+
+Usage: python benchmarks/bench_suite.py [-t 1000,10000,100000] [-l LOOPS]
+           [-o RESULTS] [--compare BASELINE] [net shape options]
+"""
+import json
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from argparse import ArgumentParser
+from dataclasses import asdict
+from pathlib import Path
+from typing import Dict, List, Tuple, Union
+
+from generate import Shape, add_shape_arguments, shape_from_args, write
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "src"))
+
+from parsers import device, network  # noqa: E402
+from parsers.device import InputEvent, OutputEvent, RemoteImage  # noqa: E402
+from petri_net import PetriNet  # noqa: E402
+from simulate import SimulatedController  # noqa: E402
+from transition_index import TransitionIndex  # noqa: E402
+
+
+# Loops without any firing after which the net is taken as dead, and
+# started again from its initial marking
+STALL_LOOPS = 1000
+
+# Changes smaller than that are only noise: on three back-to-back runs of
+# the suite, the medians of the loops differed by up to 18% and the parse
+# times of the small nets by up to 28%
+NOISE = 0.3
+
+# Metrics of the results, and whether more is better
+METRICS = {
+    "parse_net_s": False,
+    "parse_device_s": False,
+    "peak_memory_mb": False,
+    "loop_mean_us": False,
+    "loop_p50_us": False,
+    "loop_p99_us": False,
+    "firings_per_s": True,
+}
+
+
+def commit() -> Union[str, None]:
+    """Commit of the working tree, marked when it has changes"""
+    try:
+        head = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+        dirty = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return f"{head}-dirty" if dirty else head
+
+
+def percentile(values: List[float], q: float) -> float:
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def run_loops(
+    petri_network: PetriNet,
+    inputs: Dict[str, InputEvent],
+    outputs: Dict[str, OutputEvent],
+    remote_image: RemoteImage,
+    index: TransitionIndex,
+    loops: int,
+    seed: int,
+) -> Tuple[List[float], int, int]:
+    """Sorted times of [loops] loops on random sensor edges as in
+    simulate.py, every loop reading one, with the number of firings and
+    of restarts from the initial marking"""
+    initial = petri_network.get_marking()
+    generator = random.Random(seed)
+    times = []
+    firings = 0
+    restarts = 0
+    while len(times) < loops:
+        for place, tokens in zip(petri_network.places, initial):
+            place.tokens = tokens
+        with SimulatedController(
+            petri_network, inputs, outputs, remote_image, index=index
+        ) as controller:
+            masks = [
+                controller.bits[address]
+                for address, transitions in zip(
+                    controller.image_addresses, controller.by_bit
+                )
+                if transitions
+            ]
+            image = 0
+            stalled = 0
+            while len(times) < loops and stalled < STALL_LOOPS:
+                if masks:
+                    image ^= generator.choice(masks)
+                start = time.perf_counter()
+                fired = controller.step(image)
+                times.append(time.perf_counter() - start)
+                stalled = 0 if fired else stalled + 1
+            firings += sum(controller.metrics.fired)
+        restarts += 1
+
+    # The net is left as it started, for the next run
+    for place, tokens in zip(petri_network.places, initial):
+        place.tokens = tokens
+    times.sort()
+    return times, firings, restarts - 1
+
+
+def bench(shape: Shape, loops: int, repeats: int) -> Dict[str, float]:
+    with tempfile.TemporaryDirectory() as directory:
+        net_path, device_path = write(shape, Path(directory) / "generated")
+
+        # Best of a few runs for the times, memory measured apart as
+        # tracing slows everything down
+        parse_net = parse_device = float("inf")
+        for _ in range(repeats):
+            start = time.perf_counter()
+            petri_network = network.parse(net_path)
+            parsed = time.perf_counter()
+            _, inputs, outputs, remote_image, _ = device.parse(device_path)
+            parse_net = min(parse_net, parsed - start)
+            parse_device = min(parse_device, time.perf_counter() - parsed)
+
+        del petri_network
+        tracemalloc.start()
+        petri_network = network.parse(net_path)
+        _, inputs, outputs, remote_image, _ = device.parse(device_path)
+        index = TransitionIndex(petri_network, inputs, outputs)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    # Every run does the same loops on the same edges, so they only
+    # differ by the noise of the machine. The median of each metric is
+    # kept
+    runs = []
+    for _ in range(repeats):
+        times, firings, restarts = run_loops(
+            petri_network,
+            inputs,
+            outputs,
+            remote_image,
+            index,
+            loops,
+            shape.seed,
+        )
+        runs.append(
+            (
+                sum(times) / len(times) * 1e6,
+                percentile(times, 0.5) * 1e6,
+                percentile(times, 0.99) * 1e6,
+                firings / sum(times),
+            )
+        )
+    loop_mean, loop_p50, loop_p99, firings_per_s = (
+        statistics.median(values) for values in zip(*runs)
+    )
+
+    arcs = sum(
+        len(t.input_arcs) + len(t.output_arcs)
+        for t in petri_network.transitions
+    )
+    return {
+        "transitions": len(petri_network.transitions),
+        "places": len(petri_network.places),
+        "arcs": arcs,
+        "parse_net_s": parse_net,
+        "parse_device_s": parse_device,
+        "peak_memory_mb": peak / 1e6,
+        "loops": loops,
+        "restarts": restarts,
+        "repeats": repeats,
+        "loop_mean_us": loop_mean,
+        "loop_p50_us": loop_p50,
+        "loop_p99_us": loop_p99,
+        "firings_per_s": firings_per_s,
+    }
+
+
+def render(result: Dict[str, float], baseline: Union[dict, None]) -> str:
+    lines = [
+        f"{result['transitions']} transitions, {result['places']} places,"
+        f" {result['arcs']} arcs ({result['restarts']} restarts)"
+    ]
+    for metric, higher_is_better in METRICS.items():
+        line = f"  {metric}: {result[metric]:,.3f}"
+        if baseline is not None and baseline.get(metric):
+            change = result[metric] / baseline[metric] - 1
+            verdict = ""
+            if abs(change) >= NOISE:
+                better = (change > 0) == higher_is_better
+                verdict = ", better" if better else ", worse"
+            line += f" (was {baseline[metric]:,.3f}, {change:+.1%}{verdict})"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "-t",
+        "--transitions",
+        help="sizes of the nets, comma separated",
+        default="1000,10000,100000",
+    )
+    parser.add_argument(
+        "-l", "--loops", type=int, help="loops per net", default=20_000
+    )
+    parser.add_argument(
+        "-r",
+        "--repeats",
+        type=int,
+        help="runs of the parse and of the loops, the best parse time and"
+        " the median of the loops are kept",
+        default=3,
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=Path,
+        help="results file, as JSON",
+        default=Path("bench_results.json"),
+    )
+    parser.add_argument(
+        "--compare",
+        type=Path,
+        help="results file of another commit to compare with",
+        default=None,
+    )
+    add_shape_arguments(parser)
+    args = parser.parse_args()
+
+    try:
+        sizes = [int(size) for size in args.transitions.split(",")]
+    except ValueError:
+        parser.error("--transitions should be comma separated integers")
+    if args.loops < 1 or args.repeats < 1:
+        parser.error("--loops and --repeats should be at least 1")
+
+    baselines = {}
+    if args.compare is not None:
+        try:
+            with open(args.compare) as file:
+                compared = json.load(file)
+        except (OSError, json.JSONDecodeError) as e:
+            parser.error(f"Invalid results file: {e}")
+        if compared["shape"] != asdict(shape_from_args(0, args)):
+            print(f"Warning: {args.compare} was run on other nets")
+        baselines = {r["transitions"]: r for r in compared["results"]}
+        print(f"Compared with {compared['commit']} ({args.compare})")
+
+    results = []
+    for size in sizes:
+        result = bench(shape_from_args(size, args), args.loops, args.repeats)
+        results.append(result)
+        print(render(result, baselines.get(result["transitions"])))
+
+    with open(args.output, "w") as file:
+        json.dump(
+            {
+                "commit": commit(),
+                "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "shape": asdict(shape_from_args(0, args)),
+                "results": results,
+            },
+            file,
+            indent=2,
+        )
+    print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""Generator of large nets and matching device files, to see how the
+parser, the token game and the controller scale.
+
+Usage: python benchmarks/generate.py -t TRANSITIONS -o PREFIX [options]
+"""
+import random
+from argparse import ArgumentParser
+from dataclasses import dataclass, replace
+from pathlib import Path
+from typing import List, Tuple
+
+
+@dataclass
+class Shape:
+    """Parameters of a generated net.
+
+    Each transition has [fan_in] input arcs, each one a read arc with
+    probability [read_ratio], an inhibitor arc with probability
+    [inhibitor_ratio] and a regular arc otherwise (the first one always is).
+    It has as many output arcs as regular input arcs, so the number of
+    tokens never changes. A fraction [event_density] of the transitions
+    fire on an edge of one of [sensors] inputs, the other ones are
+    unconditional and only move tokens to places further in the net, so
+    they can't fire forever. Half of them write one of [coils] coils.
+    """
+
+    transitions: int = 10_000
+    places: int = 0  # 0 for as many as transitions
+    fan_in: int = 2
+    read_ratio: float = 0.1
+    inhibitor_ratio: float = 0.05
+    event_density: float = 0.5
+    sensors: int = 0  # 0 for one per 16 transitions of events
+    coils: int = 0  # 0 for one per 16 unconditional transitions
+    marked: float = 0.5  # fraction of the places holding a token
+    seed: int = 0
+
+    def resolved(self) -> "Shape":
+        """The shape with the defaults depending on the size filled in"""
+        events = round(self.transitions * self.event_density)
+        return replace(
+            self,
+            places=self.places or max(2, self.transitions),
+            sensors=self.sensors or max(1, events // 16),
+            coils=self.coils or max(1, (self.transitions - events) // 16),
+        )
+
+
+def generate(shape: Shape) -> Tuple[str, str]:
+    """The .net and .dev files of a net of [shape]"""
+    shape = shape.resolved()
+    if shape.fan_in < 1:
+        raise ValueError("fan_in should be at least 1")
+    generator = random.Random(shape.seed)
+    places = shape.places
+
+    lines = ["net generated"]
+    for i in range(shape.transitions):
+        event = generator.random() < shape.event_density
+        kinds = [""] + [
+            "?1"
+            if draw < shape.read_ratio
+            else "?-2"
+            if draw < shape.read_ratio + shape.inhibitor_ratio
+            else ""
+            for draw in (generator.random() for _ in range(shape.fan_in - 1))
+        ]
+        regular = kinds.count("")
+
+        if event:
+            # And transitions of events move them back, so the net never
+            # runs dry
+            sources = generator.sample(range(1, places), regular)
+            end = min(sources)
+            targets = [generator.randrange(end) for _ in range(regular)]
+            sensor = generator.randrange(shape.sensors)
+            edge = generator.choice("+-")
+            name = f"{{s{sensor}{edge}X{i}}}"
+        else:
+            # Tokens only move forward, from the first places of the net
+            # to the last ones, so cascades of unconditional transitions
+            # always end
+            sources = generator.sample(range(places - 1), regular)
+            start = max(sources) + 1
+            targets = [
+                generator.randrange(start, places) for _ in range(regular)
+            ]
+            if generator.random() < 0.5:
+                coil = generator.randrange(shape.coils)
+                name = f"{{c{coil}_{generator.choice(('on', 'off'))}X{i}}}"
+            else:
+                name = f"t{i}"
+
+        others = [
+            f"p{generator.randrange(places)}{kind}" for kind in kinds if kind
+        ]
+        inputs = " ".join([f"p{p}" for p in sources] + others)
+        outputs = " ".join(f"p{p}" for p in targets)
+        lines.append(f"tr {name} [0,w[ {inputs} -> {outputs}")
+
+    for p in range(places):
+        if generator.random() < shape.marked:
+            lines.append(f"pl p{p} (1)")
+    return "\n".join(lines) + "\n", generate_device(shape)
+
+
+def generate_device(shape: Shape) -> str:
+    """Device file with a rising and a falling event for each sensor, and
+    an on and off event for each coil"""
+    shape = shape.resolved()
+    events: List[str] = []
+    for sensor in range(shape.sensors):
+        for edge, trigger in (("+", "PositiveEdge"), ("-", "NegativeEdge")):
+            events.append(
+                f'        <Event name="s{sensor}{edge}" iotype="input">\n'
+                "            <Triggers>\n"
+                f'                <{trigger} address="{sensor}" />\n'
+                "            </Triggers>\n"
+                "        </Event>\n"
+            )
+    for coil in range(shape.coils):
+        for state, action in (("on", "Set"), ("off", "Clr")):
+            events.append(
+                f'        <Event name="c{coil}_{state}" iotype="output">\n'
+                "            <Actions>\n"
+                f'                <{action} address="{coil}" />\n'
+                "            </Actions>\n"
+                "        </Event>\n"
+            )
+
+    return (
+        '<?xml version="1.0" encoding="ISO-8859-1" standalone="no"?>\n'
+        '<ModbusDevice name="generated">\n'
+        '    <TimeScale value="10" />\n'
+        '    <SampleInterval value="10" />\n'
+        '    <SynchronousWrite value="true" />\n'
+        '    <Role value="master" />\n'
+        '    <SlaveAddress value="localhost:1502" />\n'
+        "    <RemoteImage>\n"
+        f'        <Inputs mbaddr="0" count="{shape.sensors}" />\n'
+        f'        <Outputs mbaddr="0" count="{shape.coils}" />\n'
+        "    </RemoteImage>\n"
+        "    <EventConfiguration>\n"
+        + "".join(events)
+        + "    </EventConfiguration>\n"
+        "</ModbusDevice>\n"
+    )
+
+
+def write(shape: Shape, prefix: Path) -> Tuple[Path, Path]:
+    """Write the files of a net of [shape] as PREFIX.net and PREFIX.dev"""
+    net, device = generate(shape)
+    net_path = prefix.with_name(prefix.name + ".net")
+    device_path = prefix.with_name(prefix.name + ".dev")
+    net_path.write_text(net)
+    device_path.write_text(device)
+    return net_path, device_path
+
+
+def add_shape_arguments(parser: ArgumentParser):
+    """Options setting every field of [Shape] but the number of
+    transitions"""
+    default = Shape()
+    parser.add_argument(
+        "-p",
+        "--places",
+        type=int,
+        help="number of places, as many as transitions by default",
+        default=default.places,
+    )
+    parser.add_argument(
+        "--fan-in",
+        type=int,
+        help="input arcs per transition",
+        default=default.fan_in,
+    )
+    parser.add_argument(
+        "--read-ratio",
+        type=float,
+        help="fraction of the input arcs that are read arcs",
+        default=default.read_ratio,
+    )
+    parser.add_argument(
+        "--inhibitor-ratio",
+        type=float,
+        help="fraction of the input arcs that are inhibitor arcs",
+        default=default.inhibitor_ratio,
+    )
+    parser.add_argument(
+        "--event-density",
+        type=float,
+        help="fraction of the transitions firing on a sensor edge",
+        default=default.event_density,
+    )
+    parser.add_argument(
+        "--sensors",
+        type=int,
+        help="number of inputs, one per 16 transitions of events by default",
+        default=default.sensors,
+    )
+    parser.add_argument(
+        "--coils",
+        type=int,
+        help="number of coils, one per 16 unconditional transitions by"
+        " default",
+        default=default.coils,
+    )
+    parser.add_argument(
+        "--marked",
+        type=float,
+        help="fraction of the places holding a token initially",
+        default=default.marked,
+    )
+    parser.add_argument("--seed", type=int, default=default.seed)
+
+
+def shape_from_args(transitions: int, args) -> Shape:
+    return Shape(
+        transitions,
+        args.places,
+        args.fan_in,
+        args.read_ratio,
+        args.inhibitor_ratio,
+        args.event_density,
+        args.sensors,
+        args.coils,
+        args.marked,
+        args.seed,
+    )
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-t", "--transitions", type=int, default=10_000)
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=Path,
+        help="prefix of the files, written as OUTPUT.net and OUTPUT.dev",
+        default=Path("generated"),
+    )
+    add_shape_arguments(parser)
+    args = parser.parse_args()
+
+    try:
+        net_path, device_path = write(
+            shape_from_args(args.transitions, args), args.output
+        )
+    except ValueError as e:
+        parser.error(str(e))
+    print(f"Wrote {net_path} and {device_path}")
+
+
+if __name__ == "__main__":
+    main()
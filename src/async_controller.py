@@ -0,0 +1,163 @@
+import asyncio
+import time
+from typing import Tuple, Union
+
+from pymodbus.exceptions import ModbusException
+
+from controller import Controller
+from modbus.client import AsyncModbusClient
+
+
+class AsyncController(Controller):
+    """Controller running on the asyncio Modbus client.
+
+    The transitions are fired exactly as in [Controller.loop], only the
+    Modbus transactions differ: all the input ranges are read at the same
+    time, and while a loop reads the inputs the coil writes of the previous
+    loop are still in flight. The read may then miss the effect of those
+    writes, which is seen as an edge on the next loop instead.
+    """
+
+    client: AsyncModbusClient
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        # Coil writes of the last loop, awaited by the next one
+        self.flushing: Union[asyncio.Task, None] = None
+
+    def connect(self, address: Tuple[str, int]) -> AsyncModbusClient:
+        return AsyncModbusClient(address, self.metrics.modbus)
+
+    async def execute(self, request, message: str):
+        """Await a request, converting any failure to ConnectionResetError"""
+        try:
+            response = await request
+            if response.isError():
+                raise ModbusException(str(response))
+        except (ModbusException, asyncio.TimeoutError) as e:
+            raise ConnectionResetError(message) from e
+
+        return response
+
+    async def reconnect_async(self):
+        """[Controller.reconnect] on the asyncio client"""
+        if self.flushing is not None:
+            # The writes in flight are staged again if they failed
+            try:
+                await self.flushing
+            except ConnectionResetError:
+                pass
+            self.flushing = None
+
+        await self.client.reconnect()
+        self.coils_synced = False
+
+    async def read_all_async(self):
+        """
+        Read the values from all available addresses and update
+        [image], with every range in flight at once
+        """
+        responses = await asyncio.gather(
+            *(
+                self.execute(
+                    self.client.read_discrete_inputs(start, count),
+                    "Can't read discrete inputs",
+                )
+                for start, count, _ in self.read_ranges
+            )
+        )
+        image = 0
+        for (_, _, offsets), response in zip(self.read_ranges, responses):
+            image |= self.pack(offsets, response.bits)
+
+        self.update(image)
+        self.record()
+
+    async def flush_async(self):
+        """
+        Send the coil writes staged since the last flush, with every range
+        in flight at once
+        """
+        if not self.coils_synced:
+            ranges = self.coils.sync_ranges(self.coil_count)
+            responses = await asyncio.gather(
+                *(
+                    self.execute(
+                        self.client.read_coils(
+                            self.coils.mbaddr + start, size
+                        ),
+                        "Can't read coils",
+                    )
+                    for start, size in ranges
+                )
+            )
+            for (start, size), response in zip(ranges, responses):
+                self.coils.load(start, response.bits, size)
+            self.coils_synced = True
+
+        # The staged writes are taken now, so the next loop can stage its
+        # own while these are in flight
+        ranges = self.coils.write_ranges()
+        taken = self.coils.take()
+        try:
+            await asyncio.gather(
+                *(
+                    self.execute(
+                        self.client.write_coils(start, values),
+                        "Can't write to coils",
+                    )
+                    for start, values in ranges
+                )
+            )
+        except ConnectionResetError:
+            self.coils.restore(taken)
+            raise
+        self.coils.sent(taken)
+
+    async def loop_async(self) -> bool:
+        """
+        The main loop, see [Controller.loop]
+        """
+
+        # Read the inputs while the writes of the last loop finish. The
+        # time of this phase is accounted as the read, while the write is
+        # only the time needed to start sending the writes
+        start = time.perf_counter()
+        reading = asyncio.ensure_future(self.read_all_async())
+        try:
+            if self.flushing is not None:
+                await self.flushing
+        finally:
+            self.flushing = None
+            await reading
+        read = time.perf_counter()
+
+        # Fire the transitions of the events that happened
+        active = self.evaluate()
+        evaluated = time.perf_counter()
+
+        # Start sending the writes, they are awaited by the next loop
+        self.flushing = asyncio.ensure_future(self.flush_async())
+
+        self.metrics.observe_tick(
+            read - start, evaluated - read, time.perf_counter() - evaluated
+        )
+        self.publish(active)
+
+        return active
+
+    async def __aenter__(self):
+        await self.client.__aenter__()
+        return self
+
+    async def __aexit__(self, *_):
+        try:
+            if self.flushing is not None:
+                await self.flushing
+        finally:
+            self.sync_marking()
+            await self.client.close()
+
+    def __enter__(self):
+        raise TypeError("Use 'async with' with AsyncController")
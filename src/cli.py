@@ -1,11 +1,18 @@
-from argparse import ArgumentParser
+from argparse import ArgumentParser, Namespace
 from pathlib import Path
-from typing import Tuple
+
+from event_log import FORMATS as LOG_FORMATS, LEVELS as LOG_LEVELS
+from journal import SYNC_POLICIES
+from modbus.ranges import DEFAULT_MAX_GAP, MAX_READ_BITS
+from plants import load_manifest
 
 
 DEFAULT_DEVICE_PATH = "./example/example.dev"
 DEFAULT_NETWORK_PATH = "./example/example.net"
 DEFAULT_SLEEP_S = 0.01
+DEFAULT_BACKOFF = 2.0
+DEFAULT_PROFILE_INTERVAL_S = 0.001
+ENGINES = ("python", "numpy")
 
 
 def is_valid_file(
@@ -32,14 +39,22 @@ def build_parser() -> ArgumentParser:
         "--device",
         type=lambda _str: is_valid_file(parser, _str, ".dev"),
         help="path to a device config file",
-        default=DEFAULT_DEVICE_PATH,
+        default=None,
     )
     parser.add_argument(
         "-n",
         "--net",
         type=lambda _str: is_valid_file(parser, _str, ".net"),
         help="path to a Petri net file",
-        default=DEFAULT_NETWORK_PATH,
+        default=None,
+    )
+    parser.add_argument(
+        "-p",
+        "--plants",
+        type=Path,
+        help="run every plant of this JSON manifest from one process,"
+        " instead of the plant of -d and -n",
+        default=None,
     )
     parser.add_argument(
         "-s",
@@ -48,16 +63,235 @@ def build_parser() -> ArgumentParser:
         help="time (in seconds) between FlexFact calls",
         default=DEFAULT_SLEEP_S,
     )
+    parser.add_argument(
+        "--device-period",
+        action="store_true",
+        help="use the SampleInterval of the device file instead of --sleep",
+    )
+    parser.add_argument(
+        "--max-sleep",
+        type=float,
+        help="poll adaptively, slowing down to this period (in seconds)"
+        " while the plant is idle",
+        default=None,
+    )
+    parser.add_argument(
+        "--backoff",
+        type=float,
+        help="factor by which the period grows after each idle call when"
+        " polling adaptively",
+        default=DEFAULT_BACKOFF,
+    )
+    parser.add_argument(
+        "--max-gap",
+        type=int,
+        help="maximum number of unused inputs read to merge two Modbus reads",
+        default=DEFAULT_MAX_GAP,
+    )
+    parser.add_argument(
+        "--max-read",
+        type=int,
+        help="maximum number of inputs read in a single Modbus request",
+        default=MAX_READ_BITS,
+    )
+    parser.add_argument(
+        "-e",
+        "--engine",
+        choices=ENGINES,
+        help="Petri net evaluation engine, numpy requires numpy installed",
+        default=ENGINES[0],
+    )
+    parser.add_argument(
+        "--no-cache",
+        dest="use_cache",
+        action="store_false",
+        help="always parse the net and device files, instead of loading"
+        " them from the cache next to the net",
+    )
+    parser.add_argument(
+        "--table",
+        type=Path,
+        help="evaluate with a lookup table compiled from the net by"
+        " compile_table.py instead of the net itself",
+        default=None,
+    )
+    parser.add_argument(
+        "--time-unit",
+        type=float,
+        help="seconds per time unit of the intervals of the net, by default"
+        " the TimeScale of the device file",
+        default=None,
+    )
+    parser.add_argument(
+        "-a",
+        "--async",
+        dest="use_async",
+        action="store_true",
+        help="use the asyncio Modbus client, keeping several requests in"
+        " flight at once",
+    )
+    parser.add_argument(
+        "--record",
+        type=Path,
+        help="append every input image read to this recording file",
+        default=None,
+    )
+    parser.add_argument(
+        "--replay",
+        type=Path,
+        help="run offline on a recording file instead of FlexFact, as fast"
+        " as possible",
+        default=None,
+    )
+    parser.add_argument(
+        "--journal",
+        type=Path,
+        help="journal the fired transitions to this file, so the marking"
+        " can be restored with --resume",
+        default=None,
+    )
+    parser.add_argument(
+        "--journal-sync",
+        choices=SYNC_POLICIES,
+        help="when the journal is synced to disk: after every loop that"
+        " fired, every second, or when the OS sees fit",
+        default=SYNC_POLICIES[1],
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="start from the marking in the journal instead of the initial"
+        " marking of the net",
+    )
+    parser.add_argument(
+        "--live-view",
+        help="publish the marking, inputs and coils in the shared memory"
+        " segment LIVE_VIEW (followed by '-<plant>' with --plants), for"
+        " monitors such as src/live_view.py",
+        default=None,
+    )
+    parser.add_argument(
+        "--log",
+        type=Path,
+        help="write the operation display to this file instead of stdout",
+        default=None,
+    )
+    parser.add_argument(
+        "--log-format",
+        choices=LOG_FORMATS,
+        help="format of the operation display, binary requires --log",
+        default=LOG_FORMATS[0],
+    )
+    parser.add_argument(
+        "--log-level",
+        choices=("off",) + LOG_LEVELS,
+        help="what the operation display shows: the written events, the"
+        " fired transitions too, or their marking deltas too",
+        default=LOG_LEVELS[1],
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        help="serve Prometheus metrics on http://127.0.0.1:PORT/metrics",
+        default=None,
+    )
+    parser.add_argument(
+        "--metrics-interval",
+        type=float,
+        help="print a metrics snapshot every METRICS_INTERVAL seconds",
+        default=None,
+    )
+
+    parser.add_argument(
+        "--profile",
+        type=Path,
+        help="sample the stacks of the loops and write them to this file as"
+        " folded stacks, for flame graphs",
+        default=None,
+    )
+    parser.add_argument(
+        "--profile-interval",
+        type=float,
+        help="time (in seconds) between two samples of --profile",
+        default=DEFAULT_PROFILE_INTERVAL_S,
+    )
+    parser.add_argument(
+        "--slowest",
+        type=int,
+        help="show the SLOWEST slowest loops on exit, with the time spent"
+        " reading, evaluating and writing",
+        default=None,
+    )
 
     return parser
 
 
-def get_args() -> Tuple[Path, Path, float]:
+def get_args() -> Namespace:
     parser = build_parser()
     args = parser.parse_args()
 
-    device_path = args.device
-    network_path = args.net
-    sleep_period = args.sleep
+    if args.sleep <= 0:
+        parser.error("--sleep should be positive")
+    if args.max_sleep is not None and args.max_sleep < args.sleep:
+        parser.error("--max-sleep should be at least --sleep")
+    if args.time_unit is not None and args.time_unit <= 0:
+        parser.error("--time-unit should be positive")
+    if args.backoff < 1:
+        parser.error("--backoff should be at least 1")
+    if args.replay is not None and not args.replay.is_file():
+        parser.error(f"Invalid recording path '{args.replay}'")
+    if args.replay is not None and args.record is not None:
+        parser.error("--record and --replay can't be used together")
+    if args.replay is not None and args.journal is not None:
+        parser.error("--journal and --replay can't be used together")
+    if args.table is not None and not args.table.is_file():
+        parser.error(f"Invalid lookup table path '{args.table}'")
+    if args.table is not None and args.engine != ENGINES[0]:
+        parser.error("--table and --engine can't be used together")
+    if args.log_format == "binary" and args.log is None:
+        parser.error("--log-format binary requires --log")
+    if args.metrics_interval is not None and args.metrics_interval <= 0:
+        parser.error("--metrics-interval should be positive")
+    if args.profile_interval <= 0:
+        parser.error("--profile-interval should be positive")
+    if args.slowest is not None and args.slowest < 1:
+        parser.error("--slowest should be at least 1")
+    if args.max_gap < 0:
+        parser.error("--max-gap should be positive or zero")
+    if args.live_view is not None and (
+        not args.live_view or "/" in args.live_view
+    ):
+        parser.error("--live-view should be a name, without '/'")
+    if not 1 <= args.max_read <= MAX_READ_BITS:
+        parser.error(f"--max-read should be between 1 and {MAX_READ_BITS}")
+
+    # The default files are only checked when they are used, so a manifest
+    # can be run from anywhere
+    if args.plants is None:
+        if args.device is None:
+            args.device = is_valid_file(parser, DEFAULT_DEVICE_PATH, ".dev")
+        if args.net is None:
+            args.net = is_valid_file(parser, DEFAULT_NETWORK_PATH, ".net")
+
+    # The lookup table, the recording and the journal are set per plant in
+    # the manifest
+    if args.plants is not None:
+        for option in ("table", "record", "replay", "journal"):
+            if getattr(args, option) is not None:
+                parser.error(f"--plants and --{option} can't be used together")
+        try:
+            args.plants = load_manifest(args.plants)
+        except (OSError, ValueError) as e:
+            parser.error(f"Invalid plants manifest: {e}")
+        if args.engine != ENGINES[0] and any(
+            plant.table is not None for plant in args.plants
+        ):
+            parser.error("Lookup tables and --engine can't be used together")
+        if args.resume and all(
+            plant.journal is None for plant in args.plants
+        ):
+            parser.error("--resume requires journals in the manifest")
+    elif args.resume and args.journal is None:
+        parser.error("--resume requires --journal")
 
-    return device_path, network_path, sleep_period
+    return args
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+from argparse import ArgumentParser
+from pathlib import Path
+
+import cli
+from lookup_table import DEFAULT_MAX_STATES, compile_table
+from parsers import device, network
+
+
+def build_parser() -> ArgumentParser:
+    parser = ArgumentParser(
+        prog="compile_table",
+        description="Compile a bounded net into a lookup table of its"
+        " reactions to the edges of its inputs, see the --table option of the"
+        " controller.",
+    )
+
+    parser.add_argument(
+        "-d",
+        "--device",
+        type=lambda _str: cli.is_valid_file(parser, _str, ".dev"),
+        help="path to a device config file",
+        default=cli.DEFAULT_DEVICE_PATH,
+    )
+    parser.add_argument(
+        "-n",
+        "--net",
+        type=lambda _str: cli.is_valid_file(parser, _str, ".net"),
+        help="path to a petri net file",
+        default=cli.DEFAULT_NETWORK_PATH,
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=Path,
+        help="table file to write, by default the net path with .tab",
+        default=None,
+    )
+    parser.add_argument(
+        "-m",
+        "--max-states",
+        type=int,
+        help="give up after this many markings",
+        default=DEFAULT_MAX_STATES,
+    )
+
+    return parser
+
+
+def main():
+    args = build_parser().parse_args()
+
+    petri_network = network.parse(args.net)
+    _, inputs, outputs, _, _ = device.parse(args.device)
+    try:
+        table = compile_table(
+            petri_network, inputs, outputs, args.max_states
+        )
+    except ValueError as e:
+        print(f"Can't compile {args.net}: {e}")
+        raise SystemExit(1)
+
+    output = args.output or args.net.with_suffix(".tab")
+    try:
+        table.save(output)
+    except ValueError as e:
+        print(f"Can't save {output}: {e}")
+        raise SystemExit(1)
+    print(
+        f"Wrote {output}: {len(table.markings)} markings,"
+        f" {len(table.steps)} steps"
+    )
+
+
+if __name__ == "__main__":
+    main()
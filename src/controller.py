@@ -1,10 +1,52 @@
-from typing import Dict, Tuple
+import time
+from heapq import heapify, heappop, heappush
+from typing import TYPE_CHECKING, Dict, List, Tuple, Union
 from pymodbus.exceptions import ModbusException
 
-from parsers.device import InputEvent, OutputEvent
+from parsers.device import (
+    InputEvent,
+    OutputEvent,
+    RemoteImage,
+    Trigger,
+    TriggerTypes,
+)
 from modbus.client import ModbusClient
+from modbus.image import CoilImage
+from modbus.ranges import DEFAULT_MAX_GAP, MAX_READ_BITS, coalesce
+from event_log import LogWriter
+from journal import Journal
+from live_view import LiveView
+from lookup_table import (
+    MAX_SETTLE_FIRINGS,
+    SETTLE,
+    LookupTable,
+    parse_edge_name,
+)
+from metrics import Metrics
+from recording import InputRecorder
+from timers import DEFAULT_TIME_UNIT_S, Timers
 from petri_net import PetriNet
-from special_tokens import strip_name, COMMENT
+from transition_index import TransitionIndex
+
+if TYPE_CHECKING:
+    from petri_matrix import MatrixPetriNet
+
+
+def edge_masks(
+    triggers: List[Trigger], bits: Dict[int, int]
+) -> Tuple[int, int]:
+    """Masks of the rising and falling edges of the input image that
+    trigger an event, [bits] being the mask of each address"""
+    rising = 0
+    falling = 0
+    for trigger in triggers:
+        if trigger.type == TriggerTypes.POSITIVE_EDGE:
+            rising |= bits[trigger.address]
+        elif trigger.type == TriggerTypes.NEGATIVE_EDGE:
+            falling |= bits[trigger.address]
+        else:
+            raise ValueError(f"Invalid trigger type: {trigger.type}")
+    return rising, falling
 
 
 class Controller:
@@ -14,11 +56,70 @@ class Controller:
         petri_network: PetriNet,
         inputs: Dict[str, InputEvent],
         outputs: Dict[str, OutputEvent],
+        remote_image: Union[RemoteImage, None] = None,
+        max_gap: int = DEFAULT_MAX_GAP,
+        max_count: int = MAX_READ_BITS,
+        engine: Union["MatrixPetriNet", None] = None,
+        metrics: Union[Metrics, None] = None,
+        recorder: Union[InputRecorder, None] = None,
+        table: Union[LookupTable, None] = None,
+        index: Union[TransitionIndex, None] = None,
+        log: Union[LogWriter, None] = None,
+        journal: Union[Journal, None] = None,
+        time_unit: float = DEFAULT_TIME_UNIT_S,
+        live: Union[LiveView, None] = None,
     ):
-        self.client = ModbusClient(address)
+        # Metrics are usually given, so they outlive the controller
+        self.metrics = (
+            metrics
+            if metrics is not None
+            else Metrics([t.name for t in petri_network.transitions])
+        )
+        self.client = self.connect(address)
         self.petri_network = petri_network
         self.inputs = inputs
         self.outputs = outputs
+        self.remote_image = remote_image
+
+        # The index may come from the cache, possibly used by an earlier
+        # controller, so every unconditional transition is checked first
+        if index is not None:
+            index.invalidate()
+            self.index = index
+        else:
+            self.index = TransitionIndex(petri_network, inputs, outputs)
+
+        # Enabling clocks of the timed transitions, if the net has any
+        timers = Timers(petri_network, self.index, time_unit)
+        self.timers = timers if timers.bounds else None
+
+        # Optional vectorized engine, checking the arcs of a transition in
+        # one go instead of one by one
+        self.engine = engine
+
+        # Optional log of every input image read
+        self.recorder = recorder
+
+        # Optional log of the fired transitions and written events. It is
+        # buffered, so the loop never waits on the terminal
+        self.log = log
+
+        # Optional journal of the fired transitions, so the marking can be
+        # restored after the process dies
+        self.journal = journal
+
+        # Optional live view of the state for monitors, published at the
+        # end of each loop
+        self.live = live
+
+        # Shown before the warnings of the controller when it has no log, to
+        # tell the plants apart when several run in the same process
+        self.prefix = ""
+
+        # Optional table of precomputed steps, replacing the evaluation of
+        # the net. The marking is then only kept as an id in the table, and
+        # copied back to the net on exit
+        self.table = table
 
         # Get all the addresses. These addresses appear more than once in the
         # .net file so use a set to avoid repeats
@@ -30,14 +131,153 @@ class Controller:
             ]
         )
 
-        # Intantiate the read values to false. This is needed because we use
-        # rising and falling edges. While it would be possible to use the
-        # direct values, this misses the point because tina is supposed
-        # to be for *event* oriented programming. This uses a tuple
-        # because it stores the current and previous value
-        self.read_values = {
-            address: (False, False) for address in self.addresses
+        # The input image is kept as a bitset, one bit per address in
+        # order, starting with every value to false. This is needed because
+        # we use rising and falling edges. While it would be possible to use
+        # the direct values, this misses the point because tina is supposed
+        # to be for *event* oriented programming. The edges of the last read
+        # are kept as bitsets too, so all of them are found in one go
+        self.image_addresses = sorted(self.addresses)
+        self.bits = {
+            address: 1 << i for i, address in enumerate(self.image_addresses)
+        }
+        self.image = 0
+        self.rising = 0
+        self.falling = 0
+
+        # Transitions that may fire on an edge of each bit, and the edges
+        # triggering each transition, None for unconditional ones
+        self.by_bit = [
+            self.index.by_address.get(address, ())
+            for address in self.image_addresses
+        ]
+        self.edge_masks = [
+            edge_masks(triggers, self.bits) if triggers is not None else None
+            for triggers in self.index.triggers
+        ]
+        if table is not None:
+            self.use_table(table)
+
+        # Group the addresses into as few Modbus requests as possible,
+        # once, so each loop reads the whole input image in about one
+        # round-trip. Each range keeps the (bit offset, mask in the image)
+        # pairs it is responsible for
+        self.modbus_addresses = {
+            address: (
+                remote_image.inputs.to_modbus(address)
+                if remote_image is not None
+                else address
+            )
+            for address in self.addresses
         }
+        self.read_ranges: List[Tuple[int, int, List[Tuple[int, int]]]] = [
+            (
+                start,
+                count,
+                [
+                    (
+                        self.modbus_addresses[address] - start,
+                        self.bits[address],
+                    )
+                    for address in sorted(self.addresses)
+                    if start <= self.modbus_addresses[address] < start + count
+                ],
+            )
+            for start, count in coalesce(
+                self.modbus_addresses.values(), max_gap, max_count
+            )
+        ]
+
+        # Coil writes are staged during a loop and flushed once at its end,
+        # starting from the values currently on the bus when they are known.
+        # These are read before the first flush
+        self.coils = CoilImage(
+            remote_image.outputs.mbaddr if remote_image is not None else 0
+        )
+        self.coil_count = (
+            remote_image.outputs.count if remote_image is not None else 0
+        )
+        self.coils_synced = False
+
+        # Whether unconditional transitions kept firing until the end of
+        # the last loop, see [evaluate], and whether it fired anything
+        self.livelocked = False
+        self.fired = False
+
+        # Monitors see the marking the controller starts from
+        self.publish(True)
+
+    def use_table(self, table: LookupTable):
+        if self.timers is not None:
+            raise ValueError("Lookup tables don't handle timed transitions")
+        table.check(self.petri_network, self.index, self.outputs)
+
+        # Edges of the image the table reacts to, and the ones that may
+        # happen on each bit of the image
+        self.table_masks = []
+        for name in table.edges:
+            address, rising = parse_edge_name(name)
+            if address not in self.bits:
+                raise ValueError(
+                    f"Input {address} of the table isn't in the device"
+                )
+            mask = self.bits[address]
+            self.table_masks.append((mask, 0) if rising else (0, mask))
+        self.table_by_bit = [
+            [
+                edge
+                for edge, (rising, falling) in enumerate(self.table_masks)
+                if (rising | falling) & mask
+            ]
+            for mask in self.bits.values()
+        ]
+
+        self.state = table.find(self.petri_network.get_marking())
+        if self.state is None:
+            raise ValueError("The marking of the net isn't in the table")
+        self.settled = False
+
+    def marking(self) -> List[int]:
+        """Current marking, in the order of the places of the net"""
+        if self.table is None:
+            return self.petri_network.get_marking()
+        tokens = dict(
+            zip(self.table.place_names, self.table.markings[self.state])
+        )
+        return [tokens[place.name] for place in self.petri_network.places]
+
+    def sync_marking(self):
+        """Copy the marking of the table back to the places of the net"""
+        if self.table is None:
+            return
+        marking = self.table.markings[self.state]
+        for place_name, tokens in zip(self.table.place_names, marking):
+            self.petri_network.get_place(place_name).tokens = tokens
+
+    def clock(self) -> float:
+        """Time of the clocks of the timed transitions, in seconds"""
+        return time.perf_counter()
+
+    def next_deadline(self) -> Union[float, None]:
+        """[clock] time at which a timed transition is due to fire, if
+        any, so the next loop can run right then"""
+        if self.timers is None:
+            return None
+        return self.timers.next_deadline()
+
+    def connect(self, address: Tuple[str, int]) -> ModbusClient:
+        return ModbusClient(address, self.metrics.modbus)
+
+    def reconnect(self):
+        """
+        Connect again after the connection was reset. Everything else is
+        kept: the marking, the input image, so the next read only shows
+        the edges that really happened meanwhile, and the coil writes that
+        weren't sent, which are sent once the coils are read again (the
+        slave may have been restarted)
+        """
+        self.client.reconnect()
+        self.coils_synced = False
 
     def read(self, event: str) -> bool:
         """
@@ -50,7 +290,9 @@ class Controller:
         result = False
         for trigger in self.inputs[event].triggers:
             try:
-                readval = self.client.read_discrete_inputs(trigger.address)
+                readval = self.client.read_discrete_inputs(
+                    self.modbus_addresses[trigger.address]
+                )
                 result = result or readval.bits[0]
             except ModbusException as e:
                 raise ConnectionResetError("Can't read discrete input") from e
@@ -59,69 +301,296 @@ class Controller:
 
     def write(self, event: str):
         """
-        Write an event to the bus to trigger eg. a belt
+        Write an event to the bus to trigger eg. a belt. The actions are
+        only staged, see [flush]
         """
-        print(f"  e: {event}")
-        for action in self.outputs[event].actions:
-            try:
-                self.client.write_coil(*action)
-            except ModbusException as e:
-                raise ConnectionResetError("Can't write to coils") from e
+        for address, value in self.outputs[event].actions:
+            self.coils.stage(address, value)
+
+    def flush(self):
+        """
+        Send the coil writes staged since the last flush, in as few
+        requests as possible
+        """
+        if not self.coils_synced:
+            self.coils.sync(self.client, self.coil_count)
+            self.coils_synced = True
+
+        self.coils.flush(self.client)
 
     def read_all(self):
         """
-        Read the values from all available addresses and update [read_values]
+        Read the values from all available addresses and update [image]
         """
-        for address in self.addresses:
+        image = 0
+        for start, count, offsets in self.read_ranges:
             try:
-                input_vals = self.client.read_discrete_inputs(address)
-                self.read_values[address] = (
-                    self.read_values[address][1],
-                    input_vals.bits[0],
-                )
+                response = self.client.read_discrete_inputs(start, count)
+                if response.isError():
+                    raise ModbusException(str(response))
             except ModbusException as e:
                 raise ConnectionResetError("Can't read discrete inputs") from e
 
-    def loop(self):
+            image |= self.pack(offsets, response.bits)
+
+        self.update(image)
+        self.record()
+
+    def record(self):
+        """Append the input image to the recording, if any"""
+        if self.recorder is not None:
+            self.recorder.append(time.time(), self.image)
+
+    def pack(self, offsets: List[Tuple[int, int]], bits: List[bool]) -> int:
+        """Bits of the image read for one of the ranges"""
+        image = 0
+        for offset, mask in offsets:
+            if bits[offset]:
+                image |= mask
+        return image
+
+    def update(self, image: int):
+        """Replace the input image, computing its edges from the last one"""
+        changed = self.image ^ image
+        self.rising = changed & image
+        self.falling = changed & self.image
+        self.image = image
+
+    @property
+    def read_values(self) -> Dict[int, Tuple[bool, bool]]:
+        """(previous, current) value of each address, from the bitsets"""
+        previous = self.image ^ self.rising ^ self.falling
+        return {
+            address: (bool(previous & mask), bool(self.image & mask))
+            for address, mask in self.bits.items()
+        }
+
+    def loop(self) -> bool:
         """
-        The main loop. I ran this every 10ms
+        The main loop. I ran this every 10ms. Returns whether there was any
+        activity (an edge or a transition fired)
         """
 
         # Update the read values
+        start = time.perf_counter()
         self.read_all()
+        read = time.perf_counter()
+
+        # Fire the transitions of the events that happened
+        active = self.evaluate()
+        evaluated = time.perf_counter()
+
+        # Send all the writes issued by the fired transitions
+        self.flush()
+        flushed = time.perf_counter()
+
+        self.metrics.observe_tick(
+            read - start, evaluated - read, flushed - evaluated
+        )
+        self.publish(active)
+
+        return active
+
+    def publish(self, active: bool):
+        """Publish the state to the live view, if any. Without activity
+        nothing changed but the loop number"""
+        if self.live is None:
+            return
+        if active:
+            self.live.publish(
+                self.metrics.ticks, self.image, self.marking(), self.coils
+            )
+        else:
+            self.live.publish(self.metrics.ticks, self.image)
+
+    def edges(self) -> List[int]:
+        """Bits of the image that changed on the last read, in order."""
+        changed = self.rising | self.falling
+        edges = []
+        while changed:
+            low = changed & -changed
+            edges.append(low.bit_length() - 1)
+            changed ^= low
+        return edges
+
+    def evaluate(self) -> bool:
+        """
+        Fire the transitions enabled by the last read values, writing
+        the events of the fired transitions. Returns whether there was any
+        activity (an edge or a transition fired)
+        """
+        if self.table is not None:
+            return self.evaluate_table()
+
+        # Only look at the transitions of the events that may have happened
+        # (ie. a sensor has just turn on or off) and at the unconditional
+        # transitions whose places changed since they were last checked
+        index = self.index
+        candidates = set(index.pending)
+        edges = self.edges()
+
+        # Timed transitions can only fire within their interval, and the
+        # unconditional ones that reached it are checked
+        timers = self.timers
+        timed = {}
+        now = 0.0
+        if timers is not None:
+            now = self.clock()
+            if not timers.started:
+                timers.start(now)
+            timed = timers.bounds
+            candidates.update(timers.due(now))
+        for bit in edges:
+            candidates.update(self.by_bit[bit])
+        index.pending = set()
+
+        # Go through the candidates in the order of the net file, as if
+        # every transition was checked. [candidates] holds the ones still in
+        # the queue
+        queue = list(candidates)
+        heapify(queue)
+        settle_firings = 0
+        transitions = self.petri_network.transitions
+        edge_masks = self.edge_masks
+        rising = self.rising
+        falling = self.falling
+        engine = self.engine
+        fired = False
+        checks = self.metrics.checks
+        fired_counts = self.metrics.fired
+        log = self.log
+        journal = self.journal
+        tick = self.metrics.ticks
+        while queue:
+            i = heappop(queue)
+            candidates.discard(i)
+            transition = transitions[i]
+
+            # Check if the signal is rising or falling, or vice-versa
+            masks = edge_masks[i]
+            if masks is not None and not (
+                rising & masks[0] or falling & masks[1]
+            ):
+                continue
+
+            # Unconditional transitions that fired that many times in one
+            # loop likely fire forever, the rest of them is left to the next
+            # loop so the inputs are still read
+            if masks is None and settle_firings >= MAX_SETTLE_FIRINGS:
+                index.pending.add(i)
+                continue
+
+            if i in timed and not timers.can_fire(i, now):
+                continue
+
+            # If an event has occured, tries to fire the transition. The
+            # engine only checks the arcs of the candidate, the enabling of
+            # the whole net would be computed again after every firing
+            checks[i] += 1
+            if engine is not None:
+                if not engine.try_fire(i):
+                    continue
+            elif not transition.try_fire():
+                continue
+
+            if log is not None:
+                log.fired(tick, i)
+            if journal is not None:
+                journal.fired(i)
+            if timers is not None:
+                timers.fired(i, now)
+            fired = True
+            fired_counts[i] += 1
+
+            # Issue the commands via Modbus
+            for event in index.events[i]:
+                self.write(event)
 
-        # Iterate through all the transitions in a network
-        for transition in self.petri_network.transitions:
-            # Check if the FlexFact requirements are met (ie. if a sensor has
-            # just turn on or off). Adding ; to the start of a name means it
-            # is ignored and the transition is allowed
-            name = strip_name(transition.name)
-            if not transition.name.startswith(COMMENT) and name in self.inputs:
-                # Check if the signal is rising or falling, or vice-versa
-                did_transition = False
-                for trigger in self.inputs[name].triggers:
-                    # Should it be rising or falling to transition
-                    if trigger.check(*self.read_values[trigger.address]):
-                        did_transition = True
-                        break
+            # Unconditional transitions affected by the firing are checked
+            # again in this loop, even the ones before it in the net, so a
+            # whole cascade fires at once. When several are enabled the
+            # first one in the net fires first. An unconditional transition
+            # that fired may still be enabled, so it is checked again too
+            dependents = index.dependents[i]
+            if masks is None:
+                settle_firings += 1
+                dependents = [i, *dependents]
+            for j in dependents:
+                if j not in candidates:
+                    candidates.add(j)
+                    heappush(queue, j)
+
+        # Warn once when it starts, not on every loop
+        livelocked = settle_firings >= MAX_SETTLE_FIRINGS
+        if livelocked and not self.livelocked:
+            if log is not None:
+                log.livelock(tick, settle_firings)
             else:
-                did_transition = True
+                print(
+                    f"{self.prefix}Warning: unconditional transitions fired"
+                    f" {settle_firings} times in one loop, the rest is left"
+                    " to the next loops"
+                )
+        self.livelocked = livelocked
+
+        if journal is not None:
+            journal.commit(self.marking)
+
+        self.fired = fired
+        return fired or len(edges) > 0
+
+    def evaluate_table(self) -> bool:
+        """
+        [evaluate] with a lookup table: each edge of the image is a single
+        step in the table, in the order of the edges of the table
+        """
+        candidates = set()
+        edges = self.edges()
+        for bit in edges:
+            candidates.update(self.table_by_bit[bit])
+
+        # Only the initial marking may need to settle first
+        steps = [] if self.settled else [SETTLE]
+        self.settled = True
+        rising = self.rising
+        falling = self.falling
+        steps += [
+            edge
+            for edge in sorted(candidates)
+            if rising & self.table_masks[edge][0]
+            or falling & self.table_masks[edge][1]
+        ]
+
+        fired_counts = self.metrics.fired
+        log = self.log
+        journal = self.journal
+        tick = self.metrics.ticks
+        fired = False
+        for edge in steps:
+            step = self.table.steps.get((self.state, edge))
+            if step is None:
+                continue
+
+            self.state, fired_transitions, written = step
+            for i in fired_transitions:
+                if log is not None:
+                    log.fired(tick, i)
+                if journal is not None:
+                    journal.fired(i)
+                fired_counts[i] += 1
+            for output in written:
+                self.write(self.table.outputs[output])
+            fired = True
 
-            # If an event has occured, tries to fire the transition
-            if did_transition and transition.try_fire():
-                print(f"  t: {transition.name}")
+        if journal is not None:
+            journal.commit(self.marking)
 
-                # Issue the commands via Modbus. Note that ; is also used to
-                # separate between command in the name, so you can use less
-                # places. This hasn't been tested much
-                if strip_name(transition.name) in self.outputs:
-                    values = transition.name.split(COMMENT)
-                    if values[0]:
-                        for v in values:
-                            self.write(strip_name(v))
+        self.fired = fired
+        return fired or len(edges) > 0
 
     def __enter__(self):
         return self
 
     def __exit__(self, *_):
+        self.sync_marking()
         self.client.close()
@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+"""Event log of the controllers: the fired transitions, with the events
+they write and their marking delta, the coil writes when replaying, and
+the warnings of the loops.
+
+The controllers only append tuples to an in-memory buffer, written to a
+file or stdout by a background thread, so a loop never waits on the
+terminal or a pipe. When the buffer is full records are dropped, and
+counted, rather than blocking.
+
+Binary logs are converted to text or JSON lines with
+python src/event_log.py run.evl [-f FORMAT] [-l LEVEL]
+"""
+import json
+import struct
+import sys
+import threading
+import time
+from argparse import ArgumentParser
+from collections import deque
+from pathlib import Path
+from typing import IO, Deque, Dict, Iterator, List, Tuple, Union
+
+from petri_net import InputArcTypes, PetriNet, Transition
+from transition_index import TransitionIndex
+
+
+FORMATS = ("text", "jsonl", "binary")
+
+# Each level shows what the previous ones show. events: the events written
+# to the plant, transitions: the fired transitions and coil writes too (the
+# operation display), marking: the marking delta of each firing too
+LEVELS = ("events", "transitions", "marking")
+
+DEFAULT_CAPACITY = 1 << 16
+DRAIN_PERIOD_S = 0.02
+
+# Kinds of records. A livelock is a loop that stopped firing unconditional
+# transitions after too many of them, shown at every level
+FIRED = 0
+COIL = 1
+LIVELOCK = 2
+
+# (kind, channel, time, tick, transition, coil address or number of
+# firings, coil value)
+Record = Tuple[int, int, float, int, int, bool]
+
+# Binary logs start with a JSON header describing the channels, followed by
+# fixed size records
+MAGIC = b"FTEVL"
+VERSION = 2
+HEADER = struct.Struct("<5sBI")
+RECORD = struct.Struct("<BHdIIB")
+
+
+def marking_delta(transition: Transition) -> List[Tuple[str, int]]:
+    """(place, change in tokens) of each place a transition changes."""
+    delta: Dict[str, int] = {}
+    for arc in transition.input_arcs:
+        if arc.type == InputArcTypes.REGULAR:
+            delta[arc.place.name] = delta.get(arc.place.name, 0) - arc.weight
+    for arc in transition.output_arcs:
+        delta[arc.place.name] = delta.get(arc.place.name, 0) + arc.weight
+    return [(place, change) for place, change in delta.items() if change]
+
+
+class Channel:
+    """What is needed to show the records of a controller: its name and,
+    for each transition, its name, the events it writes and its marking
+    delta. Records only hold the number of the transition."""
+
+    def __init__(
+        self,
+        name: str,
+        transitions: List[str],
+        events: List[List[str]],
+        deltas: List[List[Tuple[str, int]]],
+    ):
+        self.name = name
+        self.prefix = f"[{name}]" if name else ""
+        self.transitions = transitions
+        self.events = events
+        self.deltas = deltas
+
+    @classmethod
+    def from_net(
+        cls, name: str, petri_network: PetriNet, index: TransitionIndex
+    ) -> "Channel":
+        return cls(
+            name,
+            [t.name for t in petri_network.transitions],
+            index.events,
+            [marking_delta(t) for t in petri_network.transitions],
+        )
+
+    def describe(self) -> Dict:
+        return {
+            "name": self.name,
+            "transitions": self.transitions,
+            "events": self.events,
+            "deltas": self.deltas,
+        }
+
+
+class LogWriter:
+    """Handle on an [EventLog] given to a controller, appending the
+    records of its channel."""
+
+    def __init__(self, log: "EventLog", channel: int):
+        self.append = log.append
+        self.channel = channel
+
+    def fired(self, tick: int, transition: int):
+        self.append(
+            (FIRED, self.channel, time.time(), tick, transition, False)
+        )
+
+    def coil(self, tick: int, address: int, value: bool):
+        self.append((COIL, self.channel, time.time(), tick, address, value))
+
+    def livelock(self, tick: int, firings: int):
+        self.append(
+            (LIVELOCK, self.channel, time.time(), tick, firings, False)
+        )
+
+
+class EventLog:
+    """Buffered log of the records of one or more channels (plants),
+    written in the given format by a background thread. Channels are added
+    before calling [start], and [close] writes what is left."""
+
+    def __init__(
+        self,
+        file: Union[IO, None] = None,
+        format: str = FORMATS[0],
+        level: str = LEVELS[1],
+        capacity: int = DEFAULT_CAPACITY,
+    ):
+        if format not in FORMATS:
+            raise ValueError(f"Invalid log format: {format}")
+        if level not in LEVELS:
+            raise ValueError(f"Invalid log level: {level}")
+
+        self.file = file if file is not None else sys.stdout
+        self.format = format
+        self.level = LEVELS.index(level)
+        self.capacity = capacity
+        self.channels: List[Channel] = []
+
+        # Appending to and popping from a deque are thread safe, the lock
+        # only keeps the writes of the thread and of [flush] in order
+        self._buffer: Deque[Record] = deque()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Union[threading.Thread, None] = None
+
+        # Records lost because the buffer was full
+        self.dropped = 0
+
+    def add_channel(
+        self, name: str, petri_network: PetriNet, index: TransitionIndex
+    ) -> LogWriter:
+        if self._thread is not None:
+            raise ValueError("Channels must be added before starting")
+        self.channels.append(Channel.from_net(name, petri_network, index))
+        return LogWriter(self, len(self.channels) - 1)
+
+    def append(self, record: Record):
+        """Buffer a record, never blocking."""
+        if len(self._buffer) >= self.capacity:
+            self.dropped += 1
+            return
+        self._buffer.append(record)
+
+    def start(self):
+        if self.format == "binary":
+            header = json.dumps(
+                {"channels": [c.describe() for c in self.channels]}
+            ).encode()
+            self.file.write(HEADER.pack(MAGIC, VERSION, len(header)))
+            self.file.write(header)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(DRAIN_PERIOD_S):
+            self.flush()
+
+    def flush(self):
+        """Write the buffered records now, eg. before a summary."""
+        with self._lock:
+            buffer = self._buffer
+            records = []
+            while buffer:
+                records.append(buffer.popleft())
+            if not records:
+                return
+
+            if self.format == "binary":
+                self.file.write(
+                    b"".join(RECORD.pack(*record) for record in records)
+                )
+            else:
+                lines = []
+                for record in records:
+                    lines.extend(self.render(record))
+                if lines:
+                    self.file.write("\n".join(lines) + "\n")
+            self.file.flush()
+
+    def render(self, record: Record) -> List[str]:
+        """Lines of a record in the text or jsonl format, none if its level
+        isn't shown."""
+        kind, channel_id, at, tick, item, value = record
+        channel = self.channels[channel_id]
+        if kind == COIL and self.level < 1:
+            return []
+        if kind == FIRED and self.level < 1 and not channel.events[item]:
+            return []
+
+        if self.format == "jsonl":
+            entry: Dict = {"time": at, "tick": tick}
+            if channel.name:
+                entry["plant"] = channel.name
+            if kind == LIVELOCK:
+                entry["warning"] = "livelock"
+                entry["firings"] = item
+            elif kind == COIL:
+                entry["coil"] = item
+                entry["value"] = int(value)
+            else:
+                entry["transition"] = channel.transitions[item]
+                entry["events"] = channel.events[item]
+                if self.level >= 2:
+                    entry["delta"] = dict(channel.deltas[item])
+            return [json.dumps(entry)]
+
+        prefix = channel.prefix
+        if kind == LIVELOCK:
+            warning = (
+                f"Warning: unconditional transitions fired {item} times in"
+                " one loop, the rest is left to the next loops"
+            )
+            return [f"{prefix} {warning}" if prefix else warning]
+        if kind == COIL:
+            return [f"{prefix}  c: {item} = {int(value)}"]
+        lines = []
+        if self.level >= 1:
+            lines.append(f"{prefix}  t: {channel.transitions[item]}")
+        lines.extend(f"{prefix}  e: {event}" for event in channel.events[item])
+        if self.level >= 2:
+            lines.extend(
+                f"{prefix}    {place} {change:+d}"
+                for place, change in channel.deltas[item]
+            )
+        return lines
+
+    def close(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        self.flush()
+        if self.dropped:
+            print(
+                f"Warning: {self.dropped} log records were dropped, the log"
+                " couldn't keep up"
+            )
+
+
+def read(filepath: Union[Path, str]) -> Tuple[List[Channel], Iterator[Record]]:
+    """Channels and records of a binary log. A partial record at the end,
+    as left by a crash, is ignored."""
+    file = open(filepath, "rb")
+    raw = file.read(HEADER.size)
+    if len(raw) < HEADER.size:
+        file.close()
+        raise ValueError("Truncated event log header")
+    magic, version, size = HEADER.unpack(raw)
+    if magic != MAGIC:
+        file.close()
+        raise ValueError("Not a binary event log")
+    if version != VERSION:
+        file.close()
+        raise ValueError(f"Unsupported event log version {version}")
+
+    header = json.loads(file.read(size))
+    channels = [
+        Channel(
+            c["name"],
+            c["transitions"],
+            c["events"],
+            [[tuple(d) for d in deltas] for deltas in c["deltas"]],
+        )
+        for c in header["channels"]
+    ]
+
+    def records() -> Iterator[Record]:
+        with file:
+            while True:
+                raw = file.read(RECORD.size)
+                if len(raw) < RECORD.size:
+                    return
+                yield RECORD.unpack(raw)
+
+    return channels, records()
+
+
+def main():
+    parser = ArgumentParser(
+        description="Convert a binary event log to text or JSON lines."
+    )
+    parser.add_argument("log", type=Path, help="path to a binary event log")
+    parser.add_argument(
+        "-f", "--format", choices=FORMATS[:2], default=FORMATS[0]
+    )
+    parser.add_argument(
+        "-l", "--level", choices=LEVELS, default=LEVELS[-1]
+    )
+    args = parser.parse_args()
+
+    try:
+        channels, records = read(args.log)
+    except (OSError, ValueError) as e:
+        parser.error(f"Can't read {args.log}: {e}")
+
+    log = EventLog(sys.stdout, args.format, args.level)
+    log.channels = channels
+    for record in records:
+        for line in log.render(record):
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+import asyncio
+from argparse import ArgumentParser, Namespace
+from typing import List
+
+import cli
+from modbus.server import FlexFactStandIn, parse_script
+
+
+def build_parser() -> ArgumentParser:
+    parser = ArgumentParser(
+        prog="flexfact_standin",
+        description="A local Modbus slave standing in for FlexFact, to run"
+        " the controller without the simulator.",
+    )
+
+    parser.add_argument(
+        "-d",
+        "--device",
+        type=lambda _str: cli.is_valid_file(parser, _str, ".dev"),
+        help="path to a device config file",
+        default=cli.DEFAULT_DEVICE_PATH,
+    )
+    parser.add_argument(
+        "-s",
+        "--script",
+        help="file of sensor edges to replay, one '<time in seconds>"
+        " <event or address=value>' per line",
+        default=None,
+    )
+    parser.add_argument(
+        "--host",
+        help="interface to listen on, by default the device SlaveAddress",
+        default=None,
+    )
+    parser.add_argument(
+        "-p",
+        "--port",
+        type=int,
+        help="port to listen on, by default the device SlaveAddress",
+        default=None,
+    )
+
+    return parser
+
+
+def print_coil_write(standin: FlexFactStandIn):
+    def on_coil_write(_: float, address: int, values: List[bool]):
+        for offset, value in enumerate(values):
+            print(f"  c: {address + offset} = {int(value)}")
+
+    standin.on_coil_write = on_coil_write
+
+
+async def run(args: Namespace):
+    standin = FlexFactStandIn.from_device(args.device)
+    host, port = standin.address
+    standin.address = (
+        args.host if args.host is not None else host,
+        args.port if args.port is not None else port,
+    )
+    print_coil_write(standin)
+
+    serving = asyncio.ensure_future(standin.serve())
+    await standin.started()
+    print(f"Standing in for FlexFact at {standin.address}")
+
+    if args.script is not None:
+        await standin.replay(parse_script(args.script))
+        print("Script replayed")
+
+    await serving
+
+
+def main():
+    args = build_parser().parse_args()
+    try:
+        asyncio.run(run(args))
+    except KeyboardInterrupt:
+        print("")
+        print("Stopping stand-in...")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+"""Append-only journal of the firings of a controller, so the marking of
+the net survives the process and can be restored with --resume.
+
+A journal file is a snapshot of the marking followed by the transitions
+fired since, by number. The firings of a loop are written at its end in a
+single write, and every [SNAPSHOT_FIRINGS] firings the file is replaced by
+a new snapshot, so restoring never fires more than that many transitions
+whatever the length of the run. Snapshots are written by a background
+thread, the loop never waits for them.
+"""
+import hashlib
+import os
+import struct
+import threading
+from array import array
+from pathlib import Path
+from typing import Callable, List, Tuple, Union
+
+from petri_net import PetriNet
+
+
+MAGIC = b"FTJNL"
+VERSION = 1
+
+# Magic, version, digest of the place and transition names, then the number
+# of places
+HEADER = struct.Struct("<5sB32sI")
+
+# Number of places holding tokens in the snapshot, followed by their
+# numbers and tokens
+SNAPSHOT = struct.Struct("<I")
+FIRING = struct.Struct("<I")
+
+# When the journal is synced to disk: after every loop that fired (the
+# firings are on disk before the coils are written), every
+# [SYNC_PERIOD_S] by a background thread, or when the OS sees fit. The
+# firings are written to the file at the end of every loop in any case, so
+# only a crash of the host, not of the process, can lose them
+SYNC_POLICIES = ("always", "periodic", "never")
+SYNC_PERIOD_S = 1.0
+
+SNAPSHOT_FIRINGS = 4096
+
+
+def net_digest(petri_network: PetriNet) -> bytes:
+    """Identifies the places and transitions a journal applies to."""
+    digest = hashlib.sha256()
+    for place in petri_network.places:
+        digest.update(place.name.encode() + b"\0")
+    digest.update(b"\0")
+    for transition in petri_network.transitions:
+        digest.update(transition.name.encode() + b"\0")
+    return digest.digest()
+
+
+def encode_snapshot(marking: List[int]) -> bytes:
+    """Only the places holding tokens are stored, most of them don't"""
+    places = array("I", (p for p, tokens in enumerate(marking) if tokens))
+    tokens = array("q", (marking[p] for p in places))
+    return SNAPSHOT.pack(len(places)) + places.tobytes() + tokens.tobytes()
+
+
+def read(
+    filepath: Union[Path, str], petri_network: PetriNet
+) -> Tuple[List[int], array]:
+    """Snapshot and firings of a journal of [petri_network]. A partial
+    firing at the end, as left by a crash, is ignored."""
+    with open(filepath, "rb") as file:
+        data = file.read()
+
+    if len(data) < HEADER.size + SNAPSHOT.size:
+        raise ValueError("Truncated journal header")
+    magic, version, digest, count = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("Not a journal")
+    if version != VERSION:
+        raise ValueError(f"Unsupported journal version {version}")
+    if digest != net_digest(petri_network):
+        raise ValueError("The journal was written for another net")
+
+    offset = HEADER.size
+    (held,) = SNAPSHOT.unpack_from(data, offset)
+    offset += SNAPSHOT.size
+    end = offset + held * 12
+    if len(data) < end:
+        raise ValueError("Truncated journal snapshot")
+    places = array("I", data[offset : offset + held * 4])
+    tokens = array("q", data[offset + held * 4 : end])
+    marking = [0] * count
+    for p, n in zip(places, tokens):
+        marking[p] = n
+
+    size = (len(data) - end) // FIRING.size * FIRING.size
+    return marking, array("I", data[end : end + size])
+
+
+def restore(filepath: Union[Path, str], petri_network: PetriNet) -> int:
+    """Set the marking of the net to the one at the end of the journal,
+    returning the number of firings replayed after its snapshot. Raises
+    ValueError when the journal doesn't fit the net."""
+    marking, firings = read(filepath, petri_network)
+    if len(marking) != len(petri_network.places):
+        raise ValueError("The journal was written for another net")
+    for place, tokens in zip(petri_network.places, marking):
+        place.tokens = tokens
+
+    transitions = petri_network.transitions
+    for i in firings:
+        if i >= len(transitions):
+            raise ValueError(f"Invalid transition {i} in the journal")
+        transitions[i].force_fire()
+    return len(firings)
+
+
+class Journal:
+    """Journal written by a controller: [fired] buffers a firing and
+    [commit], at the end of each loop, writes them."""
+
+    def __init__(
+        self,
+        filepath: Union[Path, str],
+        petri_network: PetriNet,
+        sync: str = SYNC_POLICIES[1],
+    ):
+        if sync not in SYNC_POLICIES:
+            raise ValueError(f"Invalid journal sync policy: {sync}")
+
+        self.path = Path(filepath)
+        self.sync = sync
+        self.header = HEADER.pack(
+            MAGIC,
+            VERSION,
+            net_digest(petri_network),
+            len(petri_network.places),
+        )
+
+        self._firings = array("I")
+        self._since_snapshot = 0
+        self._fd: Union[int, None] = None
+        self._dirty = False
+
+        # Firings committed while a snapshot is written, to append to it
+        # once it's done
+        self._carry: Union[array, None] = None
+        self._snapshotter: Union[threading.Thread, None] = None
+
+        # The file is written by the loop, but synced and replaced by the
+        # threads
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Union[threading.Thread, None] = None
+
+        # The journal starts with the current marking, the initial one or
+        # the one restored from this very journal
+        self.snapshot(petri_network.get_marking())
+        if sync == "periodic":
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def fired(self, transition: int):
+        self._firings.append(transition)
+
+    def commit(self, marking: Callable[[], List[int]]):
+        """Write the firings of the loop, and start a new snapshot from
+        [marking] once there were enough firings since the last one."""
+        if not self._firings:
+            return
+
+        with self._lock:
+            os.write(self._fd, self._firings.tobytes())
+            if self._carry is not None:
+                self._carry.extend(self._firings)
+            if self.sync == "always":
+                os.fsync(self._fd)
+            else:
+                self._dirty = True
+        self._since_snapshot += len(self._firings)
+        del self._firings[:]
+
+        snapshotter = self._snapshotter
+        if self._since_snapshot >= SNAPSHOT_FIRINGS and (
+            snapshotter is None or not snapshotter.is_alive()
+        ):
+            # The marking is copied now, the firings of the next loops go
+            # to the current file until the snapshot replaces it
+            self._since_snapshot = 0
+            self._carry = array("I")
+            self._snapshotter = threading.Thread(
+                target=self.snapshot, args=(list(marking()),), daemon=True
+            )
+            self._snapshotter.start()
+
+    def snapshot(self, marking: List[int]):
+        """Replace the journal by a snapshot of [marking], followed by the
+        firings committed since it was taken. The new file is written aside
+        and renamed over the old one, so a crash leaves one of them
+        whole"""
+        temporary = self.path.with_name(self.path.name + ".tmp")
+        fd = os.open(temporary, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        os.write(fd, self.header + encode_snapshot(marking))
+        if self.sync != "never":
+            os.fsync(fd)
+
+        with self._lock:
+            dirty = False
+            if self._carry is not None:
+                if self._carry:
+                    os.write(fd, self._carry.tobytes())
+                    if self.sync == "always":
+                        os.fsync(fd)
+                    else:
+                        dirty = True
+                self._carry = None
+            os.replace(temporary, self.path)
+            if self._fd is not None:
+                os.close(self._fd)
+            self._fd = fd
+            self._dirty = dirty
+
+        # The rename itself is only durable once the directory is synced
+        if self.sync != "never":
+            directory = os.open(self.path.parent, os.O_RDONLY)
+            try:
+                os.fsync(directory)
+            finally:
+                os.close(directory)
+
+    def _run(self):
+        while not self._stop.wait(SYNC_PERIOD_S):
+            with self._lock:
+                if self._dirty:
+                    self._dirty = False
+                    os.fsync(self._fd)
+
+    def close(self, marking: List[int]):
+        """Stop with a snapshot of the final marking, so resuming doesn't
+        fire anything"""
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        if self._snapshotter is not None:
+            self._snapshotter.join()
+            self._snapshotter = None
+        del self._firings[:]
+        self.snapshot(marking)
+        os.close(self._fd)
+        self._fd = None
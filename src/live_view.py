@@ -0,0 +1,410 @@
+#!/usr/bin/env python3
+"""Live view of a controller for external monitors: the marking of the net,
+the input image and the coils, published by the controller at the end of
+each loop in a shared memory segment that any number of monitors can read.
+
+The segment has a fixed layout, described by its header:
+
+    header      magic, version, number of places, of inputs and of coils,
+                size of the names, process id of the controller
+    sequence    version counter of the state below, odd while it is written
+    state       loop number, time of the loop
+    marking     tokens of each place, as int64
+    inputs      input image, one bit per input
+    coils       one byte per coil: 0, 1, or 2 when unknown
+    names       JSON of the place names, input and coil addresses
+
+The state is guarded like a seqlock: the controller makes the sequence odd,
+writes, and makes it even again, and a monitor retries a read during which
+the sequence changed. The controller never waits for the monitors.
+"""
+import json
+import os
+import struct
+import time
+from argparse import ArgumentParser
+from array import array
+from dataclasses import dataclass
+from multiprocessing import resource_tracker, shared_memory
+from typing import Dict, List, Union
+
+from modbus.image import CoilImage
+from reachability import format_marking
+
+
+MAGIC = b"FTLIV"
+VERSION = 2
+
+# Magic, version, then the number of places, inputs and coils, the size
+# of the names and the process writing the segment
+HEADER = struct.Struct("<5sB2xIIIII")
+SEQUENCE = struct.Struct("<Q")
+STATE = struct.Struct("<Qd")
+
+SEQUENCE_OFFSET = HEADER.size
+STATE_OFFSET = SEQUENCE_OFFSET + SEQUENCE.size
+MARKING_OFFSET = STATE_OFFSET + STATE.size
+
+UNKNOWN_COIL = 2
+
+# A read keeps failing when the controller died in the middle of a write
+READ_TIMEOUT_S = 1.0
+
+DEFAULT_WATCH_S = 1.0
+
+
+@dataclass
+class Layout:
+    """Offsets of the sections of a segment."""
+
+    places: int
+    inputs: int
+    coils: int
+    names: int
+
+    @property
+    def inputs_offset(self) -> int:
+        return MARKING_OFFSET + self.places * 8
+
+    @property
+    def input_bytes(self) -> int:
+        return (self.inputs + 7) // 8
+
+    @property
+    def coils_offset(self) -> int:
+        return self.inputs_offset + self.input_bytes
+
+    @property
+    def names_offset(self) -> int:
+        return self.coils_offset + self.coils
+
+    @property
+    def size(self) -> int:
+        return self.names_offset + self.names
+
+
+def is_running(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class LiveView:
+    """Segment written by a controller, named [name]. A segment left by a
+    controller that crashed is replaced, FileExistsError is raised when
+    the segment is in use or isn't a live view."""
+
+    def __init__(
+        self,
+        name: str,
+        place_names: List[str],
+        input_addresses: List[int],
+        coil_addresses: List[int],
+    ):
+        names = json.dumps(
+            {
+                "places": place_names,
+                "inputs": input_addresses,
+                "coils": coil_addresses,
+            }
+        ).encode()
+        self.layout = Layout(
+            len(place_names),
+            len(input_addresses),
+            len(coil_addresses),
+            len(names),
+        )
+        self.coil_addresses = coil_addresses
+
+        try:
+            self.memory = shared_memory.SharedMemory(
+                name, create=True, size=self.layout.size
+            )
+        except FileExistsError:
+            replace_stale(name)
+            self.memory = shared_memory.SharedMemory(
+                name, create=True, size=self.layout.size
+            )
+
+        buffer = self.memory.buf
+        layout = self.layout
+        HEADER.pack_into(
+            buffer,
+            0,
+            MAGIC,
+            VERSION,
+            layout.places,
+            layout.inputs,
+            layout.coils,
+            layout.names,
+            os.getpid(),
+        )
+        buffer[layout.names_offset : layout.size] = names
+        self.sequence = 0
+        SEQUENCE.pack_into(buffer, SEQUENCE_OFFSET, self.sequence)
+
+        # Views of the sections written on each loop
+        self._marking = buffer[
+            MARKING_OFFSET : layout.inputs_offset
+        ].cast("q")
+        self._inputs = buffer[layout.inputs_offset : layout.coils_offset]
+        self._coils = buffer[layout.coils_offset : layout.names_offset]
+
+    def publish(
+        self,
+        tick: int,
+        image: int,
+        marking: Union[List[int], None] = None,
+        coils: Union[CoilImage, None] = None,
+    ):
+        """Publish the state at the end of loop [tick]. The marking and the
+        coils only change when something fires, they are kept as they are
+        when not given"""
+        buffer = self.memory.buf
+        self.sequence += 1
+        SEQUENCE.pack_into(buffer, SEQUENCE_OFFSET, self.sequence)
+
+        STATE.pack_into(buffer, STATE_OFFSET, tick, time.time())
+        self._inputs[:] = image.to_bytes(self.layout.input_bytes, "little")
+        if marking is not None:
+            self._marking[:] = array("q", marking)
+        if coils is not None:
+            self._coils[:] = bytes(
+                UNKNOWN_COIL if value is None else value
+                for value in (coils.get(a) for a in self.coil_addresses)
+            )
+
+        self.sequence += 1
+        SEQUENCE.pack_into(buffer, SEQUENCE_OFFSET, self.sequence)
+
+    def close(self):
+        self._marking.release()
+        self._inputs.release()
+        self._coils.release()
+        self.memory.close()
+        try:
+            self.memory.unlink()
+        except FileNotFoundError:
+            # Removed by hand, there is nothing left to clean up
+            pass
+
+
+def replace_stale(name: str):
+    """Remove the segment [name] if it is a live view whose controller is
+    gone, raising FileExistsError otherwise"""
+    stale = shared_memory.SharedMemory(name)
+    pid = None
+    try:
+        error = f"{name} exists and isn't a live view"
+        if len(stale.buf) >= HEADER.size:
+            magic, version, *_, pid = HEADER.unpack_from(stale.buf)
+            if magic == MAGIC and version == VERSION:
+                error = f"Live view {name} is used by process {pid}"
+                if not is_running(pid):
+                    error = None
+    finally:
+        stale.close()
+    if error is None:
+        stale.unlink()
+        return
+
+    # Attaching registers the segment as if it was created here, so it
+    # would be removed on exit while its controller still runs. It is
+    # already registered when that controller is this process
+    if pid != os.getpid():
+        resource_tracker.unregister(stale._name, "shared_memory")
+    raise FileExistsError(error)
+
+
+@dataclass
+class Snapshot:
+    """State of a controller as read from its live view."""
+
+    tick: int
+    time: float
+    marking: List[int]
+    inputs: Dict[int, bool]
+
+    # None when the value of the coil isn't known yet
+    coils: Dict[int, Union[bool, None]]
+
+
+class LiveReader:
+    """Monitor of the live view [name] of a running controller. Raises
+    FileNotFoundError when there is none, ValueError when the segment
+    isn't a live view."""
+
+    def __init__(self, name: str):
+        self.memory = shared_memory.SharedMemory(name)
+        buffer = self.memory.buf
+
+        # Attaching registers the segment as if it was created here, so it
+        # would be removed when the monitor exits, unless the controller is
+        # this process
+        pid = None
+        if len(buffer) >= HEADER.size:
+            pid = HEADER.unpack_from(buffer)[-1]
+        if pid != os.getpid():
+            resource_tracker.unregister(self.memory._name, "shared_memory")
+
+        if len(buffer) < MARKING_OFFSET:
+            raise ValueError(f"{name} isn't a live view")
+        magic, version, places, inputs, coils, names, _ = (
+            HEADER.unpack_from(buffer)
+        )
+        if magic != MAGIC:
+            raise ValueError(f"{name} isn't a live view")
+        if version != VERSION:
+            raise ValueError(f"Unsupported live view version {version}")
+        self.layout = Layout(places, inputs, coils, names)
+        if len(buffer) < self.layout.size:
+            raise ValueError(f"Truncated live view {name}")
+
+        names = json.loads(
+            bytes(buffer[self.layout.names_offset : self.layout.size])
+        )
+        self.place_names: List[str] = names["places"]
+        self.input_addresses: List[int] = names["inputs"]
+        self.coil_addresses: List[int] = names["coils"]
+
+    def read(self) -> Snapshot:
+        """Consistent copy of the state. Raises TimeoutError when it keeps
+        changing, ie. the controller stopped in the middle of a write"""
+        buffer = self.memory.buf
+        layout = self.layout
+        timeout = time.perf_counter() + READ_TIMEOUT_S
+        while True:
+            (before,) = SEQUENCE.unpack_from(buffer, SEQUENCE_OFFSET)
+            if not before % 2:
+                data = bytes(buffer[STATE_OFFSET : layout.names_offset])
+                (after,) = SEQUENCE.unpack_from(buffer, SEQUENCE_OFFSET)
+                if before == after:
+                    break
+            if time.perf_counter() > timeout:
+                raise TimeoutError("The live view is never consistent")
+
+            # The controller may be in the middle of a write, and can only
+            # finish it if it gets the CPU
+            time.sleep(0)
+
+        tick, at = STATE.unpack_from(data)
+        offset = STATE.size
+        marking = array("q", data[offset : offset + layout.places * 8])
+        offset += layout.places * 8
+        image = int.from_bytes(
+            data[offset : offset + layout.input_bytes], "little"
+        )
+        offset += layout.input_bytes
+        coils = data[offset : offset + layout.coils]
+        return Snapshot(
+            tick,
+            at,
+            marking.tolist(),
+            {
+                address: bool(image >> i & 1)
+                for i, address in enumerate(self.input_addresses)
+            },
+            {
+                address: None if value == UNKNOWN_COIL else bool(value)
+                for address, value in zip(self.coil_addresses, coils)
+            },
+        )
+
+    def close(self):
+        self.memory.close()
+
+
+def render_text(reader: LiveReader, snapshot: Snapshot) -> str:
+    clock = time.strftime("%H:%M:%S", time.localtime(snapshot.time))
+    high = [str(a) for a, value in snapshot.inputs.items() if value]
+    on = [str(a) for a, value in snapshot.coils.items() if value]
+    unknown = [str(a) for a, value in snapshot.coils.items() if value is None]
+    lines = [
+        f"Loop {snapshot.tick} at {clock}"
+        f" ({time.time() - snapshot.time:.3f} s ago)",
+        f"  Marking: {format_marking(reader.place_names, snapshot.marking)}",
+        f"  Inputs on: {' '.join(high) or '-'}",
+        f"  Coils on: {' '.join(on) or '-'}",
+    ]
+    if unknown:
+        lines.append(f"  Coils unknown: {' '.join(unknown)}")
+    return "\n".join(lines)
+
+
+def render_json(reader: LiveReader, snapshot: Snapshot) -> str:
+    return json.dumps(
+        {
+            "tick": snapshot.tick,
+            "time": snapshot.time,
+            "marking": dict(zip(reader.place_names, snapshot.marking)),
+            "inputs": {str(a): v for a, v in snapshot.inputs.items()},
+            "coils": {str(a): v for a, v in snapshot.coils.items()},
+        }
+    )
+
+
+def build_parser() -> ArgumentParser:
+    parser = ArgumentParser(
+        prog="live_view",
+        description="Show the marking, inputs and coils of a running"
+        " controller, from its --live-view.",
+    )
+    parser.add_argument(
+        "name",
+        help="name of the live view, as given to --live-view (followed by"
+        " '-<plant>' with --plants)",
+    )
+    parser.add_argument(
+        "-w",
+        "--watch",
+        type=float,
+        nargs="?",
+        const=DEFAULT_WATCH_S,
+        help="show the state again every WATCH seconds, until interrupted",
+        default=None,
+    )
+    parser.add_argument(
+        "--json",
+        action="store_true",
+        help="print the state as one JSON object per line",
+    )
+    return parser
+
+
+def main():
+    parser = build_parser()
+    args = parser.parse_args()
+    if args.watch is not None and args.watch <= 0:
+        parser.error("--watch should be positive")
+
+    try:
+        reader = LiveReader(args.name)
+    except FileNotFoundError:
+        print(f"No live view named {args.name}, is the controller running?")
+        raise SystemExit(1)
+    except ValueError as e:
+        print(f"Can't read {args.name}: {e}")
+        raise SystemExit(1)
+
+    render = render_json if args.json else render_text
+    try:
+        while True:
+            print(render(reader, reader.read()), flush=True)
+            if args.watch is None:
+                break
+            time.sleep(args.watch)
+    except KeyboardInterrupt:
+        pass
+    except TimeoutError as e:
+        print(f"Can't read {args.name}: {e}")
+        raise SystemExit(1)
+    finally:
+        reader.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,403 @@
+import hashlib
+import struct
+from array import array
+from heapq import heapify, heappop, heappush
+from pathlib import Path
+from typing import Dict, List, Sequence, Tuple, Union
+
+from parsers.device import InputEvent, OutputEvent, TriggerTypes
+from petri_net import PetriNet
+from reachability import (
+    CompiledNet,
+    MarkingCodec,
+    compile_net,
+    fire,
+    is_enabled,
+)
+from transition_index import TransitionIndex
+
+
+MAGIC = b"FTTAB"
+VERSION = 3
+
+# Magic, version, codec width, digests of the net and of its bindings to
+# the device, then the number of places, markings, input edges, output
+# events and steps
+HEADER = struct.Struct("<5sBB20s20sIIHHI")
+NAME = struct.Struct("<H")
+
+# Marking, input edge, next marking, then the number of transitions fired
+# and output events written, followed by their ids as uint32
+STEP = struct.Struct("<IHIHH")
+
+# Edge of the step settling a marking that isn't stable, eg. the initial
+# one, by firing its enabled unconditional transitions
+SETTLE = 0xFFFF
+
+DEFAULT_MAX_STATES = 100_000
+
+# Unconditional firings allowed in a single step before giving up, as it
+# likely means they can fire forever
+MAX_SETTLE_FIRINGS = 10_000
+
+# (next marking, fired transitions, output events)
+Step = Tuple[int, Tuple[int, ...], Tuple[int, ...]]
+
+
+def edge_name(address: int, rising: bool) -> str:
+    """Name of an edge of the input image in a table, eg. '12+'"""
+    return f"{address}{'+' if rising else '-'}"
+
+
+def parse_edge_name(name: str) -> Tuple[int, bool]:
+    """(address, rising) of an edge named by [edge_name]"""
+    if len(name) < 2 or name[-1] not in "+-" or not name[:-1].isdigit():
+        raise ValueError(f"Invalid edge '{name}' in the table")
+    return int(name[:-1]), name[-1] == "+"
+
+
+def net_digest(net: CompiledNet) -> bytes:
+    """Fingerprint of the structure and initial marking of a net."""
+    return hashlib.sha1(
+        repr(
+            (
+                net.place_names,
+                net.transition_names,
+                net.need,
+                net.inhibit,
+                net.delta,
+                net.initial,
+            )
+        ).encode()
+    ).digest()
+
+
+def bindings_digest(
+    index: TransitionIndex, outputs: Dict[str, OutputEvent]
+) -> bytes:
+    """Fingerprint of what the table takes from the device: the edges
+    triggering each transition, and the coils written by the output events
+    of each one."""
+    return hashlib.sha1(
+        repr(
+            (
+                [
+                    None
+                    if triggers is None
+                    else [(t.address, t.type.name) for t in triggers]
+                    for triggers in index.triggers
+                ],
+                [
+                    [
+                        (name, name in outputs and outputs[name].actions)
+                        for name in names
+                    ]
+                    for names in index.events
+                ],
+            )
+        ).encode()
+    ).digest()
+
+
+def write_names(file, names: List[str]):
+    for name in names:
+        raw = name.encode()
+        file.write(NAME.pack(len(raw)))
+        file.write(raw)
+
+
+def read_names(data: memoryview, offset: int, count: int):
+    names = []
+    for _ in range(count):
+        (size,) = NAME.unpack_from(data, offset)
+        offset += NAME.size
+        names.append(bytes(data[offset : offset + size]).decode())
+        offset += size
+    return names, offset
+
+
+class LookupTable:
+    """Every reaction of a bounded net to the edges of its inputs,
+    computed ahead of time.
+
+    A step is what the controller does on an edge of the input image, see
+    [react]: the transitions of every input event triggered by the edge
+    and the unconditional transitions they enable are checked together, in
+    net order. When several edges happen in the same loop, the table takes
+    their steps one after the other, in the order of the edges.
+    """
+
+    def __init__(
+        self,
+        digest: bytes,
+        bindings: bytes,
+        place_names: List[str],
+        markings: List[Tuple[int, ...]],
+        edges: List[str],
+        outputs: List[str],
+        steps: Dict[Tuple[int, int], Step],
+    ):
+        self.digest = digest
+        self.bindings = bindings
+        self.place_names = place_names
+        self.markings = markings
+        self.edges = edges
+        self.outputs = outputs
+        self.steps = steps
+        self._ids: Union[Dict[Tuple[int, ...], int], None] = None
+
+    def find(self, marking: Sequence[int]) -> Union[int, None]:
+        """Id of a marking, None if it isn't reachable."""
+        if self._ids is None:
+            self._ids = {m: i for i, m in enumerate(self.markings)}
+        return self._ids.get(tuple(marking))
+
+    def check(
+        self,
+        petri_network: PetriNet,
+        index: TransitionIndex,
+        outputs: Dict[str, OutputEvent],
+    ):
+        """Raise ValueError unless the table was compiled from this net and
+        the same events of the device"""
+        # The marking of the net may have moved on, eg. resumed from a
+        # journal, so the net is compared with the initial marking of the
+        # table, the first one
+        net = compile_net(petri_network)
+        if self.markings:
+            net.initial = list(self.markings[0])
+        if net_digest(net) != self.digest:
+            raise ValueError("The table was compiled from another net")
+        if bindings_digest(index, outputs) != self.bindings:
+            raise ValueError(
+                "The table was compiled with other events in the device,"
+                " compile it again"
+            )
+
+    def save(self, filepath: Union[Path, str]):
+        """Write the table, raising ValueError when it has more edges or
+        output events than the format holds"""
+        if len(self.edges) >= SETTLE:
+            raise ValueError(
+                f"Too many input edges for a table: {len(self.edges)}"
+            )
+        if len(self.outputs) > 0xFFFF:
+            raise ValueError(
+                f"Too many output events for a table: {len(self.outputs)}"
+            )
+        for after, fired, written in self.steps.values():
+            if max(len(fired), len(written)) > 0xFFFF:
+                raise ValueError("Too many firings in a step of the table")
+        most = max((max(m, default=0) for m in self.markings), default=0)
+        codec = MarkingCodec.fitting(len(self.place_names), most)
+        with open(filepath, "wb") as file:
+            file.write(
+                HEADER.pack(
+                    MAGIC,
+                    VERSION,
+                    codec.width,
+                    self.digest,
+                    self.bindings,
+                    len(self.place_names),
+                    len(self.markings),
+                    len(self.edges),
+                    len(self.outputs),
+                    len(self.steps),
+                )
+            )
+            write_names(file, self.place_names)
+            write_names(file, self.edges)
+            write_names(file, self.outputs)
+            for marking in self.markings:
+                file.write(codec.encode(marking))
+            for (marking, edge), (after, fired, written) in sorted(
+                self.steps.items()
+            ):
+                file.write(
+                    STEP.pack(marking, edge, after, len(fired), len(written))
+                )
+                file.write(array("I", fired + written).tobytes())
+
+    @classmethod
+    def load(cls, filepath: Union[Path, str]) -> "LookupTable":
+        with open(filepath, "rb") as file:
+            data = memoryview(file.read())
+
+        if len(data) < HEADER.size:
+            raise ValueError("Truncated lookup table")
+        (
+            magic,
+            version,
+            width,
+            digest,
+            bindings,
+            place_count,
+            marking_count,
+            edge_count,
+            output_count,
+            step_count,
+        ) = HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise ValueError("Not a lookup table")
+        if version != VERSION:
+            raise ValueError(f"Unsupported lookup table version {version}")
+
+        try:
+            offset = HEADER.size
+            place_names, offset = read_names(data, offset, place_count)
+            edges, offset = read_names(data, offset, edge_count)
+            outputs, offset = read_names(data, offset, output_count)
+
+            codec = MarkingCodec(place_count, width)
+            markings = []
+            for _ in range(marking_count):
+                end = offset + codec.size
+                if end > len(data):
+                    raise struct.error("truncated marking")
+                markings.append(tuple(codec.decode(bytes(data[offset:end]))))
+                offset = end
+
+            steps = {}
+            for _ in range(step_count):
+                marking, edge, after, fired, written = STEP.unpack_from(
+                    data, offset
+                )
+                offset += STEP.size
+                ids = array("I")
+                ids.frombytes(data[offset : offset + 4 * (fired + written)])
+                if len(ids) != fired + written:
+                    raise struct.error("truncated step")
+                offset += 4 * (fired + written)
+                steps[marking, edge] = (
+                    after,
+                    tuple(ids[:fired]),
+                    tuple(ids[fired:]),
+                )
+        except struct.error as e:
+            raise ValueError("Truncated lookup table") from e
+
+        for name in edges:
+            parse_edge_name(name)
+        return cls(
+            digest, bindings, place_names, markings, edges, outputs, steps
+        )
+
+
+def react(
+    net: CompiledNet,
+    index: TransitionIndex,
+    marking: List[int],
+    candidates: Sequence[int],
+) -> Tuple[List[int], List[int]]:
+    """Marking after a loop of the controller checking [candidates] (the
+    transitions of an edge, or the unconditional ones), and the transitions
+    it fired. This is the worklist of [Controller.evaluate]: candidates
+    are checked in net order, and the unconditional transitions affected by
+    a firing are checked again, even the ones before it in the net"""
+    queue = list(candidates)
+    heapify(queue)
+    queued = set(queue)
+    fired: List[int] = []
+    settle_firings = 0
+    while queue:
+        t = heappop(queue)
+        queued.discard(t)
+        unconditional = index.triggers[t] is None
+        if unconditional and settle_firings >= MAX_SETTLE_FIRINGS:
+            raise ValueError(
+                "Unconditional transitions keep firing, last one was"
+                f" '{net.transition_names[fired[-1]]}'"
+            )
+        if not is_enabled(net, marking, t):
+            continue
+
+        marking = fire(net, marking, t)
+        fired.append(t)
+        dependents = index.dependents[t]
+        if unconditional:
+            settle_firings += 1
+            dependents = [t, *dependents]
+        for j in dependents:
+            if j not in queued:
+                queued.add(j)
+                heappush(queue, j)
+    return marking, fired
+
+
+def compile_table(
+    petri_network: PetriNet,
+    inputs: Dict[str, InputEvent],
+    outputs: Dict[str, OutputEvent],
+    max_states: int = DEFAULT_MAX_STATES,
+) -> LookupTable:
+    """Explore every marking reachable through steps, raising ValueError
+    if there are more than [max_states] (the net is likely unbounded) or
+    the unconditional transitions can fire forever.
+
+    Steps fire to the same fixed point as the controller, see [react]:
+    after each firing, the unconditional transitions it affects are
+    checked again, lowest first, until none of them is enabled."""
+    net = compile_net(petri_network)
+    index = TransitionIndex(petri_network, inputs, outputs)
+
+    # Transitions triggered by each edge of the image, whatever their
+    # event, edges numbered in the order of their first transition in the
+    # net
+    by_edge: Dict[str, List[int]] = {}
+    for i, triggers in enumerate(index.triggers):
+        for trigger in triggers or ():
+            name = edge_name(
+                trigger.address, trigger.type == TriggerTypes.POSITIVE_EDGE
+            )
+            transitions = by_edge.setdefault(name, [])
+            if i not in transitions:
+                transitions.append(i)
+    edges = list(by_edge)
+
+    output_ids: Dict[str, int] = {}
+    written_by = [
+        tuple(output_ids.setdefault(e, len(output_ids)) for e in names)
+        for names in index.events
+    ]
+
+    markings: List[Tuple[int, ...]] = [tuple(net.initial)]
+    ids = {markings[0]: 0}
+    steps: Dict[Tuple[int, int], Step] = {}
+
+    def add_step(source: int, edge: int, marking, fired: List[int]):
+        if not fired:
+            return
+        key = tuple(marking)
+        after = ids.get(key)
+        if after is None:
+            if len(markings) >= max_states:
+                raise ValueError(
+                    f"More than {max_states} reachable markings, the net is"
+                    " probably unbounded"
+                )
+            after = ids[key] = len(markings)
+            markings.append(key)
+        written = tuple(e for t in fired for e in written_by[t])
+        steps[source, edge] = (after, tuple(fired), written)
+
+    # The initial marking may not be stable, every other one is. The
+    # controller starts with every unconditional transition to check
+    marking, fired = react(net, index, list(net.initial), index.unconditional)
+    add_step(0, SETTLE, marking, fired)
+
+    i = 0
+    while i < len(markings):
+        for edge, transitions in enumerate(by_edge.values()):
+            marking, fired = react(net, index, list(markings[i]), transitions)
+            add_step(i, edge, marking, fired)
+        i += 1
+
+    return LookupTable(
+        net_digest(net),
+        bindings_digest(index, outputs),
+        net.place_names,
+        markings,
+        edges,
+        list(output_ids),
+        steps,
+    )
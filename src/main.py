@@ -1,11 +1,33 @@
 #!/usr/bin/env python3
+import asyncio
 import time
-from typing import Tuple
+from argparse import Namespace
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Coroutine, Dict, List, Tuple, Union
 
 import cli
-from parsers import network, device
+from parsers import device
+from async_controller import AsyncController
 from controller import Controller
+from event_log import EventLog
+from journal import Journal, restore
+from live_view import LiveView
+from lookup_table import LookupTable
+from metrics import (
+    Metrics,
+    render_prometheus,
+    start_http_server,
+    start_snapshots,
+)
+from net_cache import load_inputs
 from petri_net import PetriNet
+from plants import Plant
+from profiler import Sampler, SlowestTicks
+from recording import InputLog, InputRecorder
+from replay import ReplayController
+from scheduler import TickScheduler
+from timers import time_unit
 
 
 RECONNECT_PERIOD_S = 1.5
@@ -18,12 +40,16 @@ def header_message(address: Tuple[str, int], petri_network: PetriNet):
     print("")
 
 
-def connection_reset_message(e: ConnectionResetError):
-    print(f"Connection reset, because: {e}.")
-    print(f"Caused by: {e.__cause__}.")
-    print(f"Trying to reconnect in {RECONNECT_PERIOD_S} seconds...")
-    print("")
-    time.sleep(RECONNECT_PERIOD_S)
+def connection_reset_message(e: ConnectionResetError, prefix: str = ""):
+    cause = f" Caused by: {e.__cause__}." if e.__cause__ else ""
+    print(f"{prefix}Connection reset, because: {e}.{cause} Reconnecting...")
+
+
+def reconnected_message(start: float, prefix: str = ""):
+    print(
+        f"{prefix}Reconnected after"
+        f" {(time.perf_counter() - start) * 1000:.1f} ms"
+    )
 
 
 def closing_message():
@@ -31,30 +57,394 @@ def closing_message():
     print("Stopping controller...")
 
 
-def main():
-    # Parse CLI arguments
-    device_path, network_path, sleep_period = cli.get_args()
+def overrun_message(scheduler: TickScheduler):
+    report = scheduler.report()
+    if report is not None:
+        print(f"Warning: {report}")
+
+
+@dataclass
+class LoadedPlant:
+    """A plant ready to run, see [load_plant]"""
+
+    name: str
+    address: Tuple[str, int]
+    petri_network: PetriNet
+    scheduler: TickScheduler
+    metrics: Metrics
+    recorder: Union[InputRecorder, None]
+    journal: Union[Journal, None]
+    live: Union[LiveView, None]
+
+    # Keyword arguments of the controller, besides the address and the net
+    options: Dict[str, Any]
+
+
+def run(plant: LoadedPlant):
+    header_message(plant.address, plant.petri_network)
+    scheduler = plant.scheduler
+    with Controller(
+        plant.address, plant.petri_network, **plant.options
+    ) as controller:
+        print("Operation display:")
+        scheduler.restart()
+        while True:
+            try:
+                active = controller.loop()
+            except ConnectionResetError as e:
+                # The controller keeps its state, only the connection is
+                # opened again
+                connection_reset_message(e)
+                start = time.perf_counter()
+                controller.reconnect()
+                reconnected_message(start)
+                scheduler.restart()
+                continue
+
+            overrun_message(scheduler)
+            scheduler.wait(active, controller.next_deadline())
+
+
+async def run_async(plant: LoadedPlant):
+    header_message(plant.address, plant.petri_network)
+    scheduler = plant.scheduler
+    async with AsyncController(
+        plant.address, plant.petri_network, **plant.options
+    ) as controller:
+        print("Operation display:")
+        scheduler.restart()
+        while True:
+            try:
+                active = await controller.loop_async()
+            except ConnectionResetError as e:
+                connection_reset_message(e)
+                start = time.perf_counter()
+                await controller.reconnect_async()
+                reconnected_message(start)
+                scheduler.restart()
+                continue
+
+            overrun_message(scheduler)
+            await scheduler.wait_async(active, controller.next_deadline())
+
+
+def replay(
+    log_path: Path, event_log: Union[EventLog, None], plant: LoadedPlant
+):
+    petri_network = plant.petri_network
+    print(f"Replaying {log_path}, with:")
+    print(f"  Transitions: {len(petri_network.transitions)}")
+    print(f"  Places: {len(petri_network.places)}")
+    print("")
+
+    with ReplayController(
+        InputLog(log_path), petri_network, **plant.options
+    ) as controller:
+        print("Operation display:")
+        start = time.perf_counter()
+        ticks = controller.run()
+        elapsed = time.perf_counter() - start
+
+    if event_log is not None:
+        event_log.flush()
+    print("")
+    print(
+        f"Replayed {ticks} loops in {elapsed:.3f} seconds"
+        f" ({len(controller.coil_writes)} coil writes)"
+    )
+
+
+def resume(filepath: Path, petri_network: PetriNet, prefix: str = ""):
+    """Restore the marking of the net from its journal, if there is one
+    yet. A journal that doesn't fit the net stops everything: the plant
+    is in an unknown state"""
+    if not filepath.is_file():
+        print(
+            f"{prefix}No journal at {filepath} yet, starting from the"
+            " initial marking"
+        )
+        return
+
+    start = time.perf_counter()
+    try:
+        firings = restore(filepath, petri_network)
+    except (OSError, ValueError) as e:
+        print(f"{prefix}Can't resume from {filepath}: {e}")
+        raise SystemExit(1)
+    print(
+        f"{prefix}Resumed from {filepath} in"
+        f" {(time.perf_counter() - start) * 1000:.1f} ms ({firings} firings"
+        " since the last snapshot)"
+    )
+
+
+def build_scheduler(args: Namespace, timing: device.Timing) -> TickScheduler:
+    period = args.sleep
+    if args.device_period:
+        sample_period = timing.sample_period()
+        if sample_period is None:
+            print("No SampleInterval in the device file, using --sleep")
+        else:
+            period = sample_period
 
-    # Parse config
-    petri_network = network.parse(network_path)
-    address, inputs, outputs = device.parse(device_path)
+    max_period = None
+    if args.max_sleep is not None:
+        max_period = max(args.max_sleep, period)
 
-    # Start controller
+    return TickScheduler(period, max_period, args.backoff)
+
+
+def load_plant(
+    args: Namespace, plant: Plant, event_log: Union[EventLog, None]
+) -> LoadedPlant:
+    """Parse the files of a plant, or load them from the cache, and build
+    what its controller needs"""
+    petri_network, parsed_device, index = load_inputs(
+        plant.net, plant.device, args.use_cache
+    )
+
+    # The marking is restored before anything reads it, the engine and the
+    # table start from it
+    journal = None
+    if plant.journal is not None:
+        if args.resume:
+            prefix = f"[{plant.name}] " if plant.name else ""
+            resume(plant.journal, petri_network, prefix)
+        journal = Journal(plant.journal, petri_network, args.journal_sync)
+
+    address, inputs, outputs, remote_image, timing = parsed_device
+    scheduler = build_scheduler(args, timing)
+    if args.engine == "numpy":
+        from petri_matrix import MatrixPetriNet
+
+        engine = MatrixPetriNet(petri_network)
+    else:
+        engine = None
+
+    table = None
+    if plant.table is not None:
+        try:
+            table = LookupTable.load(plant.table)
+            table.check(petri_network, index, outputs)
+        except (OSError, ValueError) as e:
+            prefix = f"[{plant.name}] " if plant.name else ""
+            print(f"{prefix}Can't use the table {plant.table}: {e}")
+            raise SystemExit(1)
+
+    # Metrics are kept across reconnections, labelled by plant when there
+    # are several of them
+    metrics = Metrics(
+        [t.name for t in petri_network.transitions],
+        labels={"plant": plant.name} if plant.name else None,
+    )
+
+    # Optional recording, kept across reconnections
+    recorder = None
+    if plant.record is not None:
+        recorder = InputRecorder(
+            plant.record,
+            sorted({t.address for e in inputs.values() for t in e.triggers}),
+        )
+
+    log = None
+    if event_log is not None:
+        log = event_log.add_channel(plant.name, petri_network, index)
+
+    live = None
+    if args.live_view is not None:
+        try:
+            live = LiveView(
+                f"{args.live_view}-{plant.name}"
+                if plant.name
+                else args.live_view,
+                [p.name for p in petri_network.places],
+                sorted(
+                    {t.address for e in inputs.values() for t in e.triggers}
+                ),
+                sorted({a for e in outputs.values() for a, _ in e.actions}),
+            )
+        except FileExistsError as e:
+            prefix = f"[{plant.name}] " if plant.name else ""
+            print(f"{prefix}Can't publish the live view: {e}")
+            raise SystemExit(1)
+
+    return LoadedPlant(
+        plant.name,
+        address,
+        petri_network,
+        scheduler,
+        metrics,
+        recorder,
+        journal,
+        live,
+        dict(
+            inputs=inputs,
+            outputs=outputs,
+            remote_image=remote_image,
+            max_gap=args.max_gap,
+            max_count=args.max_read,
+            engine=engine,
+            metrics=metrics,
+            recorder=recorder,
+            table=table,
+            index=index,
+            log=log,
+            journal=journal,
+            time_unit=args.time_unit
+            if args.time_unit is not None
+            else time_unit(timing.time_scale),
+            live=live,
+        ),
+    )
+
+
+async def run_plant(plant: LoadedPlant):
+    """[run_async] for one of several plants. Failing to connect at first
+    is retried too, so a plant that is down doesn't stop the others."""
+    prefix = f"[{plant.name}]"
+    address = plant.address
+    scheduler = plant.scheduler
     while True:
-        header_message(address, petri_network)
         try:
-            with Controller(
-                address, petri_network, inputs, outputs
+            async with AsyncController(
+                address, plant.petri_network, **plant.options
             ) as controller:
-                print("Operation display:")
+                print(f"{prefix} Controlling FlexFact plant at {address}")
+                controller.prefix = f"{prefix} "
+                scheduler.restart()
                 while True:
-                    controller.loop()
-                    time.sleep(sleep_period)
-        except ConnectionResetError as e:
-            connection_reset_message(e)
-        except KeyboardInterrupt:
-            closing_message()
-            break
+                    try:
+                        active = await controller.loop_async()
+                    except ConnectionResetError as e:
+                        connection_reset_message(e, f"{prefix} ")
+                        start = time.perf_counter()
+                        await controller.reconnect_async()
+                        reconnected_message(start, f"{prefix} ")
+                        scheduler.restart()
+                        continue
+
+                    report = scheduler.report()
+                    if report is not None:
+                        print(f"{prefix} Warning: {report}")
+                    await scheduler.wait_async(
+                        active, controller.next_deadline()
+                    )
+        except ConnectionAbortedError as e:
+            print(
+                f"{prefix} {e} Trying to connect again in"
+                f" {RECONNECT_PERIOD_S} seconds..."
+            )
+            await asyncio.sleep(RECONNECT_PERIOD_S)
+
+
+async def run_plants(plants: List[Coroutine]):
+    """Run every plant ([run_plant]) on the same event loop, each with its
+    own scheduler"""
+    await asyncio.gather(*plants)
+
+
+def main():
+    # Parse CLI arguments
+    args = cli.get_args()
+
+    if args.plants is None:
+        plants = [
+            Plant(
+                "",
+                args.device,
+                args.net,
+                args.table,
+                args.record,
+                args.journal,
+            )
+        ]
+    else:
+        plants = args.plants
+
+    # The operation display of every plant goes through the same log
+    event_log = None
+    if args.log_level != "off":
+        log_file = None
+        if args.log is not None:
+            mode = "wb" if args.log_format == "binary" else "w"
+            log_file = open(args.log, mode)
+        event_log = EventLog(log_file, args.log_format, args.log_level)
+
+    # Parse config, or load it from the cache
+    loaded = [load_plant(args, plant, event_log) for plant in plants]
+    metrics = [plant.metrics for plant in loaded]
+
+    if args.metrics_port is not None:
+        start_http_server(
+            args.metrics_port, lambda: render_prometheus(metrics)
+        )
+    if args.metrics_interval is not None:
+        if args.plants is None:
+            start_snapshots(args.metrics_interval, metrics[0].render_text)
+        else:
+            start_snapshots(
+                args.metrics_interval,
+                lambda: "\n".join(
+                    f"{plant.name}: {plant.metrics.render_text()}"
+                    for plant in loaded
+                ),
+            )
+
+    if args.slowest is not None:
+        for m in metrics:
+            m.slowest = SlowestTicks(args.slowest)
+    sampler = None
+    if args.profile is not None:
+        sampler = Sampler(args.profile_interval)
+
+    # Start controllers
+    if event_log is not None:
+        event_log.start()
+    if sampler is not None:
+        sampler.start()
+    try:
+        if args.plants is not None:
+            print(f"Controlling {len(plants)} FlexFact plants")
+            coroutines = [run_plant(plant) for plant in loaded]
+            if sampler is not None:
+                for coroutine in coroutines:
+                    sampler.watch(coroutine)
+            asyncio.run(run_plants(coroutines))
+        elif args.replay is not None:
+            # There is no address nor Modbus settings when replaying
+            replay(args.replay, event_log, loaded[0])
+        elif args.use_async:
+            coroutine = run_async(loaded[0])
+            if sampler is not None:
+                sampler.watch(coroutine)
+            asyncio.run(coroutine)
+        else:
+            run(loaded[0])
+    except KeyboardInterrupt:
+        closing_message()
+    finally:
+        for plant in loaded:
+            if plant.recorder is not None:
+                plant.recorder.close()
+            if plant.journal is not None:
+                plant.journal.close(plant.petri_network.get_marking())
+            if plant.live is not None:
+                plant.live.close()
+        if event_log is not None:
+            event_log.close()
+            if args.log is not None:
+                event_log.file.close()
+        if sampler is not None:
+            sampler.stop()
+            sampler.write(args.profile)
+            print(
+                f"Wrote {args.profile}: {sum(sampler.stacks.values())} of"
+                f" {sampler.samples} samples in the loops"
+            )
+        if args.slowest is not None:
+            for plant in loaded:
+                prefix = f"[{plant.name}] " if plant.name else ""
+                print(f"{prefix}{plant.metrics.slowest.render_text()}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,295 @@
+import threading
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import (
+    TYPE_CHECKING,
+    Callable,
+    Dict,
+    List,
+    Sequence,
+    Tuple,
+    Union,
+)
+
+from modbus.client import ModbusStats
+
+if TYPE_CHECKING:
+    from profiler import SlowestTicks
+
+
+PREFIX = "flexfact_tina"
+
+# Upper bounds (in seconds) of the latency histogram buckets
+LATENCY_BUCKETS_S = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+)
+
+PHASES = ("read", "evaluate", "write", "tick")
+
+
+class Histogram:
+    """Fixed buckets histogram, cheap enough to be updated every loop."""
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS_S):
+        self.buckets = tuple(buckets)
+        # The last count is for the values above every bucket (+Inf)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the [q] quantile."""
+        if self.count == 0:
+            return 0.0
+
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+def escape_label(value: str) -> str:
+    return (
+        value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    )
+
+
+def format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return (
+        "{"
+        + ",".join(f'{k}="{escape_label(v)}"' for k, v in labels.items())
+        + "}"
+    )
+
+
+class Metrics:
+    """Metrics of a controller: per phase loop latencies, Modbus counters
+    and per transition enabling checks and firings."""
+
+    def __init__(
+        self,
+        transition_names: List[str],
+        modbus: Union[ModbusStats, None] = None,
+        labels: Union[Dict[str, str], None] = None,
+    ):
+        self.transition_names = transition_names
+        self.modbus = modbus if modbus is not None else ModbusStats()
+        self.labels = labels if labels is not None else {}
+
+        self.phases = {phase: Histogram() for phase in PHASES}
+        self.ticks = 0
+
+        # Indexed as the transitions of the net
+        self.checks = [0] * len(transition_names)
+        self.fired = [0] * len(transition_names)
+
+        # Optional record of the slowest loops, see --slowest
+        self.slowest: Union["SlowestTicks", None] = None
+
+    def observe_tick(self, read: float, evaluate: float, write: float):
+        phases = self.phases
+        phases["read"].observe(read)
+        phases["evaluate"].observe(evaluate)
+        phases["write"].observe(write)
+        phases["tick"].observe(read + evaluate + write)
+        if self.slowest is not None:
+            self.slowest.observe(self.ticks, read, evaluate, write)
+        self.ticks += 1
+
+    def modbus_counters(self) -> List[Tuple[str, str, float]]:
+        """(name, help, value) of the Modbus counters."""
+        modbus = self.modbus
+        return [
+            ("requests", "Modbus requests sent", modbus.requests),
+            ("sent_bytes", "Bytes sent to the slave", modbus.bytes_sent),
+            (
+                "received_bytes",
+                "Bytes received from the slave",
+                modbus.bytes_received,
+            ),
+            ("retries", "Modbus requests sent again", modbus.retries),
+            ("timeouts", "Modbus requests without response", modbus.timeouts),
+            ("reconnects", "Reconnections to the slave", modbus.reconnects),
+            (
+                "downtime_seconds",
+                "Time spent reconnecting to the slave",
+                round(modbus.downtime, 6),
+            ),
+        ]
+
+    def render_text(self) -> str:
+        """Short human readable snapshot."""
+        lines = [f"Metrics after {self.ticks} loops:"]
+        for phase, histogram in self.phases.items():
+            mean = histogram.sum / histogram.count if histogram.count else 0
+            lines.append(
+                f"  {phase}: mean {mean * 1000:.3f} ms,"
+                f" p50 <= {histogram.quantile(0.5) * 1000:g} ms,"
+                f" p99 <= {histogram.quantile(0.99) * 1000:g} ms"
+            )
+        lines.append(
+            "  modbus: "
+            + ", ".join(
+                f"{name} {value}" for name, _, value in self.modbus_counters()
+            )
+        )
+
+        busiest = sorted(
+            (i for i, fired in enumerate(self.fired) if fired),
+            key=lambda i: self.fired[i],
+            reverse=True,
+        )[:5]
+        if busiest:
+            lines.append(
+                "  most fired: "
+                + ", ".join(
+                    f"{self.transition_names[i]} ({self.fired[i]})"
+                    for i in busiest
+                )
+            )
+
+        return "\n".join(lines)
+
+    def families(self) -> List[Tuple[str, str, str, List[str]]]:
+        """(name, type, help, samples) of each Prometheus metric family."""
+        families = []
+        labels = self.labels
+
+        name = f"{PREFIX}_tick_phase_seconds"
+        samples = []
+        for phase, histogram in self.phases.items():
+            phase_labels = {**labels, "phase": phase}
+            cumulative = 0
+            bounds = [f"{bound:g}" for bound in histogram.buckets] + ["+Inf"]
+            for bound, count in zip(bounds, histogram.counts):
+                cumulative += count
+                bucket_labels = format_labels({**phase_labels, "le": bound})
+                samples.append(f"{name}_bucket{bucket_labels} {cumulative}")
+            samples.append(
+                f"{name}_sum{format_labels(phase_labels)} {histogram.sum}"
+            )
+            samples.append(
+                f"{name}_count{format_labels(phase_labels)} {histogram.count}"
+            )
+        families.append(
+            (name, "histogram", "Duration of each phase of the loop", samples)
+        )
+
+        for counter, description, value in self.modbus_counters():
+            name = f"{PREFIX}_modbus_{counter}_total"
+            families.append(
+                (
+                    name,
+                    "counter",
+                    description,
+                    [f"{name}{format_labels(labels)} {value}"],
+                )
+            )
+
+        for counter, description, values in (
+            ("checks", "Enabling checks of each transition", self.checks),
+            ("fired", "Firings of each transition", self.fired),
+        ):
+            name = f"{PREFIX}_transition_{counter}_total"
+            samples = []
+            for transition, value in zip(self.transition_names, values):
+                if value:
+                    transition_labels = format_labels(
+                        {**labels, "transition": transition}
+                    )
+                    samples.append(f"{name}{transition_labels} {value}")
+            families.append((name, "counter", description, samples))
+
+        return families
+
+    def render_prometheus(self) -> str:
+        """Snapshot in the Prometheus text exposition format."""
+        return render_prometheus([self])
+
+
+def render_prometheus(metrics: List[Metrics]) -> str:
+    """Snapshot of several controllers in the Prometheus text exposition
+    format, each family once with the samples of all of them (they should
+    have different labels)."""
+    families: Dict[str, Tuple[str, str, List[str]]] = {}
+    for m in metrics:
+        for name, kind, description, samples in m.families():
+            families.setdefault(name, (kind, description, []))[2].extend(
+                samples
+            )
+
+    lines = []
+    for name, (kind, description, samples) in families.items():
+        lines.append(f"# HELP {name} {description}.")
+        lines.append(f"# TYPE {name} {kind}")
+        lines.extend(samples)
+    return "\n".join(lines) + "\n"
+
+
+def start_http_server(
+    port: int,
+    render: Callable[[], str],
+    host: str = "127.0.0.1",
+) -> ThreadingHTTPServer:
+    """Serve [render] on /metrics from a background thread."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_error(404)
+                return
+
+            body = render().encode()
+            self.send_response(200)
+            self.send_header(
+                "Content-Type", "text/plain; version=0.0.4; charset=utf-8"
+            )
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *_):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def start_snapshots(
+    period: float, render: Callable[[], str]
+) -> threading.Event:
+    """Print [render] every [period] seconds from a background thread,
+    until the returned event is set."""
+    stop = threading.Event()
+
+    def run():
+        while not stop.wait(period):
+            print(render())
+
+    threading.Thread(target=run, daemon=True).start()
+    return stop
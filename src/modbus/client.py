@@ -1,20 +1,96 @@
-from typing import Tuple
-from pymodbus.client import ModbusTcpClient
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Iterator, Tuple, Union
+from pymodbus.client import AsyncModbusTcpClient, ModbusTcpClient
+from pymodbus.exceptions import ModbusIOException
+from pymodbus.pdu import ModbusPDU, ModbusResponse
 from pymodbus.transaction import ModbusSocketFramer
 
 
 # Default modbus connection
 DEFAULT_IP = "localhost"
 DEFAULT_PORT = 1502
+DEFAULT_RETRIES = 3
+
+# Delays between reconnection attempts, doubling after each failed one from
+# a few milliseconds, so a transient disconnection costs a few round-trips
+# while a slave that is down isn't flooded
+RECONNECT_MIN_DELAY_S = 0.002
+RECONNECT_MAX_DELAY_S = 1.5
+
+# Size of the Modbus TCP header (MBAP) and function code
+ADU_OVERHEAD = 8
+
+
+@dataclass
+class ModbusStats:
+    """Counters of the Modbus transactions of a client."""
+
+    requests: int = 0
+    bytes_sent: int = 0
+    bytes_received: int = 0
+    retries: int = 0
+    timeouts: int = 0
+    reconnects: int = 0
+
+    # Seconds spent reconnecting
+    downtime: float = 0.0
+
+
+def bytes_of_bits(bits: int) -> int:
+    return (bits + 7) // 8
+
+
+def adu_size(pdu: ModbusPDU) -> int:
+    """Size on the wire of a Modbus TCP request or response.
+
+    The PDUs of the controllers are sized from their function code and
+    number of bits, only other ones are encoded again to be measured.
+    """
+    code = pdu.function_code
+    response = isinstance(pdu, ModbusResponse)
+    if code & 0x80:
+        # Exception code
+        size = 1
+    elif code in (0x01, 0x02):
+        # Read coils or discrete inputs: address and count, answered by a
+        # byte count and the bits
+        size = 1 + bytes_of_bits(len(pdu.bits)) if response else 4
+    elif code == 0x05:
+        # Write a coil: address and value, echoed back
+        size = 4
+    elif code == 0x0F:
+        # Write coils: address, count, byte count and the bits, answered
+        # by the address and count
+        size = 4 if response else 5 + bytes_of_bits(len(pdu.values))
+    else:
+        size = len(pdu.encode())
+    return ADU_OVERHEAD + size
+
+
+def reconnect_delays() -> Iterator[float]:
+    """Delays to wait after each failed reconnection attempt."""
+    delay = RECONNECT_MIN_DELAY_S
+    while True:
+        yield delay
+        delay = min(delay * 2, RECONNECT_MAX_DELAY_S)
 
 
 class ModbusClient(ModbusTcpClient):
     def __init__(
         self,
         address: Tuple[str, int] = (DEFAULT_IP, DEFAULT_PORT),
+        stats: Union[ModbusStats, None] = None,
+        retries: int = DEFAULT_RETRIES,
     ):
         ip, port = address
 
+        # Requests are retried here rather than by pymodbus, so they can be
+        # counted
+        self.stats = stats if stats is not None else ModbusStats()
+        self.max_retries = retries
+
         super().__init__(
             host=ip,
             port=port,
@@ -22,7 +98,7 @@ class ModbusClient(ModbusTcpClient):
             retry_on_empty=True,
             close_on_comm_error=False,
             timeout=1,
-            retries=3,
+            retries=0,
         )
 
         # Try to connect
@@ -32,8 +108,125 @@ class ModbusClient(ModbusTcpClient):
                 "Is Modbus selected on the Simulation menu?"
             )
 
+    def execute(self, request=None):
+        stats = self.stats
+        for attempt in range(self.max_retries + 1):
+            if attempt > 0:
+                stats.retries += 1
+            stats.requests += 1
+            stats.bytes_sent += adu_size(request)
+
+            response = super().execute(request)
+
+            # No response, pymodbus returns the exception
+            if isinstance(response, ModbusIOException):
+                stats.timeouts += 1
+                continue
+
+            stats.bytes_received += adu_size(response)
+            break
+
+        return response
+
+    def reconnect(self):
+        """Close the connection and open it again, retrying with a growing
+        delay until it succeeds."""
+        start = time.perf_counter()
+        self.close()
+        for delay in reconnect_delays():
+            if self.connect():
+                break
+            time.sleep(delay)
+
+        self.stats.reconnects += 1
+        self.stats.downtime += time.perf_counter() - start
+
     def __enter__(self):
         return self
 
     def __exit__(self, *_):
         self.close()
+
+
+class AsyncModbusClient(AsyncModbusTcpClient):
+    """Asyncio counterpart of [ModbusClient]. Several requests can be in
+    flight at the same time, each one is matched to its response by the
+    transaction id."""
+
+    def __init__(
+        self,
+        address: Tuple[str, int] = (DEFAULT_IP, DEFAULT_PORT),
+        stats: Union[ModbusStats, None] = None,
+        retries: int = DEFAULT_RETRIES,
+    ):
+        ip, port = address
+
+        self.stats = stats if stats is not None else ModbusStats()
+        self.max_retries = retries
+
+        super().__init__(
+            host=ip,
+            port=port,
+            framer=ModbusSocketFramer,  # type: ignore
+            retry_on_empty=True,
+            close_on_comm_error=False,
+            timeout=1,
+            retries=0,
+            reconnect_delay=0,  # Reconnection is handled by the caller
+        )
+
+    def execute(self, request=None):
+        return self._execute_counted(request)
+
+    async def _execute_counted(self, request):
+        stats = self.stats
+        for attempt in range(self.max_retries + 1):
+            if attempt > 0:
+                stats.retries += 1
+            stats.requests += 1
+            stats.bytes_sent += adu_size(request)
+
+            try:
+                response = await super().execute(request)
+            except asyncio.TimeoutError:
+                stats.timeouts += 1
+                if attempt == self.max_retries:
+                    raise
+                continue
+
+            stats.bytes_received += adu_size(response)
+            return response
+
+    async def reconnect(self):
+        """[ModbusClient.reconnect] without blocking the event loop."""
+        start = time.perf_counter()
+
+        # The transport is closed directly, as close() waits a fixed 100 ms
+        # for the connection to be lost
+        if self.protocol is not None and self.protocol.transport:
+            self.protocol.transport.close()
+        while self.connected:
+            await asyncio.sleep(0)
+
+        for delay in reconnect_delays():
+            await self.connect()
+            if self.connected:
+                break
+            await asyncio.sleep(delay)
+
+        self.stats.reconnects += 1
+        self.stats.downtime += time.perf_counter() - start
+
+    async def __aenter__(self):
+        # Try to connect
+        await self.connect()
+        if not self.connected:
+            raise ConnectionAbortedError(
+                "Unable to connect to modbus socket, is FlexFact open? "
+                "Is Modbus selected on the Simulation menu?"
+            )
+
+        return self
+
+    async def __aexit__(self, *_):
+        await self.close()
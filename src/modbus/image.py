@@ -0,0 +1,112 @@
+from typing import Dict, List, Tuple, Union
+from pymodbus.client import ModbusTcpClient
+from pymodbus.exceptions import ModbusException
+
+from modbus.ranges import MAX_READ_BITS, MAX_WRITE_COILS, coalesce
+
+
+class CoilImage:
+    """Shadow copy of the coils, used to batch the writes of a loop.
+
+    Actions are staged during the loop and only sent on [flush]. When the
+    same coil is set and cleared in one loop the last staged action wins,
+    the same final value the coil would have if every action was written
+    in order. Coils already holding the staged value are not written.
+    """
+
+    def __init__(self, mbaddr: int = 0, max_count: int = MAX_WRITE_COILS):
+        self.mbaddr = mbaddr
+        self.max_count = max_count
+
+        # Last value known to be on the bus, by event address. Coils that
+        # were never read nor written are unknown and always written
+        self.values: Dict[int, bool] = {}
+        self.pending: Dict[int, bool] = {}
+
+    def stage(self, address: int, value: bool):
+        """Stage a write, overriding any earlier action on the coil."""
+        self.pending[address] = value
+
+    def changes(self) -> Dict[int, bool]:
+        """Staged writes that actually change a coil."""
+        return {
+            address: value
+            for address, value in self.pending.items()
+            if self.values.get(address) is not value
+        }
+
+    def write_ranges(self) -> List[Tuple[int, List[bool]]]:
+        """Group the changes into contiguous (Modbus address, values)
+        ranges, each one a single write_coils request."""
+        changes = self.changes()
+        return [
+            (
+                self.mbaddr + start,
+                [changes[address] for address in range(start, start + count)],
+            )
+            for start, count in coalesce(changes, 0, self.max_count)
+        ]
+
+    def sync_ranges(self, count: int) -> List[Tuple[int, int]]:
+        """(offset, count) ranges to read to sync the first [count] coils."""
+        return [
+            (start, min(MAX_READ_BITS, count - start))
+            for start in range(0, count, MAX_READ_BITS)
+        ]
+
+    def load(self, start: int, bits: List[bool], count: int):
+        """Update the known values from a read of [count] coils starting at
+        offset [start]."""
+        for offset in range(count):
+            self.values[start + offset] = bool(bits[offset])
+
+    def commit(self):
+        """Mark the staged writes as sent."""
+        self.values.update(self.pending)
+        self.pending.clear()
+
+    def take(self) -> Dict[int, bool]:
+        """Unstage the writes to send them, while new ones are staged.
+        Once sent, they are marked with [sent], or staged again with
+        [restore] if it failed."""
+        taken = self.pending
+        self.pending = {}
+        return taken
+
+    def sent(self, taken: Dict[int, bool]):
+        self.values.update(taken)
+
+    def restore(self, taken: Dict[int, bool]):
+        for address, value in taken.items():
+            self.pending.setdefault(address, value)
+
+    def sync(self, client: ModbusTcpClient, count: int):
+        """Read the current values of the first [count] coils."""
+        for start, size in self.sync_ranges(count):
+            try:
+                response = client.read_coils(self.mbaddr + start, size)
+                if response.isError():
+                    raise ModbusException(str(response))
+            except ModbusException as e:
+                raise ConnectionResetError("Can't read coils") from e
+
+            self.load(start, response.bits, size)
+
+    def flush(self, client: ModbusTcpClient) -> int:
+        """Write the staged changes, returning the number of requests."""
+        ranges = self.write_ranges()
+        for start, values in ranges:
+            try:
+                response = client.write_coils(start, values)
+                if response.isError():
+                    raise ModbusException(str(response))
+            except ModbusException as e:
+                raise ConnectionResetError("Can't write to coils") from e
+
+        self.commit()
+
+        return len(ranges)
+
+    def get(self, address: int) -> Union[bool, None]:
+        """Value a coil will hold after the next flush, None if unknown."""
+        return self.pending.get(address, self.values.get(address))
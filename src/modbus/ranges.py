@@ -0,0 +1,47 @@
+from typing import Iterable, List, Tuple
+
+
+# Limits from the Modbus application protocol specification
+MAX_READ_BITS = 2000
+MAX_WRITE_COILS = 1968
+
+# Default merging policy: reading a few unused bits is much cheaper than
+# an extra round-trip, so nearby addresses are read together
+DEFAULT_MAX_GAP = 64
+
+
+def coalesce(
+    addresses: Iterable[int],
+    max_gap: int = DEFAULT_MAX_GAP,
+    max_count: int = MAX_READ_BITS,
+) -> List[Tuple[int, int]]:
+    """Group addresses into as few (start, count) ranges as possible.
+
+    Two addresses end up in the same range when there are at most
+    [max_gap] unused addresses between them and the resulting range is
+    no longer than [max_count].
+    """
+    if max_gap < 0:
+        raise ValueError("Maximum gap must be positive or zero.")
+    if max_count < 1:
+        raise ValueError("Maximum range size must be at least one.")
+
+    ranges = []
+    start = end = None
+    for address in sorted(set(addresses)):
+        if (
+            start is not None
+            and address - end - 1 <= max_gap
+            and address - start < max_count
+        ):
+            end = address
+            continue
+
+        if start is not None:
+            ranges.append((start, end - start + 1))
+        start = end = address
+
+    if start is not None:
+        ranges.append((start, end - start + 1))
+
+    return ranges
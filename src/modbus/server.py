@@ -0,0 +1,189 @@
+import asyncio
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple, Union
+
+from pymodbus.datastore import (
+    ModbusSequentialDataBlock,
+    ModbusServerContext,
+    ModbusSlaveContext,
+)
+from pymodbus.server.async_io import ModbusTcpServer
+from pymodbus.transaction import ModbusSocketFramer
+
+from parsers import device
+from parsers.device import InputEvent, OutputEvent, RemoteImage
+
+
+class CoilBlock(ModbusSequentialDataBlock):
+    """Coils data block calling [on_write] with every write received."""
+
+    def __init__(
+        self,
+        address: int,
+        values: List[bool],
+        on_write: Callable[[int, List[bool]], None],
+    ):
+        super().__init__(address, values)
+        self.on_write = on_write
+
+    def setValues(self, address, values):  # noqa: N802
+        super().setValues(address, values)
+        self.on_write(address, list(values))
+
+
+class FlexFactStandIn:
+    """Modbus TCP slave standing in for FlexFact, exposing the discrete
+    inputs and coils declared by a device file.
+
+    Sensor edges can be applied by event name or by address, and every edge
+    and coil write is timestamped so the latency of a controller can be
+    measured.
+    """
+
+    def __init__(
+        self,
+        inputs: Dict[str, InputEvent],
+        outputs: Dict[str, OutputEvent],
+        remote_image: RemoteImage,
+        address: Tuple[str, int],
+    ):
+        self.inputs = inputs
+        self.outputs = outputs
+        self.remote_image = remote_image
+        self.address = address
+
+        self.discrete_inputs = ModbusSequentialDataBlock(
+            remote_image.inputs.mbaddr, [False] * remote_image.inputs.count
+        )
+        self.coils = CoilBlock(
+            remote_image.outputs.mbaddr,
+            [False] * remote_image.outputs.count,
+            self._on_coil_write,
+        )
+        self.context = ModbusServerContext(
+            slaves=ModbusSlaveContext(
+                di=self.discrete_inputs, co=self.coils, zero_mode=True
+            ),
+            single=True,
+        )
+
+        # (time, address, value) of every input edge and (time, address,
+        # values) of every coil write, addresses as in the device file
+        self.edges: List[Tuple[float, int, bool]] = []
+        self.coil_writes: List[Tuple[float, int, List[bool]]] = []
+        self.on_coil_write: Union[
+            Callable[[float, int, List[bool]], None], None
+        ] = None
+
+        self.server: Union[ModbusTcpServer, None] = None
+
+    @classmethod
+    def from_device(
+        cls,
+        filepath: Union[Path, str],
+        address: Union[Tuple[str, int], None] = None,
+    ) -> "FlexFactStandIn":
+        """Stand in for the slave of a device file, by default listening on
+        its SlaveAddress."""
+        slave_address, inputs, outputs, remote_image, _ = device.parse(
+            filepath
+        )
+        return cls(
+            inputs,
+            outputs,
+            remote_image,
+            address if address is not None else slave_address,
+        )
+
+    def _on_coil_write(self, mbaddr: int, values: List[bool]):
+        now = time.perf_counter()
+        address = mbaddr - self.remote_image.outputs.mbaddr
+        self.coil_writes.append((now, address, values))
+        if self.on_coil_write is not None:
+            self.on_coil_write(now, address, values)
+
+    def get_input(self, address: int) -> bool:
+        mbaddr = self.remote_image.inputs.to_modbus(address)
+        return bool(self.discrete_inputs.getValues(mbaddr)[0])
+
+    def set_input(self, address: int, value: bool):
+        """Set a sensor, recording an edge if its value changes."""
+        mbaddr = self.remote_image.inputs.to_modbus(address)
+        if bool(self.discrete_inputs.getValues(mbaddr)[0]) != value:
+            self.discrete_inputs.setValues(mbaddr, [value])
+            self.edges.append((time.perf_counter(), address, value))
+
+    def get_coil(self, address: int) -> bool:
+        mbaddr = self.remote_image.outputs.to_modbus(address)
+        return bool(self.coils.getValues(mbaddr)[0])
+
+    def apply(self, step: str):
+        """Apply a script step: either an input event name, setting the
+        sensor of its first trigger to the value after the edge, or an
+        'address=value' assignment. There is no edge when the sensor
+        already has that value."""
+        if "=" in step:
+            raw_address, raw_value = step.split("=", 1)
+            value = raw_value.strip().lower() in ("1", "true")
+            self.set_input(int(raw_address), value)
+            return
+
+        event = self.inputs.get(step)
+        if event is None or not event.triggers:
+            raise ValueError(f"Unknown input event '{step}'")
+
+        trigger = event.triggers[0]
+        value = trigger.type == device.TriggerTypes.POSITIVE_EDGE
+        self.set_input(trigger.address, value)
+
+    async def replay(self, script: List[Tuple[float, str]]):
+        """Apply the (time in seconds, step) pairs of a script, times
+        relative to the start of the replay."""
+        start = time.perf_counter()
+        for at, step in script:
+            delay = start + at - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self.apply(step)
+
+    async def serve(self):
+        """Serve until cancelled."""
+        self.server = ModbusTcpServer(
+            self.context,
+            ModbusSocketFramer,
+            None,
+            self.address,
+            allow_reuse_address=True,
+        )
+        try:
+            await self.server.serve_forever()
+        finally:
+            await self.server.shutdown()
+
+    async def started(self):
+        """Wait until the server accepts connections."""
+        while self.server is None:
+            await asyncio.sleep(0.01)
+        await self.server.serving
+
+
+def parse_script(filepath: Union[Path, str]) -> List[Tuple[float, str]]:
+    """Parse a script of sensor edges, one '<time in seconds> <step>' per
+    line, see [FlexFactStandIn.apply]. Empty lines and lines starting with
+    # are ignored."""
+    script = []
+    with open(filepath, "r") as file:
+        for number, line in enumerate(file, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+
+            parts = line.split(None, 1)
+            if len(parts) != 2:
+                raise ValueError(
+                    f"{filepath}:{number}: expected '<time> <step>'"
+                )
+            script.append((float(parts[0]), parts[1].strip()))
+
+    return sorted(script, key=lambda step: step[0])
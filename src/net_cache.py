@@ -0,0 +1,455 @@
+import gc
+import hashlib
+import mmap
+import os
+import pickle
+import struct
+from array import array
+from pathlib import Path
+from typing import Dict, List, Tuple, Union
+
+import petri_net
+import special_tokens
+import transition_index
+from parsers import device, network
+from parsers.device import InputEvent, OutputEvent, RemoteImage, Timing
+from petri_net import (
+    InputArc,
+    InputArcTypes,
+    OutputArc,
+    PetriNet,
+    Place,
+    Transition,
+)
+from transition_index import TransitionIndex
+
+
+MAGIC = b"FTNC"
+VERSION = 2
+
+# Magic, version, digests of the net and device files and of the code,
+# then the number of places, transitions, input arcs and output arcs, and
+# the sizes of the place names, transition names and pickled sections
+HEADER = struct.Struct("<4sH32s32s32sIIIIIII")
+ALIGNMENT = 8
+
+ARC_TYPES = (
+    InputArcTypes.REGULAR,
+    InputArcTypes.READ,
+    InputArcTypes.INHIBITOR,
+)
+ARC_TYPE_IDS = {arc_type: i for i, arc_type in enumerate(ARC_TYPES)}
+
+# Test and whether the weight is consumed, by arc type, taken from arcs
+# built the usual way so they can't disagree with [InputArc]
+ARC_BEHAVIOURS = [
+    (arc._test, arc._consumed == 1)
+    for arc in (InputArc(Place("", 0), 1, t) for t in ARC_TYPES)
+]
+
+Device = Tuple[
+    Tuple[str, int],
+    Dict[str, InputEvent],
+    Dict[str, OutputEvent],
+    RemoteImage,
+    Timing,
+]
+
+
+def file_digest(filepath: Union[Path, str]) -> bytes:
+    with open(filepath, "rb") as file:
+        return hashlib.sha256(file.read()).digest()
+
+
+# Modules whose classes are pickled in a cache, or which decide what the
+# net and the index built from the files are
+CACHED_MODULES = (
+    petri_net,
+    transition_index,
+    special_tokens,
+    device,
+    network,
+)
+
+_code_digest: Union[bytes, None] = None
+
+
+def code_digest() -> bytes:
+    """Fingerprint of the source of [CACHED_MODULES] and of this one, so
+    a cache written by another version of the code is built again.
+    Raises OSError when a source can't be read."""
+    global _code_digest
+    if _code_digest is None:
+        digest = hashlib.sha256()
+        for filepath in [m.__file__ for m in CACHED_MODULES] + [__file__]:
+            digest.update(file_digest(filepath))
+        _code_digest = digest.digest()
+    return _code_digest
+
+
+def cache_path(net_path: Union[Path, str]) -> Path:
+    """The cache lives next to the net, eg. plant.net.cache"""
+    path = Path(net_path)
+    return path.with_name(path.name + ".cache")
+
+
+def padding(size: int) -> int:
+    return -size % ALIGNMENT
+
+
+# Arrays stored after the names and the pickled section, by name and
+# typecode. Their length depends on the number of places, transitions,
+# input arcs or output arcs
+SECTIONS = [
+    ("tokens", "q"),
+    ("intervals", "I"),
+    ("input_ptr", "I"),
+    ("input_place", "I"),
+    ("input_weight", "q"),
+    ("input_type", "B"),
+    ("output_ptr", "I"),
+    ("output_place", "I"),
+    ("output_weight", "q"),
+]
+
+
+def section_sizes(
+    places: int, transitions: int, inputs: int, outputs: int
+) -> List[int]:
+    """Size in bytes of each of the SECTIONS, without padding."""
+    counts = [
+        places,
+        transitions,
+        transitions + 1,
+        inputs,
+        inputs,
+        inputs,
+        transitions + 1,
+        outputs,
+        outputs,
+    ]
+    return [
+        array(typecode).itemsize * count
+        for (_, typecode), count in zip(SECTIONS, counts)
+    ]
+
+
+def write(
+    filepath: Union[Path, str],
+    net_digest: bytes,
+    device_digest: bytes,
+    petri_network: PetriNet,
+    parsed_device: Device,
+    index: TransitionIndex,
+    code: bytes,
+):
+    places = {place.name: i for i, place in enumerate(petri_network.places)}
+    transitions = petri_network.transitions
+
+    intervals: Dict = {}
+    arrays: Dict[str, array] = {
+        "tokens": array("q", [place.tokens for place in petri_network.places]),
+        "intervals": array(
+            "I",
+            [
+                intervals.setdefault(t.interval, len(intervals))
+                for t in transitions
+            ],
+        ),
+        "input_ptr": array("I", [0]),
+        "input_place": array("I"),
+        "input_weight": array("q"),
+        "input_type": array("B"),
+        "output_ptr": array("I", [0]),
+        "output_place": array("I"),
+        "output_weight": array("q"),
+    }
+    for transition in transitions:
+        for arc in transition.input_arcs:
+            arrays["input_place"].append(places[arc.place.name])
+            arrays["input_weight"].append(arc.weight)
+            arrays["input_type"].append(ARC_TYPE_IDS[arc.type])
+        arrays["input_ptr"].append(len(arrays["input_place"]))
+        for arc in transition.output_arcs:
+            arrays["output_place"].append(places[arc.place.name])
+            arrays["output_weight"].append(arc.weight)
+        arrays["output_ptr"].append(len(arrays["output_place"]))
+
+    # Everything else is small, or plain enough for pickle to be fast
+    extra = pickle.dumps(
+        (
+            petri_network.name,
+            petri_network.notes,
+            petri_network.priorities,
+            list(intervals),
+            {p.name: p.label for p in petri_network.places if p.label},
+            {t.name: t.label for t in transitions if t.label},
+            {
+                t.name: [
+                    (
+                        places[arc.place.name],
+                        arc.weight,
+                        ARC_TYPE_IDS[arc.type],
+                    )
+                    for arc in t.stopwatch_arcs
+                ]
+                for t in transitions
+                if t.stopwatch_arcs
+            },
+            parsed_device,
+            index,
+        ),
+        protocol=pickle.HIGHEST_PROTOCOL,
+    )
+    place_names = "\n".join(places).encode()
+    transition_names = "\n".join(t.name for t in transitions).encode()
+
+    path = Path(filepath)
+    temporary = path.with_name(path.name + ".tmp")
+    with open(temporary, "wb") as file:
+        file.write(
+            HEADER.pack(
+                MAGIC,
+                VERSION,
+                net_digest,
+                device_digest,
+                code,
+                len(places),
+                len(transitions),
+                len(arrays["input_place"]),
+                len(arrays["output_place"]),
+                len(place_names),
+                len(transition_names),
+                len(extra),
+            )
+        )
+        file.write(bytes(padding(HEADER.size)))
+        for blob in (place_names, transition_names, extra):
+            file.write(blob)
+            file.write(bytes(padding(len(blob))))
+        for key, _ in SECTIONS:
+            raw = arrays[key].tobytes()
+            file.write(raw)
+            file.write(bytes(padding(len(raw))))
+
+    # Readers either see the old cache or the complete new one
+    os.replace(temporary, path)
+
+
+def read(
+    filepath: Union[Path, str],
+    net_digest: bytes,
+    device_digest: bytes,
+    code: bytes,
+) -> Union[Tuple[PetriNet, Device, TransitionIndex], None]:
+    """Load a cache, None if it is missing, stale or unreadable."""
+    # Hundreds of thousands of objects are created and none is garbage, so
+    # the collector would only walk them over and over
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        with open(filepath, "rb") as file:
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                return load(data, net_digest, device_digest, code)
+    except (OSError, ValueError, EOFError, pickle.UnpicklingError):
+        return None
+    finally:
+        if enabled:
+            gc.enable()
+
+
+# The cached values are ints already, so the objects are built without
+# their __post_init__, which would take most of the time on large nets
+def new_place(name: str, tokens: int, new=object.__new__) -> Place:
+    place = new(Place)
+    place.name = name
+    place.tokens = tokens
+    place.label = None
+    return place
+
+
+def new_input_arc(
+    place: Place, weight: int, type_id: int, new=object.__new__
+) -> InputArc:
+    arc = new(InputArc)
+    arc.place = place
+    arc.weight = weight
+    arc.type = ARC_TYPES[type_id]
+    arc._test, consumes = ARC_BEHAVIOURS[type_id]
+    arc._consumed = weight if consumes else 0
+    return arc
+
+
+def new_output_arc(place: Place, weight: int, new=object.__new__) -> OutputArc:
+    arc = new(OutputArc)
+    arc.place = place
+    arc.weight = weight
+    return arc
+
+
+def load(
+    data: mmap.mmap, net_digest: bytes, device_digest: bytes, code: bytes
+) -> Union[Tuple[PetriNet, Device, TransitionIndex], None]:
+    if len(data) < HEADER.size:
+        return None
+    (
+        magic,
+        version,
+        cached_net,
+        cached_device,
+        cached_code,
+        place_count,
+        transition_count,
+        input_count,
+        output_count,
+        place_names_size,
+        transition_names_size,
+        extra_size,
+    ) = HEADER.unpack_from(data)
+    if (magic, version, cached_net, cached_device, cached_code) != (
+        MAGIC,
+        VERSION,
+        net_digest,
+        device_digest,
+        code,
+    ):
+        return None
+
+    sizes = section_sizes(
+        place_count, transition_count, input_count, output_count
+    )
+    blob_sizes = (place_names_size, transition_names_size, extra_size)
+    offset = HEADER.size + padding(HEADER.size)
+    end = offset + sum(
+        size + padding(size) for size in blob_sizes + tuple(sizes)
+    )
+    if len(data) < end:
+        return None
+
+    blobs = []
+    for size in blob_sizes:
+        blobs.append(data[offset : offset + size])
+        offset += size + padding(size)
+    place_names = blobs[0].decode().split("\n") if place_count else []
+    transition_names = (
+        blobs[1].decode().split("\n") if transition_count else []
+    )
+    (
+        name,
+        notes,
+        priorities,
+        intervals,
+        place_labels,
+        transition_labels,
+        stopwatch_arcs,
+        parsed_device,
+        index,
+    ) = pickle.loads(blobs[2])
+
+    # The arrays are copied from the mapped file in one go each, without
+    # any parsing
+    arrays = {}
+    with memoryview(data) as view:
+        for (key, typecode), size in zip(SECTIONS, sizes):
+            arrays[key] = array(typecode)
+            arrays[key].frombytes(view[offset : offset + size])
+            offset += size + padding(size)
+
+    places = list(map(new_place, place_names, arrays["tokens"]))
+    input_arcs = list(
+        map(
+            new_input_arc,
+            map(places.__getitem__, arrays["input_place"]),
+            arrays["input_weight"],
+            arrays["input_type"],
+        )
+    )
+    output_arcs = list(
+        map(
+            new_output_arc,
+            map(places.__getitem__, arrays["output_place"]),
+            arrays["output_weight"],
+        )
+    )
+    input_ptr = arrays["input_ptr"]
+    output_ptr = arrays["output_ptr"]
+    transitions = [
+        Transition(
+            transition_name,
+            input_arcs[input_ptr[i] : input_ptr[i + 1]],
+            output_arcs[output_ptr[i] : output_ptr[i + 1]],
+            intervals[k],
+        )
+        for i, (transition_name, k) in enumerate(
+            zip(transition_names, arrays["intervals"])
+        )
+    ]
+
+    for place in places:
+        if place.name in place_labels:
+            place.label = place_labels[place.name]
+    for transition in transitions:
+        if transition.name in transition_labels:
+            transition.label = transition_labels[transition.name]
+        if transition.name in stopwatch_arcs:
+            transition.stopwatch_arcs = tuple(
+                InputArc(places[p], weight, ARC_TYPES[arc_type])
+                for p, weight, arc_type in stopwatch_arcs[transition.name]
+            )
+
+    petri_network = PetriNet(places, transitions, name)
+    petri_network.notes = notes
+    petri_network.priorities = priorities
+    return petri_network, parsed_device, index
+
+
+def load_inputs(
+    net_path: Union[Path, str],
+    device_path: Union[Path, str],
+    use_cache: bool = True,
+) -> Tuple[PetriNet, Device, TransitionIndex]:
+    """Parse a net and a device file, with the transition index binding
+    them, from the cache next to the net when it was built from the same
+    files, parsing them and updating the cache otherwise.
+
+    The cache is only an optimization: failing to write it is ignored, and
+    it isn't used when the source of the code can't be read to tell which
+    version wrote it. Like the inputs it is built from, it should only be
+    writable by whoever runs the controller, as it is unpickled.
+    """
+    code = None
+    if use_cache:
+        try:
+            code = code_digest()
+        except (OSError, TypeError):
+            pass
+    if code is None:
+        petri_network = network.parse(net_path)
+        parsed_device = device.parse(device_path)
+        _, inputs, outputs, _, _ = parsed_device
+        index = TransitionIndex(petri_network, inputs, outputs)
+        return petri_network, parsed_device, index
+
+    net_digest = file_digest(net_path)
+    device_digest = file_digest(device_path)
+    path = cache_path(net_path)
+    cached = read(path, net_digest, device_digest, code)
+    if cached is not None:
+        return cached
+
+    petri_network, parsed_device, index = load_inputs(
+        net_path, device_path, False
+    )
+    try:
+        write(
+            path,
+            net_digest,
+            device_digest,
+            petri_network,
+            parsed_device,
+            index,
+            code,
+        )
+    except OSError:
+        pass
+    return petri_network, parsed_device, index
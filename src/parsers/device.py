@@ -37,12 +37,86 @@ class OutputEvent:
     actions: List[Tuple[int, bool]] = field(default_factory=list)
 
 
+@dataclass
+class ImageBlock:
+    """A contiguous block of the remote process image. Event addresses
+    are bit offsets inside the block, [mbaddr] is the Modbus address of
+    its first bit."""
+
+    mbaddr: int
+    count: int
+
+    def to_modbus(self, address: int) -> int:
+        """Convert an event address to its Modbus address."""
+        if not 0 <= address < self.count:
+            raise ValueError(
+                f"Address {address} outside of remote image"
+                f" (mbaddr={self.mbaddr}, count={self.count})"
+            )
+        return self.mbaddr + address
+
+
+@dataclass
+class RemoteImage:
+    inputs: ImageBlock
+    outputs: ImageBlock
+
+
+@dataclass
+class Timing:
+    """Timing settings of the device: milliseconds per time unit and
+    sampling period in microseconds."""
+
+    time_scale: Union[int, None] = None
+    sample_interval: Union[int, None] = None
+
+    def sample_period(self) -> Union[float, None]:
+        """Sampling period in seconds, if declared."""
+        if self.sample_interval is None:
+            return None
+        return self.sample_interval / 1e6
+
+
+def parse_int_value(root: ET.Element, path: str) -> Union[int, None]:
+    tag = root.find(path)
+    if tag is None:
+        return None
+
+    raw_value = tag.get("value")
+    assert raw_value is not None, f"Expected {path} value in XML"
+    return int(raw_value)
+
+
+def parse_image_block(
+    root: ET.Element, path: str, addresses: List[int]
+) -> ImageBlock:
+    """Parse a RemoteImage block. Older device files may not declare it,
+    in which case a block starting at zero and covering every used
+    address is assumed."""
+    tag = root.find(path)
+    if tag is None:
+        return ImageBlock(0, max(addresses, default=-1) + 1)
+
+    raw_mbaddr = tag.get("mbaddr")
+    raw_count = tag.get("count")
+    assert raw_mbaddr is not None, f"Expected mbaddr in {path}"
+    assert raw_count is not None, f"Expected count in {path}"
+
+    return ImageBlock(int(raw_mbaddr), int(raw_count))
+
+
 def parse(
     filepath: Union[Path, str]
-) -> Tuple[Tuple[str, int], Dict[str, InputEvent], Dict[str, OutputEvent]]:
+) -> Tuple[
+    Tuple[str, int],
+    Dict[str, InputEvent],
+    Dict[str, OutputEvent],
+    RemoteImage,
+    Timing,
+]:
     """
     Parse config for virtual Modbus XML. It should be exported from flexfact.
-    Returns (inputs, outputs)
+    Returns (address, inputs, outputs, remote_image, timing)
     """
     inputs = {}
     outputs = {}
@@ -67,12 +141,7 @@ def parse(
             event = InputEvent()
             raw_triggers = tag.find("Triggers")
             assert raw_triggers is not None, "Expected Triggers in XML"
-            triggers = [
-                trigger
-                for trigger in raw_triggers.iter()
-                if trigger is not tag.find("Triggers")
-            ]
-            for element in triggers:
+            for element in raw_triggers:
                 raw_address = element.get("address")
                 assert raw_address is not None, "Expected address in XML"
 
@@ -95,12 +164,7 @@ def parse(
             event = OutputEvent()
             raw_actions = tag.find("Actions")
             assert raw_actions is not None, "Expected Actions in XML"
-            actions = [
-                action
-                for action in raw_actions.iter()
-                if action is not tag.find("Actions")
-            ]
-            for element in actions:
+            for element in raw_actions:
                 raw_address = element.get("address")
                 assert raw_address is not None, "Expected address in XML"
                 address = int(raw_address)
@@ -111,4 +175,30 @@ def parse(
                 event.actions.append((address, value))
             outputs[name] = event
 
-    return (slave_ip, slave_port), inputs, outputs
+    # Parse the remote image, checking every event fits inside it
+    remote_image = RemoteImage(
+        parse_image_block(
+            root,
+            "RemoteImage/Inputs",
+            [t.address for e in inputs.values() for t in e.triggers],
+        ),
+        parse_image_block(
+            root,
+            "RemoteImage/Outputs",
+            [a for e in outputs.values() for a, _ in e.actions],
+        ),
+    )
+    for event in inputs.values():
+        for trigger in event.triggers:
+            remote_image.inputs.to_modbus(trigger.address)
+    for event in outputs.values():
+        for address, _ in event.actions:
+            remote_image.outputs.to_modbus(address)
+
+    # Parse timing
+    timing = Timing(
+        parse_int_value(root, "TimeScale"),
+        parse_int_value(root, "SampleInterval"),
+    )
+
+    return (slave_ip, slave_port), inputs, outputs, remote_image, timing
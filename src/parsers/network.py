@@ -1,113 +1,370 @@
+import re
 from pathlib import Path
+from typing import Any, Dict, Iterable, List, Tuple, Union
 
 from petri_net import (
+    UNTIMED,
     InputArc,
     InputArcTypes,
+    Interval,
     OutputArc,
     PetriNet,
     Place,
-    Tokens,
     Transition,
 )
 
 
-def get_or_insert_place(network: PetriNet, place_name: str) -> Place:
-    place = network.get_place(place_name)
-    if not place:
-        place = Place(place_name, Tokens(0))
-        network.add_place(place)
+class NetParseError(ValueError):
+    """Error in a .net file, located by line and column (both from 1)."""
 
-    return place
+    def __init__(
+        self, message: str, filepath: Union[Path, str], line: int, column: int
+    ):
+        super().__init__(f"{filepath}:{line}:{column}: {message}")
+        self.filepath = filepath
+        self.line = line
+        self.column = column
 
 
-def parse(filepath: Path) -> PetriNet:
-    """Parse the text file generated by tina export."""
+# Lines are split into words on spaces, except inside braces, where names
+# may have spaces and escape {, } and \ with a backslash. Most lines have no
+# braces and are split by str.split instead
+WORD = re.compile(r"\{(?:[^\\{}]|\\.)*\}\S*|\{|[^\s{]\S*")
+BRACED = re.compile(r"\{((?:[^\\{}]|\\.)*)\}(.*)")
+ESCAPE = re.compile(r"\\(.)")
 
-    network = PetriNet()
+# Bare names can't have any of the characters of the syntax. Arcs are a
+# name, optionally followed by the arc type and weight
+NAME = re.compile(r"[^\s{}\[\]()*?!:<>\\]+")
+ARC_SUFFIX = r"(?:(\*|\?-|\?|!-|!)(\d+)([KM]?))?"
+BARE_ARC = re.compile(rf"({NAME.pattern}){ARC_SUFFIX}")
+BRACED_ARC = re.compile(rf"\{{((?:[^\\{{}}]|\\.)*)\}}{ARC_SUFFIX}")
+NUMBER = re.compile(r"(\d+)([KM]?)")
 
-    with open(filepath, "r") as file:
-        for line in file:
-            elements = (
-                line.strip()
-                .replace("\n", "")
-                .replace("\r", "")
-                .replace("{", "")
-                .replace("}", "")
-                .split()
-            )
+# Intervals and markings are single words, as written by tina: [0,5] and
+# (1), not [0, 5] or ( 1 )
+INTERVAL = re.compile(r"([\[\]])(\d+),(?:(\d+)|w)([\[\]])")
+
+MULTIPLIERS = {"": 1, "K": 1_000, "M": 1_000_000}
+INPUT_ARCS = {
+    "*": InputArcTypes.REGULAR,
+    "?": InputArcTypes.READ,
+    "?-": InputArcTypes.INHIBITOR,
+}
+STOPWATCH_ARCS = {"!": InputArcTypes.READ, "!-": InputArcTypes.INHIBITOR}
+
+# (name, arc, weight), arc being one of * ? ?- ! !-
+Arc = Tuple[str, str, int]
+
+
+def to_indices(by_name: Dict[str, Any]) -> Dict[str, int]:
+    """Replace the values of a dict with their indices, in place, so a big
+    dict doesn't need to be copied."""
+    for i, name in enumerate(by_name):
+        by_name[name] = i
+    return by_name
+
+
+class NetParser:
+    """Parser of the textual net format of tina (.net files), one line at a
+    time.
+
+    Every description is supported: net, tr, pl, lb, pr and nt, with
+    labels, time intervals, markings and weights with K or M multipliers,
+    and every arc type. Places and transitions are created on their first
+    mention, so arcs may be given from either side. Lines starting with #
+    are comments.
+    """
+
+    def __init__(self, filepath: Union[Path, str] = "<string>"):
+        self.filepath = filepath
+        self.network = PetriNet()
+        self.places: Dict[str, Place] = {}
+        self.transitions: Dict[str, Transition] = {}
+
+        # Intervals are shared by the transitions using the same one
+        self.intervals: Dict[str, Interval] = {"[0,w[": UNTIMED}
+
+        # Line being parsed, to locate errors
+        self.number = 0
+        self.line = ""
 
-            if len(elements) == 0:
+        self.descriptions = {
+            "net": self.parse_net,
+            "tr": self.parse_transition,
+            "pl": self.parse_place,
+            "lb": self.parse_label,
+            "pr": self.parse_priority,
+            "nt": self.parse_note,
+        }
+
+    def error(self, message: str, word: int) -> NetParseError:
+        """Error at the [word]-th word of the current line, or at its end
+        if there are fewer words."""
+        column = len(self.line.rstrip()) + 1
+        for i, match in enumerate(WORD.finditer(self.line)):
+            if i == word:
+                column = match.start() + 1
+                break
+        return NetParseError(message, self.filepath, self.number, column)
+
+    def parse(self, lines: Iterable[str]) -> PetriNet:
+        descriptions = self.descriptions
+        for self.number, line in enumerate(lines, 1):
+            words = WORD.findall(line) if "{" in line else line.split()
+            if not words or words[0][0] == "#":
                 continue
-            elif elements[0] == "tr":
-                transition = Transition(elements[1])
-                arrow_index = elements.index("->")
-                for element in elements[3:arrow_index]:
-                    if "?" in element:
-                        place_name, weight = element.split("?", 1)
-                        place = get_or_insert_place(network, place_name)
-
-                        if int(weight) > 0:
-                            transition.input_arcs.append(
-                                InputArc(
-                                    place,
-                                    Tokens(int(weight)),
-                                    InputArcTypes.READ,
-                                )
-                            )
-                        else:
-                            transition.input_arcs.append(
-                                InputArc(
-                                    place,
-                                    Tokens(abs(int(weight))),
-                                    InputArcTypes.INHIBITOR,
-                                )
-                            )
-                    else:
-                        parts = element.split("*")
-
-                        place_name = parts[0]
-                        place = get_or_insert_place(network, place_name)
-
-                        if len(parts) == 1:
-                            transition.input_arcs.append(
-                                InputArc(
-                                    place, Tokens(1), InputArcTypes.REGULAR
-                                )
-                            )
-                        else:
-                            weight = parts[1]
-                            transition.input_arcs.append(
-                                InputArc(
-                                    place,
-                                    Tokens(int(weight)),
-                                    InputArcTypes.REGULAR,
-                                )
-                            )
-
-                if arrow_index + 1 != len(elements):
-                    for element in elements[arrow_index + 1 :]:
-                        parts = element.split("*")
-
-                        place_name = parts[0]
-                        place = get_or_insert_place(network, place_name)
-
-                        if len(parts) == 1:
-                            transition.output_arcs.append(
-                                OutputArc(place, Tokens(1))
-                            )
-                        else:
-                            weight = parts[1]
-                            transition.output_arcs.append(
-                                OutputArc(place, Tokens(int(weight)))
-                            )
-
-                network.add_transition(transition)
-
-            elif elements[0] == "pl":
-                place_name = elements[1]
-                marking = int(elements[2].replace("(", "").replace(")", ""))
-
-                place = get_or_insert_place(network, place_name)
-                place.tokens = Tokens(marking)
-
-    return network
+
+            self.line = line
+            parse = descriptions.get(words[0])
+            if parse is None:
+                raise self.error(
+                    f"Expected one of {', '.join(descriptions)},"
+                    f" found '{words[0]}'",
+                    0,
+                )
+            parse(words)
+
+        network = self.network
+        network.places = list(self.places.values())
+        network.transitions = list(self.transitions.values())
+        network._place_mapping = to_indices(self.places)
+        network._transition_mapping = to_indices(self.transitions)
+        self.places = {}
+        self.transitions = {}
+        return network
+
+    def name(self, words: List[str], i: int) -> str:
+        if i >= len(words):
+            raise self.error("Expected a name at the end of the line", i)
+        word = words[i]
+        if word[0] == "{":
+            match = BRACED.fullmatch(word)
+            if match is None or match.group(2):
+                raise self.error(f"Invalid name '{word}'", i)
+            name = match.group(1)
+            return ESCAPE.sub(r"\1", name) if "\\" in name else name
+        if NAME.fullmatch(word) is None:
+            raise self.error(f"Invalid name '{word}'", i)
+        return word
+
+    def count(self, value: str, i: int) -> int:
+        match = NUMBER.fullmatch(value)
+        if match is None:
+            raise self.error(f"Expected a number, found '{value}'", i)
+        return int(match.group(1)) * MULTIPLIERS[match.group(2)]
+
+    def interval(self, words: List[str], i: int) -> Interval:
+        value = words[i]
+        interval = self.intervals.get(value)
+        if interval is not None:
+            return interval
+
+        match = INTERVAL.fullmatch(value)
+        if match is None:
+            raise self.error(f"Invalid interval '{value}'", i)
+        low_bracket, low, high, high_bracket = match.groups()
+        interval = Interval(
+            int(low),
+            None if high is None else int(high),
+            low_bracket == "]",
+            high is None or high_bracket == "[",
+        )
+        if interval.high is not None and interval.high < interval.low:
+            raise self.error(f"Empty interval '{value}'", i)
+
+        self.intervals[value] = interval
+        return interval
+
+    def parse_arc(self, words: List[str], i: int, normal_only: bool) -> Arc:
+        word = words[i]
+        braced = word[0] == "{"
+        match = (BRACED_ARC if braced else BARE_ARC).fullmatch(word)
+        if match is None:
+            raise self.error(f"Invalid arc '{word}'", i)
+        name, arc, weight, multiplier = match.groups()
+        if braced and "\\" in name:
+            name = ESCAPE.sub(r"\1", name)
+
+        if arc is None:
+            return name, "*", 1
+        if normal_only and arc != "*":
+            raise self.error(f"Unexpected '{arc}' arc", i)
+        return name, arc, int(weight) * MULTIPLIERS[multiplier]
+
+    def parse_arcs(
+        self, words: List[str], i: int, normal_only: bool
+    ) -> Tuple[List[Arc], int]:
+        """Arcs from the i-th word to the end of the line or the arrow, and
+        the index of the word after them"""
+        arcs = []
+        count = len(words)
+        while i < count and words[i] != "->":
+            arcs.append(self.parse_arc(words, i, normal_only))
+            i += 1
+        return arcs, i
+
+    def add_input_arc(
+        self, transition: Transition, place: Place, arc: str, weight: int
+    ):
+        if arc in INPUT_ARCS:
+            transition.input_arcs.append(
+                InputArc(place, weight, INPUT_ARCS[arc])
+            )
+        else:
+            transition.stopwatch_arcs += (
+                InputArc(place, weight, STOPWATCH_ARCS[arc]),
+            )
+
+    def get_place(self, name: str) -> Place:
+        place = self.places.get(name)
+        if place is None:
+            place = self.places[name] = Place(name, 0)
+        return place
+
+    def get_transition(self, name: str) -> Transition:
+        transition = self.transitions.get(name)
+        if transition is None:
+            transition = self.transitions[name] = Transition(name)
+        return transition
+
+    def parse_net(self, words: List[str]):
+        self.network.name = self.name(words, 1)
+        if len(words) > 2:
+            raise self.error(f"Unexpected '{words[2]}'", 2)
+
+    def parse_transition(self, words: List[str]):
+        name = self.name(words, 1)
+        transition = self.transitions.get(name)
+        if transition is None:
+            transition = self.transitions[name] = Transition(name)
+
+        i = 2
+        count = len(words)
+        if i < count and words[i] == ":":
+            transition.label = self.name(words, i + 1)
+            i += 2
+        if i < count and words[i][0] in "[]":
+            transition.interval = self.interval(words, i)
+            i += 1
+        if i == count:
+            return
+
+        # Arcs are added as they are parsed, as transitions are by far the
+        # most common description. Most arcs are a plain name
+        places = self.places
+        input_arcs = transition.input_arcs
+        while True:
+            if i == count:
+                raise self.error("Expected '->' at the end of the line", i)
+            word = words[i]
+            if word == "->":
+                break
+
+            if word.isidentifier():
+                name, arc, weight = word, "*", 1
+            else:
+                name, arc, weight = self.parse_arc(words, i, False)
+            place = places.get(name)
+            if place is None:
+                place = places[name] = Place(name, 0)
+            if arc == "*":
+                input_arcs.append(
+                    InputArc(place, weight, InputArcTypes.REGULAR)
+                )
+            else:
+                self.add_input_arc(transition, place, arc, weight)
+            i += 1
+
+        output_arcs = transition.output_arcs
+        for i in range(i + 1, count):
+            word = words[i]
+            if word.isidentifier():
+                name, weight = word, 1
+            else:
+                name, _, weight = self.parse_arc(words, i, True)
+            place = places.get(name)
+            if place is None:
+                place = places[name] = Place(name, 0)
+            output_arcs.append(OutputArc(place, weight))
+
+    def parse_place(self, words: List[str]):
+        place = self.get_place(self.name(words, 1))
+
+        i = 2
+        count = len(words)
+        if i < count and words[i] == ":":
+            place.label = self.name(words, i + 1)
+            i += 2
+        if i < count and words[i][0] == "(":
+            if words[i][-1] != ")":
+                raise self.error(f"Invalid marking '{words[i]}'", i)
+            place.tokens = self.count(words[i][1:-1], i)
+            i += 1
+        if i == count:
+            return
+
+        # Arcs from the point of view of the place: the transitions before
+        # the arrow put tokens in it, the ones after take from it
+        inputs, i = self.parse_arcs(words, i, True)
+        if i == count:
+            raise self.error("Expected '->' at the end of the line", i)
+        outputs, _ = self.parse_arcs(words, i + 1, False)
+
+        for name, _, weight in inputs:
+            self.get_transition(name).output_arcs.append(
+                OutputArc(place, weight)
+            )
+        for name, arc, weight in outputs:
+            self.add_input_arc(self.get_transition(name), place, arc, weight)
+
+    def parse_label(self, words: List[str]):
+        name = self.name(words, 1)
+        label = self.name(words, 2)
+        if len(words) > 3:
+            raise self.error(f"Unexpected '{words[3]}'", 3)
+
+        node = self.places.get(name) or self.transitions.get(name)
+        if node is None:
+            raise self.error(f"Unknown place or transition '{name}'", 1)
+        node.label = label
+
+    def parse_priority(self, words: List[str]):
+        sides: List[List[str]] = [[]]
+        relation = None
+        for i, word in enumerate(words[1:], 1):
+            if word in ("<", ">") and relation is None:
+                relation = word
+                sides.append([])
+            else:
+                name = self.name(words, i)
+                self.get_transition(name)
+                sides[-1].append(name)
+
+        if relation is None or not sides[0] or not sides[1]:
+            raise self.error(
+                "Expected 'pr <transitions> (<|>) <transitions>'", 0
+            )
+        higher, lower = sides if relation == ">" else sides[::-1]
+        self.network.priorities.extend(
+            (first, second) for first in higher for second in lower
+        )
+
+    def parse_note(self, words: List[str]):
+        name = self.name(words, 1)
+        if len(words) < 3 or words[2] not in ("0", "1"):
+            raise self.error("Expected 0 or 1", 2)
+        self.network.notes[name] = " ".join(
+            self.name(words, i) for i in range(3, len(words))
+        )
+
+
+def parse_text(text: str, filepath: Union[Path, str] = "<string>"):
+    """Parse the contents of a .net file."""
+    return NetParser(filepath).parse(text.splitlines())
+
+
+def parse(filepath: Path) -> PetriNet:
+    """Parse the text file generated by tina export."""
+    with open(filepath, "r") as file:
+        return NetParser(filepath).parse(file)
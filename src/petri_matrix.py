@@ -0,0 +1,181 @@
+from typing import Dict, List, Sequence, Tuple, Union
+
+import numpy as np
+
+from petri_net import InputArcTypes, PetriNet, Place
+
+
+class SparseWeights:
+    """Transitions x places weight matrix, stored by transition in
+    compressed sparse row form (only the non-zero weights are kept)."""
+
+    def __init__(
+        self,
+        shape: Tuple[int, int],
+        rows: List[Dict[int, int]],
+    ):
+        self.shape = shape
+        self.indptr = np.zeros(shape[0] + 1, dtype=np.int64)
+        self.indptr[1:] = np.cumsum([len(row) for row in rows])
+        self.places = np.fromiter(
+            (place for row in rows for place in row),
+            dtype=np.int64,
+            count=int(self.indptr[-1]),
+        )
+        self.weights = np.fromiter(
+            (weight for row in rows for weight in row.values()),
+            dtype=np.int64,
+            count=int(self.indptr[-1]),
+        )
+
+        # Transition of each stored weight, used by the vectorized queries
+        self.transitions = np.repeat(
+            np.arange(shape[0], dtype=np.int64), np.diff(self.indptr)
+        )
+
+    def row(self, transition: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Places and weights of a transition."""
+        lo, hi = self.indptr[transition], self.indptr[transition + 1]
+        return self.places[lo:hi], self.weights[lo:hi]
+
+    def todense(self) -> np.ndarray:
+        dense = np.zeros(self.shape, dtype=np.int64)
+        dense[self.transitions, self.places] = self.weights
+        return dense
+
+
+class MatrixPetriNet:
+    """Compiled, vectorized representation of a PetriNet.
+
+    The marking is kept as an integer vector and the arcs as sparse
+    pre (regular input), post (output), read and inhibitor weight matrices,
+    so the enabling of every transition is computed at once. Firings are
+    written back to the places of the original net, keeping get_marking
+    and get_place in sync.
+
+    A place linked by several regular arcs needs enough tokens for the sum
+    of their weights, which is what firing takes, and for the heaviest of
+    its read arcs. Transition.is_enabled checks the arcs one at a time,
+    force_fire then refuses the firing.
+    """
+
+    def __init__(self, petri_network: PetriNet):
+        self.petri_network = petri_network
+        self.places: List[Place] = list(petri_network.places)
+        self._place_index = {
+            place.name: i for i, place in enumerate(self.places)
+        }
+
+        shape = (len(petri_network.transitions), len(self.places))
+        pre, post, read, inhibitor, need = [], [], [], [], []
+        for transition in petri_network.transitions:
+            pre_row, post_row, read_row = {}, {}, {}
+            inhibitor_row, need_row = {}, {}
+            for arc in transition.input_arcs:
+                p = self._place_index[arc.place.name]
+                weight = int(arc.weight)
+                if arc.type == InputArcTypes.INHIBITOR:
+                    inhibitor_row[p] = min(
+                        weight, inhibitor_row.get(p, weight)
+                    )
+                    continue
+
+                if arc.type == InputArcTypes.REGULAR:
+                    pre_row[p] = pre_row.get(p, 0) + weight
+                else:
+                    read_row[p] = max(weight, read_row.get(p, 0))
+
+                # Regular arcs from the same place all take their tokens,
+                # read arcs only need them there
+                need_row[p] = max(pre_row.get(p, 0), read_row.get(p, 0))
+            for arc in transition.output_arcs:
+                p = self._place_index[arc.place.name]
+                post_row[p] = post_row.get(p, 0) + int(arc.weight)
+
+            pre.append(pre_row)
+            post.append(post_row)
+            read.append(read_row)
+            inhibitor.append(inhibitor_row)
+            need.append(need_row)
+
+        self.pre = SparseWeights(shape, pre)
+        self.post = SparseWeights(shape, post)
+        self.read = SparseWeights(shape, read)
+        self.inhibitor = SparseWeights(shape, inhibitor)
+        self._need = SparseWeights(shape, need)
+
+        # Marking change caused by each firing, ie. a row of the incidence
+        # matrix
+        self._delta = SparseWeights(
+            shape,
+            [
+                {
+                    p: post_row.get(p, 0) - pre_row.get(p, 0)
+                    for p in sorted(post_row.keys() | pre_row.keys())
+                    if post_row.get(p, 0) != pre_row.get(p, 0)
+                }
+                for pre_row, post_row in zip(pre, post)
+            ],
+        )
+
+        self.marking = np.zeros(shape[1], dtype=np.int64)
+        self.refresh()
+
+    def refresh(self):
+        """Reload the marking from the places of the original net, needed
+        if it is changed without going through [fire]."""
+        self.marking[:] = [place.tokens for place in self.places]
+
+    def incidence(self) -> np.ndarray:
+        """Dense incidence matrix (post - pre), transitions x places."""
+        return self.post.todense() - self.pre.todense()
+
+    def enabled(
+        self, transitions: Union[Sequence[int], None] = None
+    ) -> np.ndarray:
+        """Boolean mask of the enabled transitions, for the whole net or
+        for the given transition indices."""
+        disabled = np.zeros(self.pre.shape[0], dtype=bool)
+
+        need = self._need
+        lacking = self.marking[need.places] < need.weights
+        disabled[need.transitions[lacking]] = True
+
+        inhibitor = self.inhibitor
+        inhibited = self.marking[inhibitor.places] >= inhibitor.weights
+        disabled[inhibitor.transitions[inhibited]] = True
+
+        enabled = ~disabled
+        if transitions is None:
+            return enabled
+        return enabled[np.asarray(transitions, dtype=np.int64)]
+
+    def is_enabled(self, transition: int) -> bool:
+        places, weights = self._need.row(transition)
+        if np.any(self.marking[places] < weights):
+            return False
+
+        places, weights = self.inhibitor.row(transition)
+        return not np.any(self.marking[places] >= weights)
+
+    def fire(self, transition: int):
+        """Fire a transition, which should be enabled."""
+        places, delta = self._delta.row(transition)
+        self.marking[places] += delta
+
+        # Keep the original net in sync
+        for p in places.tolist():
+            self.places[p].tokens = int(self.marking[p])
+
+    def try_fire(self, transition: int) -> bool:
+        if not self.is_enabled(transition):
+            return False
+
+        self.fire(transition)
+        return True
+
+    def get_place(self, name: str) -> Union[Place, None]:
+        return self.petri_network.get_place(name)
+
+    def get_marking(self) -> List[int]:
+        return self.marking.tolist()
@@ -1,24 +1,23 @@
+import operator
 from abc import ABC, abstractmethod
 from dataclasses import dataclass, field
 from enum import Enum, auto
-from itertools import chain
-from typing import List, Union, Self
+from typing import Callable, Dict, List, Tuple, Union
 
 
 class Tokens(int):
-    """Amount of tokens in a Petri net, must be positive or zero."""
+    """Amount of tokens in a Petri net, must be positive or zero.
+
+    Only the construction is checked: arithmetic on tokens gives plain
+    ints, so firing a transition doesn't allocate a new object per arc.
+    Transition.force_fire checks the marking stays non-negative instead.
+    """
 
     def __new__(cls, value, *args, **kwargs):
         if value < 0:
             raise ValueError("Amount of tokens must positive or zero.")
         return super().__new__(cls, value, *args, **kwargs)
 
-    def __add__(self, other: Self):
-        return self.__class__(super().__add__(other))
-
-    def __sub__(self, other: Self):
-        return self.__class__(super().__sub__(other))
-
     def __mul__(self, _):
         raise ValueError("Multiplication of tokens is not defined.")
 
@@ -26,27 +25,34 @@ class Tokens(int):
         raise ValueError("Division of tokens is not defined.")
 
 
-@dataclass
+@dataclass(slots=True)
 class Place:
     """Representation of a Petri net place, with its number of tokens."""
 
     name: str
-    tokens: Tokens
+    tokens: int
+    label: Union[str, None] = None
 
+    def __post_init__(self):
+        self.tokens = int(self.tokens)
 
-@dataclass
+
+@dataclass(slots=True)
 class Arc(ABC):
     """Representation of an arc."""
 
     place: Place
-    weight: Tokens
+    weight: int
+
+    def __post_init__(self):
+        self.weight = int(self.weight)
 
     @abstractmethod
     def move_tokens(self):
         pass
 
 
-@dataclass
+@dataclass(slots=True)
 class OutputArc(Arc):
     """Representation of an output arc."""
 
@@ -63,34 +69,77 @@ class InputArcTypes(Enum):
     INHIBITOR = auto()
 
 
-@dataclass
+@dataclass(slots=True)
 class InputArc(Arc):
-    """Representation of an input arc."""
+    """Representation of an input arc.
+
+    The behaviour of the arc type is resolved on construction, so the type
+    shouldn't be changed afterwards.
+    """
 
     type: InputArcTypes
 
+    # Comparison between the tokens and the weight that enables the arc,
+    # and amount of tokens removed when firing
+    _test: Callable[[int, int], bool] = field(
+        init=False, repr=False, compare=False
+    )
+    _consumed: int = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        self.weight = int(self.weight)
+        inhibitor = self.type == InputArcTypes.INHIBITOR
+        self._test = operator.lt if inhibitor else operator.ge
+        self._consumed = (
+            self.weight if self.type == InputArcTypes.REGULAR else 0
+        )
+
     def is_met(self) -> bool:
         """Check if the arc preconditions are met."""
-        if self.type == InputArcTypes.INHIBITOR:
-            return self.place.tokens < self.weight
-
-        return self.place.tokens >= self.weight
+        return self._test(self.place.tokens, self.weight)
 
     def move_tokens(self):
         """Removes tokens from the input place."""
-        if self.type == InputArcTypes.REGULAR:
-            self.place.tokens -= self.weight
+        self.place.tokens -= self._consumed
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
+class Interval:
+    """Static firing interval of a transition, in time units since it was
+    enabled. [high] is None for an unbounded interval (w in tina)."""
+
+    low: int = 0
+    high: Union[int, None] = None
+    low_open: bool = False
+    high_open: bool = True
+
+    def __str__(self) -> str:
+        high = "w" if self.high is None else self.high
+        return (
+            f"{']' if self.low_open else '['}{self.low},{high}"
+            f"{'[' if self.high_open else ']'}"
+        )
+
+
+# Interval of transitions that can fire as soon as they are enabled
+UNTIMED = Interval()
+
+
+@dataclass(slots=True)
 class Transition:
     """Representation of a tina arrow or equivalent
     Includes the conditions required to move.
+
+    Stopwatch arcs don't take part in the enabling, they only suspend the
+    clock of the transition while they aren't met.
     """
 
     name: str
     input_arcs: List[InputArc] = field(default_factory=list)
     output_arcs: List[OutputArc] = field(default_factory=list)
+    interval: Interval = UNTIMED
+    label: Union[str, None] = None
+    stopwatch_arcs: Tuple[InputArc, ...] = ()
 
     def is_enabled(self) -> bool:
         """Check if the transition is enabled, by checking each arc
@@ -106,7 +155,18 @@ class Transition:
     def force_fire(self):
         """Fire the transition, moving it's tokens around. Should only
         be called when the transition is enabled."""
-        for arc in chain(self.input_arcs, self.output_arcs):
+        for arc in self.input_arcs:
+            arc.move_tokens()
+
+        # Checked once per firing, a place can only run out of tokens when
+        # the transition wasn't enabled or has several arcs from it
+        for arc in self.input_arcs:
+            if arc.place.tokens < 0:
+                for arc in self.input_arcs:
+                    arc.place.tokens += arc._consumed
+                raise ValueError("Amount of tokens must positive or zero.")
+
+        for arc in self.output_arcs:
             arc.move_tokens()
 
     def try_fire(self) -> bool:
@@ -124,11 +184,18 @@ class Transition:
 class PetriNet:
     places: List[Place]
     transitions: List[Transition]
+    name: Union[str, None]
+
+    # Notes of the net by name, and (higher, lower) pairs of transition
+    # names, the lower one can't fire while the higher one is enabled
+    notes: Dict[str, str]
+    priorities: List[Tuple[str, str]]
 
     def __init__(
         self,
         places: Union[List[Place], None] = None,
         transitions: Union[List[Transition], None] = None,
+        name: Union[str, None] = None,
     ):
         if places is None:
             places = []
@@ -137,6 +204,9 @@ class PetriNet:
 
         self.places = places
         self.transitions = transitions
+        self.name = name
+        self.notes = {}
+        self.priorities = []
 
         # Set mapping from places and transitions
         self._place_mapping = {place.name: i for i, place in enumerate(places)}
@@ -0,0 +1,114 @@
+import json
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Union
+
+
+# Keys of a plant in the manifest, besides the required device and net
+OPTIONAL_KEYS = ("name", "table", "record", "journal")
+
+
+@dataclass
+class Plant:
+    """A FlexFact plant run by its own controller: the device file (which
+    holds the address of the slave) and the net controlling it, with an
+    optional lookup table, recording and journal as --table, --record and
+    --journal."""
+
+    name: str
+    device: Path
+    net: Path
+    table: Union[Path, None] = None
+    record: Union[Path, None] = None
+    journal: Union[Path, None] = None
+
+
+def load_manifest(filepath: Union[Path, str]) -> List[Plant]:
+    """
+    Parse a manifest of the plants to run from a single process, as JSON:
+
+        {"plants": [{"name": "cell1", "device": "cell1.dev",
+                     "net": "cell1.net"}, ...]}
+
+    Paths are relative to the manifest. A plant is named after its device
+    file by default, and names must be unique as they tell the plants apart
+    in the output, the metrics and the live views. Recordings and journals
+    can't be shared either. Raises ValueError on invalid manifests.
+    """
+    with open(filepath, "r") as file:
+        try:
+            manifest = json.load(file)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"{filepath}: invalid JSON, {e}") from e
+
+    entries = manifest.get("plants") if isinstance(manifest, dict) else None
+    if not isinstance(entries, list) or not entries:
+        raise ValueError(f"{filepath}: expected a non-empty 'plants' list")
+
+    root = Path(filepath).parent
+    plants = []
+    for i, entry in enumerate(entries):
+        if not isinstance(entry, dict):
+            raise ValueError(f"{filepath}: plant {i} should be an object")
+        unknown = set(entry) - {"device", "net", *OPTIONAL_KEYS}
+        if unknown:
+            raise ValueError(
+                f"{filepath}: unknown keys {sorted(unknown)} in plant {i}"
+            )
+
+        paths = {}
+        for key in ("device", "net", "table", "record", "journal"):
+            value = entry.get(key)
+            if value is None:
+                continue
+            if not isinstance(value, str):
+                raise ValueError(
+                    f"{filepath}: '{key}' of plant {i} should be a path"
+                )
+            paths[key] = root / value
+        for key, suffix in (("device", ".dev"), ("net", ".net")):
+            path = paths.get(key)
+            if path is None or not path.is_file() or path.suffix != suffix:
+                raise ValueError(
+                    f"{filepath}: '{key}' of plant {i} should be a path to"
+                    f" an existing {suffix} file"
+                )
+        if "table" in paths and not paths["table"].is_file():
+            raise ValueError(
+                f"{filepath}: invalid lookup table path '{paths['table']}'"
+            )
+
+        name = entry.get("name", paths["device"].stem)
+        plants.append(
+            Plant(
+                str(name),
+                paths["device"],
+                paths["net"],
+                paths.get("table"),
+                paths.get("record"),
+                paths.get("journal"),
+            )
+        )
+
+    names = [plant.name for plant in plants]
+    duplicates = sorted(set(name for name in names if names.count(name) > 1))
+    if duplicates:
+        raise ValueError(f"{filepath}: duplicate plant names {duplicates}")
+
+    # Files written by the controllers can't be shared, they would be
+    # overwritten by each other. Live views are named after the plants
+    for key in ("record", "journal"):
+        paths = [
+            getattr(plant, key).resolve()
+            for plant in plants
+            if getattr(plant, key) is not None
+        ]
+        shared = sorted(
+            set(str(path) for path in paths if paths.count(path) > 1)
+        )
+        if shared:
+            raise ValueError(
+                f"{filepath}: '{key}' {shared} used by several plants"
+            )
+
+    return plants
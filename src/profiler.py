@@ -0,0 +1,174 @@
+"""Profiling of the loops of the controllers while they run: a sampler
+of the stacks of the loops, written as folded stacks for flame graphs,
+and the slowest loops with the time spent in each of their phases.
+"""
+import sys
+import threading
+import time
+from collections import Counter
+from heapq import heappush, heapreplace
+from pathlib import Path
+from types import CodeType
+from typing import Coroutine, Dict, Iterable, List, Tuple, Union
+
+from async_controller import AsyncController
+from controller import Controller
+
+# Leaf of the stacks of the loops waiting, eg. for a Modbus response with
+# the asyncio client, followed by the line of the await
+AWAIT = "[await]"
+
+
+def loops() -> Tuple[CodeType, ...]:
+    """Code of the loops of the controllers. Stacks are kept from the
+    frame of a loop, the rest (waiting for the next deadline, the event
+    loop) is the same in every sample"""
+    return (Controller.loop.__code__, AsyncController.loop_async.__code__)
+
+
+class Sampler:
+    """Statistical profiler of the loops: every [interval] seconds, a
+    background thread takes the stack of the thread running the
+    controllers, and counts it if it is in a loop.
+
+    The asyncio loops are only on the stack while they run, not while they
+    wait, so the coroutines running them are given to [watch], and those
+    of their loops that are waiting are counted too.
+    """
+
+    def __init__(
+        self,
+        interval: float,
+        thread_id: Union[int, None] = None,
+        roots: Union[Iterable[CodeType], None] = None,
+    ):
+        self.interval = interval
+        self.thread_id = (
+            thread_id
+            if thread_id is not None
+            else threading.main_thread().ident
+        )
+        self.roots = frozenset(roots if roots is not None else loops())
+
+        # Number of samples of each folded stack, and of every sample
+        self.stacks: Counter = Counter()
+        self.samples = 0
+
+        self._labels: Dict[CodeType, str] = {}
+        self._watched: List[Coroutine] = []
+        self._stop = threading.Event()
+        self._thread: Union[threading.Thread, None] = None
+        self._switch_interval = sys.getswitchinterval()
+
+    def watch(self, coroutine: Coroutine):
+        self._watched.append(coroutine)
+
+    def start(self):
+        # The sampler only runs when it gets the GIL, which a busy thread
+        # only gives up every switch interval (5 ms by default)
+        self._switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(min(self._switch_interval, self.interval))
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+            sys.setswitchinterval(self._switch_interval)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def label(self, code: CodeType) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            label = f"{Path(code.co_filename).stem}:{code.co_qualname}"
+            self._labels[code] = label
+        return label
+
+    def sample(self):
+        frame = sys._current_frames().get(self.thread_id)
+        self.samples += 1
+        labels = []
+        while frame is not None:
+            code = frame.f_code
+            labels.append(self.label(code))
+            if code in self.roots:
+                self.stacks[";".join(reversed(labels))] += 1
+                break
+            frame = frame.f_back
+
+        for coroutine in self._watched:
+            labels = self.awaiting(coroutine)
+            if labels:
+                self.stacks[";".join(labels)] += 1
+
+    def awaiting(self, coroutine: Coroutine) -> List[str]:
+        """Stack of a waiting loop, from the coroutines awaited by
+        [coroutine], none if it isn't in a loop or runs. The chain ends at
+        the first future, tasks included"""
+        labels: List[str] = []
+        awaited = coroutine
+        frame = None
+        while hasattr(awaited, "cr_frame"):
+            if awaited.cr_running:
+                # On the stack of the thread
+                return []
+            if awaited.cr_frame is None:
+                break
+            frame = awaited.cr_frame
+            if labels or frame.f_code in self.roots:
+                labels.append(self.label(frame.f_code))
+            awaited = awaited.cr_await
+        if labels and frame is not None:
+            filename = Path(frame.f_code.co_filename).name
+            labels.append(f"{AWAIT} {filename}:{frame.f_lineno}")
+        return labels
+
+    def write(self, filepath: Union[Path, str]):
+        """Write the folded stacks, one '<frame;frame;...> <samples>' per
+        line as read by flamegraph.pl or speedscope"""
+        with open(filepath, "w") as file:
+            for stack, count in self.stacks.most_common():
+                file.write(f"{stack} {count}\n")
+
+
+# (total, loop number, time, read, evaluate, write), the total first so the
+# heap is ordered by it
+SlowTick = Tuple[float, int, float, float, float, float]
+
+
+class SlowestTicks:
+    """The [count] slowest loops seen, with the time spent reading the
+    inputs, evaluating the net and writing the coils."""
+
+    def __init__(self, count: int):
+        self.count = count
+        self._heap: List[SlowTick] = []
+
+    def observe(self, tick: int, read: float, evaluate: float, write: float):
+        total = read + evaluate + write
+        heap = self._heap
+        if len(heap) < self.count:
+            heappush(heap, (total, tick, time.time(), read, evaluate, write))
+        elif total > heap[0][0]:
+            heapreplace(
+                heap, (total, tick, time.time(), read, evaluate, write)
+            )
+
+    def slowest(self) -> List[SlowTick]:
+        return sorted(self._heap, reverse=True)
+
+    def render_text(self) -> str:
+        lines = [f"Slowest {len(self._heap)} loops:"]
+        for total, tick, at, read, evaluate, write in self.slowest():
+            clock = time.strftime("%H:%M:%S", time.localtime(at))
+            lines.append(
+                f"  loop {tick} at {clock}: {total * 1000:.3f} ms (read"
+                f" {read * 1000:.3f}, evaluate {evaluate * 1000:.3f}, write"
+                f" {write * 1000:.3f})"
+            )
+        return "\n".join(lines)
@@ -0,0 +1,513 @@
+#!/usr/bin/env python3
+import operator
+import time
+from argparse import ArgumentParser
+from array import array
+from dataclasses import dataclass, field
+from itertools import compress
+from typing import Dict, List, Sequence, Tuple, Union
+
+import cli
+from parsers import network
+from petri_net import InputArcTypes, PetriNet
+
+
+# Bits used to store the tokens of a place, the narrowest one holding
+# every marking found so far is used
+WIDTHS = (1, 8, 16, 32)
+
+Arcs = Tuple[Tuple[int, int], ...]
+
+
+@dataclass
+class CompiledNet:
+    """Net reduced to place indices.
+
+    Regular arcs need at least their weight, the sum of them if a place
+    has several, read arcs their weight, inhibitor arcs need less than
+    their weight, and only regular and output arcs move tokens.
+    """
+
+    place_names: List[str]
+    transition_names: List[str]
+    need: List[Arcs]
+    inhibit: List[Arcs]
+    delta: List[Arcs]
+    initial: List[int]
+
+    # Transitions needing tokens in each place, and those needing none,
+    # so only the ones that may be enabled by a marking get checked
+    by_place: List[Tuple[int, ...]] = field(default_factory=list)
+    sources: Tuple[int, ...] = ()
+
+    def __post_init__(self):
+        by_place: List[List[int]] = [[] for _ in self.place_names]
+        sources = []
+        for t, needed in enumerate(self.need):
+            for p, _ in needed:
+                by_place[p].append(t)
+            if not needed:
+                sources.append(t)
+        self.by_place = [tuple(transitions) for transitions in by_place]
+        self.sources = tuple(sources)
+
+
+def compile_net(petri_network: PetriNet) -> CompiledNet:
+    places = {place.name: i for i, place in enumerate(petri_network.places)}
+    need, inhibit, delta = [], [], []
+    for transition in petri_network.transitions:
+        needed: Dict[int, int] = {}
+        taken: Dict[int, int] = {}
+        inhibited: Dict[int, int] = {}
+        moved: Dict[int, int] = {}
+        for arc in transition.input_arcs:
+            p = places[arc.place.name]
+            if arc.type == InputArcTypes.INHIBITOR:
+                inhibited[p] = min(arc.weight, inhibited.get(p, arc.weight))
+                continue
+            if arc.type == InputArcTypes.REGULAR:
+                taken[p] = taken.get(p, 0) + arc.weight
+                moved[p] = moved.get(p, 0) - arc.weight
+            needed[p] = max(arc.weight, taken.get(p, 0), needed.get(p, 0))
+        for arc in transition.output_arcs:
+            p = places[arc.place.name]
+            moved[p] = moved.get(p, 0) + arc.weight
+
+        need.append(tuple((p, w) for p, w in needed.items() if w > 0))
+        inhibit.append(tuple(inhibited.items()))
+        delta.append(tuple((p, d) for p, d in moved.items() if d != 0))
+
+    return CompiledNet(
+        list(places),
+        [transition.name for transition in petri_network.transitions],
+        need,
+        inhibit,
+        delta,
+        [place.tokens for place in petri_network.places],
+    )
+
+
+class MarkingCodec:
+    """Packs markings into fixed size byte strings, [width] bits per
+    place."""
+
+    def __init__(self, places: int, width: int):
+        if width not in WIDTHS:
+            raise ValueError(f"Width must be one of {WIDTHS}")
+        self.places = places
+        self.width = width
+        self.max_tokens = (1 << width) - 1
+        self.size = (places * width + 7) // 8
+
+    @classmethod
+    def fitting(cls, places: int, tokens: int) -> "MarkingCodec":
+        """Narrowest codec holding up to [tokens] tokens per place."""
+        for width in WIDTHS:
+            if tokens < 1 << width:
+                return cls(places, width)
+        raise ValueError(f"Too many tokens to encode: {tokens}")
+
+    def encode(self, marking: Sequence[int]) -> bytes:
+        if self.width == 1:
+            if not marking:
+                return b""
+            bits = "".join("1" if tokens else "0" for tokens in marking)
+            return int(bits, 2).to_bytes(self.size, "big")
+        if self.width == 8:
+            return bytes(marking)
+        return array("H" if self.width == 16 else "I", marking).tobytes()
+
+    def decode(self, data: bytes) -> List[int]:
+        if self.width == 1:
+            if not self.places:
+                return []
+            bits = format(int.from_bytes(data, "big"), f"0{self.places}b")
+            return [1 if bit == "1" else 0 for bit in bits]
+        if self.width == 8:
+            return list(data)
+        return array("H" if self.width == 16 else "I", data).tolist()
+
+    def covers(self, data: bytes, other: bytes) -> bool:
+        """Whether a packed marking has at least the tokens of another in
+        every place."""
+        if self.width == 1:
+            mask = int.from_bytes(other, "big")
+            return mask & ~int.from_bytes(data, "big") == 0
+        if self.width == 8:
+            return all(map(operator.ge, data, other))
+        return all(map(operator.ge, self.decode(data), self.decode(other)))
+
+
+class StateStore:
+    """Set of packed markings, numbered in insertion order.
+
+    Markings are stored back to back in a single bytearray and found
+    through an open addressing table of their numbers, at most half full,
+    so each one costs its packed size plus 16 to 32 bytes of table,
+    instead of a Python object and a dict entry.
+    """
+
+    def __init__(self, codec: MarkingCodec, capacity: int = 1024):
+        self.codec = codec
+        self.data = bytearray()
+        self.count = 0
+        self._table = array("q", [-1]) * capacity
+        self._mask = capacity - 1
+
+    def get(self, i: int) -> bytes:
+        size = self.codec.size
+        return bytes(self.data[i * size : (i + 1) * size])
+
+    def add(self, record: bytes) -> Tuple[int, bool]:
+        """Add a packed marking, returning its number and whether it is
+        new."""
+        size = self.codec.size
+        data = self.data
+        table = self._table
+        slot = hash(record) & self._mask
+        while True:
+            i = table[slot]
+            if i < 0:
+                break
+            if data[i * size : (i + 1) * size] == record:
+                return i, False
+            slot = (slot + 1) & self._mask
+
+        i = self.count
+        table[slot] = i
+        data += record
+        self.count += 1
+        if self.count * 2 > len(table):
+            self._grow()
+        return i, True
+
+    def _grow(self):
+        size = self.codec.size
+        capacity = len(self._table) * 2
+        self._table = table = array("q", [-1]) * capacity
+        self._mask = mask = capacity - 1
+        for i in range(self.count):
+            slot = hash(bytes(self.data[i * size : (i + 1) * size])) & mask
+            while table[slot] >= 0:
+                slot = (slot + 1) & mask
+            table[slot] = i
+
+    def recode(self, codec: MarkingCodec) -> "StateStore":
+        """Copy of the store using another codec, keeping the numbers."""
+        store = StateStore(codec, len(self._table))
+        for i in range(self.count):
+            store.add(codec.encode(self.codec.decode(self.get(i))))
+        return store
+
+    def nbytes(self) -> int:
+        return len(self.data) + self._table.itemsize * len(self._table)
+
+
+def support(marking: Sequence[int]) -> int:
+    """Places holding tokens in a marking, folded into 64 bits. A marking
+    covering another has at least its bits set"""
+    bits = 0
+    for p in compress(range(len(marking)), marking):
+        bits |= 1 << (p & 63)
+    return bits
+
+
+def is_enabled(net: CompiledNet, marking: Sequence[int], t: int) -> bool:
+    return all(marking[p] >= w for p, w in net.need[t]) and not any(
+        marking[p] >= w for p, w in net.inhibit[t]
+    )
+
+
+def fire(net: CompiledNet, marking: Sequence[int], t: int) -> List[int]:
+    """Marking after firing [t], which must be enabled."""
+    child = list(marking)
+    for p, d in net.delta[t]:
+        child[p] += d
+    return child
+
+
+def successors(
+    net: CompiledNet, marking: List[int]
+) -> List[Tuple[int, List[int]]]:
+    """(transition, marking) pairs reached by firing each enabled
+    transition."""
+    candidates = set(net.sources)
+    for p, tokens in enumerate(marking):
+        if tokens:
+            candidates.update(net.by_place[p])
+
+    return [
+        (t, fire(net, marking, t))
+        for t in sorted(candidates)
+        if is_enabled(net, marking, t)
+    ]
+
+
+# A successor as (transition, packed marking, tokens), the marking left
+# unpacked if it has too many tokens for the codec
+Successor = Tuple[int, Union[bytes, List[int]], int]
+
+
+def expand(
+    net: CompiledNet, width: int, records: List[bytes]
+) -> List[List[Successor]]:
+    """Successors of a batch of packed markings."""
+    codec = MarkingCodec(len(net.place_names), width)
+    result = []
+    for record in records:
+        packed = []
+        for t, child in successors(net, codec.decode(record)):
+            fits = max(child, default=0) <= codec.max_tokens
+            packed.append(
+                (t, codec.encode(child) if fits else child, sum(child))
+            )
+        result.append(packed)
+    return result
+
+
+@dataclass
+class Report:
+    """Result of a state space exploration."""
+
+    states: int = 0
+    edges: int = 0
+    complete: bool = True
+    deadlocks: List[List[int]] = field(default_factory=list)
+    deadlock_count: int = 0
+    dead_transitions: List[str] = field(default_factory=list)
+    unbounded_places: List[str] = field(default_factory=list)
+    elapsed: float = 0.0
+
+    # Size of a packed marking, and memory used by the exploration for
+    # all of them: the packed markings, the table finding them and, if
+    # the net can gain tokens, what is kept to find covered ancestors
+    marking_bytes: int = 0
+    store_bytes: int = 0
+
+    def states_per_second(self) -> float:
+        return self.states / self.elapsed if self.elapsed else 0.0
+
+    def bytes_per_state(self) -> float:
+        """Memory used per marking, packed marking included"""
+        return self.store_bytes / self.states if self.states else 0.0
+
+
+class Explorer:
+    """Breadth first exploration of the reachable markings of a net.
+
+    A marking strictly covering one of its ancestors proves the places
+    that grew are unbounded (the firing sequence between them can be
+    repeated forever). Such markings are counted but not expanded, which
+    is enough for the exploration to end, but it is then reported as
+    incomplete, as it is when [max_states] is reached (checked once per
+    level, so it can be exceeded by up to one level). The transitions
+    reported dead are then only the ones that never fired before it
+    stopped.
+    """
+
+    def __init__(
+        self,
+        petri_network: PetriNet,
+        max_states: int = 1_000_000,
+        max_deadlocks: int = 10,
+    ):
+        self.net = compile_net(petri_network)
+        self.max_states = max_states
+        self.max_deadlocks = max_deadlocks
+
+        # A marking can only strictly cover an ancestor if some transition
+        # adds tokens, most nets of controllers never do
+        self.grows = any(
+            sum(d for _, d in moved) > 0 for moved in self.net.delta
+        )
+
+    def run(self) -> Report:
+        net = self.net
+        report = Report()
+        start = time.perf_counter()
+
+        codec = MarkingCodec.fitting(
+            len(net.place_names), max(net.initial, default=0)
+        )
+        store = StateStore(codec)
+        store.add(codec.encode(net.initial))
+
+        # Parent, token count and marked places of each state, to look
+        # for covered ancestors
+        parents = array("q", [-1])
+        totals = array("q", [sum(net.initial)])
+        supports = array("Q", [support(net.initial)])
+
+        fired = bytearray(len(net.transition_names))
+        unbounded = set()
+        frontier = [0]
+
+        while frontier:
+            records = [store.get(i) for i in frontier]
+            width = codec.width
+            children = expand(net, width, records)
+
+            next_frontier = []
+            for parent, successors_ in zip(frontier, children):
+                if not successors_:
+                    report.deadlock_count += 1
+                    if len(report.deadlocks) < self.max_deadlocks:
+                        report.deadlocks.append(
+                            codec.decode(store.get(parent))
+                        )
+                    continue
+
+                for t, child, total in successors_:
+                    fired[t] = 1
+                    report.edges += 1
+
+                    if isinstance(child, list):
+                        # Widen the encoding, unless an earlier
+                        # successor already did
+                        most = max(child)
+                        if most > codec.max_tokens:
+                            codec = MarkingCodec.fitting(len(child), most)
+                            store = store.recode(codec)
+                        child = codec.encode(child)
+                    elif width != codec.width:
+                        # Packed before the encoding was widened
+                        child = codec.encode(
+                            MarkingCodec(codec.places, width).decode(child)
+                        )
+
+                    i, new = store.add(child)
+                    if not new:
+                        continue
+
+                    if self.grows:
+                        parents.append(parent)
+                        totals.append(total)
+                        supports.append(support(codec.decode(child)))
+                        grown = self._covered_ancestor(
+                            store, parents, totals, supports, parent, i
+                        )
+                        if grown:
+                            unbounded.update(grown)
+                            report.complete = False
+                            continue
+                    next_frontier.append(i)
+
+            frontier = next_frontier
+            if store.count >= self.max_states:
+                report.complete = False
+                break
+
+        report.states = store.count
+        report.dead_transitions = [
+            name for name, f in zip(net.transition_names, fired) if not f
+        ]
+        report.unbounded_places = [
+            net.place_names[p] for p in sorted(unbounded)
+        ]
+        report.elapsed = time.perf_counter() - start
+        report.marking_bytes = codec.size
+        report.store_bytes = store.nbytes() + sum(
+            column.itemsize * len(column)
+            for column in (parents, totals, supports)
+        )
+        return report
+
+    @staticmethod
+    def _covered_ancestor(
+        store: StateStore,
+        parents: array,
+        totals: array,
+        supports: array,
+        parent: int,
+        child: int,
+    ) -> List[int]:
+        """Places where the marking [child] strictly covers one of its
+        ancestors, none if it covers none. Only ancestors with fewer tokens
+        and no marked place outside of the ones of [child] can be strictly
+        covered, so the others aren't compared."""
+        codec = store.codec
+        record = store.get(child)
+        total = totals[child]
+        outside = ~supports[child]
+        i = parent
+        while i >= 0:
+            if totals[i] < total and not supports[i] & outside:
+                ancestor = store.get(i)
+                if codec.covers(record, ancestor):
+                    return [
+                        p
+                        for p, (c, a) in enumerate(
+                            zip(codec.decode(record), codec.decode(ancestor))
+                        )
+                        if c > a
+                    ]
+            i = parents[i]
+        return []
+
+
+def build_parser() -> ArgumentParser:
+    parser = ArgumentParser(
+        prog="reachability",
+        description="Explore the reachable markings of a net, reporting"
+        " deadlocks, unbounded places and dead transitions.",
+    )
+
+    parser.add_argument(
+        "-n",
+        "--net",
+        type=lambda _str: cli.is_valid_file(parser, _str, ".net"),
+        help="path to a petri net file",
+        default=cli.DEFAULT_NETWORK_PATH,
+    )
+    parser.add_argument(
+        "-m",
+        "--max-states",
+        type=int,
+        help="stop after this many markings",
+        default=1_000_000,
+    )
+
+    return parser
+
+
+def format_marking(place_names: List[str], marking: List[int]) -> str:
+    marked = [
+        name if tokens == 1 else f"{name}*{tokens}"
+        for name, tokens in zip(place_names, marking)
+        if tokens > 0
+    ]
+    return " ".join(marked) if marked else "(empty)"
+
+
+def main():
+    args = build_parser().parse_args()
+    if args.max_states < 1:
+        build_parser().error("--max-states must be at least 1")
+
+    explorer = Explorer(network.parse(args.net), args.max_states)
+    report = explorer.run()
+    place_names = explorer.net.place_names
+
+    print(
+        f"{report.states} markings, {report.edges} arcs"
+        + ("" if report.complete else " (incomplete)")
+    )
+    print(
+        f"{report.states_per_second():,.0f} markings/s,"
+        f" {report.marking_bytes} B per packed marking,"
+        f" {report.bytes_per_state():.1f} B per marking stored"
+    )
+
+    print(f"Deadlocks: {report.deadlock_count}")
+    for marking in report.deadlocks:
+        print(f"  {format_marking(place_names, marking)}")
+    print(f"Unbounded places: {', '.join(report.unbounded_places) or '-'}")
+    dead = ", ".join(report.dead_transitions) or "-"
+    if report.complete:
+        print(f"Dead transitions: {dead}")
+    else:
+        print(f"Transitions not fired before stopping, maybe not dead: {dead}")
+
+
+if __name__ == "__main__":
+    main()
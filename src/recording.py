@@ -0,0 +1,129 @@
+import struct
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterator, List, Tuple, Union
+
+
+MAGIC = b"FTREC"
+VERSION = 1
+
+HEADER = struct.Struct("<5sBI")
+ADDRESS = struct.Struct("<I")
+
+# Every record is a run of identical consecutive input images: time of the
+# first read (seconds since the epoch), number of reads, then the bits
+RUN = struct.Struct("<dI")
+MAX_RUN = 2**32 - 1
+
+BUFFER_SIZE = 1 << 16
+
+
+def unpack(data: bytes, count: int) -> List[bool]:
+    """Booleans packed in bytes, the first one in the lowest bit."""
+    packed = int.from_bytes(data, "little")
+    return [bool(packed >> i & 1) for i in range(count)]
+
+
+def read_header(file: BinaryIO) -> List[int]:
+    raw = file.read(HEADER.size)
+    if len(raw) < HEADER.size:
+        raise ValueError("Truncated recording header")
+    magic, version, count = HEADER.unpack(raw)
+    if magic != MAGIC:
+        raise ValueError("Not an input recording")
+    if version != VERSION:
+        raise ValueError(f"Unsupported recording version {version}")
+
+    raw = file.read(ADDRESS.size * count)
+    if len(raw) < ADDRESS.size * count:
+        raise ValueError("Truncated recording header")
+    return [
+        ADDRESS.unpack_from(raw, ADDRESS.size * i)[0] for i in range(count)
+    ]
+
+
+class InputRecorder:
+    """Append-only log of the input images read by a controller.
+
+    Consecutive identical images are stored as a single run, so an idle
+    plant costs almost nothing, and the file is written through a large
+    buffer so recording doesn't add I/O to every loop.
+    """
+
+    def __init__(self, filepath: Union[Path, str], addresses: List[int]):
+        # Images are given as bitsets of the addresses in order, like
+        # [Controller.image], so they are written as they are
+        self.addresses = sorted(addresses)
+
+        path = Path(filepath)
+        if path.is_file() and path.stat().st_size > 0:
+            # Keep appending to an existing recording of the same inputs
+            with open(path, "rb") as file:
+                if read_header(file) != self.addresses:
+                    raise ValueError(
+                        f"Recording '{filepath}' has other input addresses"
+                    )
+            self.file = open(path, "ab", buffering=BUFFER_SIZE)
+        else:
+            self.file = open(path, "wb", buffering=BUFFER_SIZE)
+            self.file.write(HEADER.pack(MAGIC, VERSION, len(self.addresses)))
+            for address in self.addresses:
+                self.file.write(ADDRESS.pack(address))
+
+        self._size = (len(self.addresses) + 7) // 8
+
+        self._bits: Union[bytes, None] = None
+        self._started_at = 0.0
+        self._count = 0
+
+    def append(self, timestamp: float, image: int):
+        """Record an input image, bit i being the value of the i-th address
+        in order."""
+        bits = image.to_bytes(self._size, "little")
+        if bits == self._bits and self._count < MAX_RUN:
+            self._count += 1
+            return
+
+        self._write_run()
+        self._bits = bits
+        self._started_at = timestamp
+        self._count = 1
+
+    def _write_run(self):
+        if self._count > 0:
+            self.file.write(RUN.pack(self._started_at, self._count))
+            self.file.write(self._bits)
+
+    def close(self):
+        self._write_run()
+        self._count = 0
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+class InputLog:
+    """Reader of a recording made by [InputRecorder]."""
+
+    def __init__(self, filepath: Union[Path, str]):
+        self.filepath = filepath
+        with open(filepath, "rb") as file:
+            self.addresses = read_header(file)
+            self._offset = file.tell()
+
+    def runs(self) -> Iterator[Tuple[float, int, Dict[int, bool]]]:
+        """(time, number of reads, values by address) of every run."""
+        size = (len(self.addresses) + 7) // 8
+        with open(self.filepath, "rb", buffering=BUFFER_SIZE) as file:
+            file.seek(self._offset)
+            while True:
+                raw = file.read(RUN.size + size)
+                if len(raw) < RUN.size + size:
+                    # A partial run is what's left by a crash, ignore it
+                    return
+                started_at, count = RUN.unpack_from(raw)
+                values = unpack(raw[RUN.size :], len(self.addresses))
+                yield started_at, count, dict(zip(self.addresses, values))
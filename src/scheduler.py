@@ -0,0 +1,104 @@
+import asyncio
+import time
+from typing import Union
+
+
+# Minimum time between two overrun reports
+REPORT_PERIOD_S = 1.0
+
+
+class TickScheduler:
+    """Runs the loops on absolute deadlines, so the period doesn't drift
+    with the time spent in each loop.
+
+    When [max_period] is larger than [period], the period is adaptive: it
+    goes back to [period] after a loop with activity and grows by
+    [backoff] after each idle one, up to [max_period]. A loop finishing
+    after the next deadline is an overrun: the next loop starts right away
+    and the deadlines that were missed are skipped instead of being run in
+    a burst.
+    """
+
+    def __init__(
+        self,
+        period: float,
+        max_period: Union[float, None] = None,
+        backoff: float = 2.0,
+    ):
+        if period <= 0:
+            raise ValueError("Period must be positive.")
+        if max_period is None:
+            max_period = period
+        if max_period < period:
+            raise ValueError("Maximum period must be at least the period.")
+        if backoff < 1:
+            raise ValueError("Backoff must be at least one.")
+
+        self.min_period = period
+        self.max_period = max_period
+        self.backoff = backoff
+
+        self.period = period
+        self.deadline = time.perf_counter()
+
+        self.ticks = 0
+        self.overruns = 0
+        self.missed = 0
+        self._reported_overruns = 0
+        self._reported_at = self.deadline
+
+    def restart(self):
+        """Start counting the deadlines from now, eg. after reconnecting."""
+        self.period = self.min_period
+        self.deadline = time.perf_counter()
+
+    def delay(
+        self, active: bool = True, until: Union[float, None] = None
+    ) -> float:
+        """Schedule the next loop, returning how long to wait for it. The
+        loop runs at [until] instead when it is earlier, eg. when a timed
+        transition is due, and the next deadlines count from there."""
+        self.ticks += 1
+        if active:
+            self.period = self.min_period
+        else:
+            self.period = min(self.period * self.backoff, self.max_period)
+
+        now = time.perf_counter()
+        self.deadline += self.period
+        if until is not None and until < self.deadline:
+            self.deadline = max(until, now)
+        if now <= self.deadline:
+            return self.deadline - now
+
+        self.overruns += 1
+        self.missed += int((now - self.deadline) / self.period)
+        self.deadline = now
+        return 0.0
+
+    def wait(self, active: bool = True, until: Union[float, None] = None):
+        """Sleep until the next deadline."""
+        delay = self.delay(active, until)
+        if delay > 0:
+            time.sleep(delay)
+
+    async def wait_async(
+        self, active: bool = True, until: Union[float, None] = None
+    ):
+        """Sleep until the next deadline, without blocking the event loop."""
+        await asyncio.sleep(self.delay(active, until))
+
+    def report(self) -> Union[str, None]:
+        """Describe the overruns since the last report, at most once every
+        REPORT_PERIOD_S seconds."""
+        now = time.perf_counter()
+        overruns = self.overruns - self._reported_overruns
+        if overruns == 0 or now - self._reported_at < REPORT_PERIOD_S:
+            return None
+
+        self._reported_overruns = self.overruns
+        self._reported_at = now
+        return (
+            f"{overruns} loops overran their {self.period * 1000:g} ms"
+            f" period ({self.missed} deadlines skipped in total)"
+        )
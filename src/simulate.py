@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+"""Headless simulation: the controller of a net driven by sensor edges
+generated at random or read from a script, without Modbus nor sleeping,
+to soak-test a net with millions of events before it runs a real plant.
+
+Edges go through [Controller.evaluate], so transitions are bound to the
+events of the device and fired exactly as they are on a plant.
+"""
+import random
+import time
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import List, Tuple, Union
+
+import cli
+from controller import Controller
+from modbus.server import parse_script
+from net_cache import Device, load_inputs
+from parsers.device import TriggerTypes
+from petri_net import PetriNet
+from reachability import format_marking
+from timers import time_unit
+from transition_index import TransitionIndex
+
+
+DEFAULT_EVENTS = 100_000
+MAX_REPORTED_DEADLOCKS = 10
+
+
+class SimulatedController(Controller):
+    """Controller whose input image is set by the simulation. Its coil
+    writes are only counted, and its clock is virtual: each loop lasts
+    [cli.DEFAULT_SLEEP_S]."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(None, *args, **kwargs)
+        self.coil_writes = 0
+        self.now = 0.0
+
+    def connect(self, _: Union[Tuple[str, int], None]):
+        return None
+
+    def clock(self) -> float:
+        return self.now
+
+    def step(self, image: int) -> bool:
+        """A loop reading [image], returns whether a transition fired"""
+        self.update(image)
+        self.evaluate()
+        self.flush()
+        self.metrics.ticks += 1
+        self.now += cli.DEFAULT_SLEEP_S
+        return self.fired
+
+    def flush(self):
+        self.coil_writes += len(self.coils.changes())
+        self.coils.commit()
+
+    def __exit__(self, *_):
+        self.sync_marking()
+
+
+def script_edges(
+    script: List[Tuple[float, str]], controller: Controller
+) -> List[Tuple[int, bool]]:
+    """(mask in the image, value) of each step of a script, as
+    [FlexFactStandIn.apply] sets them. Times are ignored, only the order
+    matters"""
+    edges = []
+    for _, step in script:
+        if "=" in step:
+            raw_address, raw_value = step.split("=", 1)
+            address = int(raw_address)
+            value = raw_value.strip().lower() in ("1", "true")
+        else:
+            event = controller.inputs.get(step)
+            if event is None or not event.triggers:
+                raise ValueError(f"Unknown input event '{step}'")
+            address = event.triggers[0].address
+            value = event.triggers[0].type == TriggerTypes.POSITIVE_EDGE
+
+        # Inputs the net doesn't read can't change anything
+        mask = controller.bits.get(address)
+        if mask is not None:
+            edges.append((mask, value))
+    return edges
+
+
+def is_dead(petri_network: PetriNet) -> bool:
+    """Whether no transition is enabled, whatever the inputs do next"""
+    return not any(t.is_enabled() for t in petri_network.transitions)
+
+
+@dataclass
+class Result:
+    """Outcome of simulating one instance of the net."""
+
+    instance: int
+    events: int = 0
+    loops: int = 0
+    coil_writes: int = 0
+    fired: List[int] = field(default_factory=list)
+
+    # Number of events after which the net was dead, and its marking
+    deadlock: Union[Tuple[int, List[int]], None] = None
+
+    # Number of events after which unconditional transitions kept firing,
+    # see [Controller.evaluate]
+    livelock: Union[int, None] = None
+
+
+# What the worker processes simulate, set by their initializer, and the
+# initial marking every instance starts from
+_worker_inputs: Union[Tuple[PetriNet, Device, TransitionIndex], None] = None
+_worker_initial: List[int] = []
+
+
+def _init_worker(net: Path, device: Path, use_cache: bool):
+    global _worker_inputs, _worker_initial
+    _worker_inputs = load_inputs(net, device, use_cache)
+    _worker_initial = _worker_inputs[0].get_marking()
+
+
+def simulate(
+    instance: int,
+    events: int,
+    seed: int,
+    script: Union[List[Tuple[float, str]], None] = None,
+) -> Result:
+    """Run one instance of the net of the process from its initial
+    marking, on [events] random edges or on a script."""
+    petri_network, (_, inputs, outputs, remote_image, timing), index = (
+        _worker_inputs
+    )
+    for place, tokens in zip(petri_network.places, _worker_initial):
+        place.tokens = tokens
+
+    result = Result(instance)
+    with SimulatedController(
+        petri_network,
+        inputs,
+        outputs,
+        remote_image,
+        index=index,
+        time_unit=time_unit(timing.time_scale),
+    ) as controller:
+        controller.prefix = f"[{instance}] "
+        image = 0
+
+        # The inputs that trigger some transition, edges of the other ones
+        # can't change anything
+        masks = [
+            controller.bits[address]
+            for address, transitions in zip(
+                controller.image_addresses, controller.by_bit
+            )
+            if transitions
+        ]
+        if script is not None:
+            edges = script_edges(script, controller)
+        elif masks:
+            rng = random.Random(f"{seed}-{instance}")
+            edges = ((rng.choice(masks), None) for _ in range(events))
+        else:
+            edges = iter(())
+
+        # An instance stops once it is dead or livelocked, nothing changes
+        # after that. Being dead only depends on the marking, so it's
+        # checked on the initial one, then after every step that fired
+        if is_dead(petri_network):
+            result.deadlock = (0, petri_network.get_marking())
+        else:
+            # Unconditional transitions may fire before any edge
+            if controller.step(image) and is_dead(petri_network):
+                result.deadlock = (0, petri_network.get_marking())
+            if controller.livelocked:
+                result.livelock = 0
+
+        for mask, value in edges:
+            if result.deadlock is not None or result.livelock is not None:
+                break
+            if value is None:
+                image ^= mask
+            elif bool(image & mask) != value:
+                image ^= mask
+            else:
+                continue
+
+            result.events += 1
+            if controller.step(image) and is_dead(petri_network):
+                result.deadlock = (result.events, petri_network.get_marking())
+            if controller.livelocked:
+                result.livelock = result.events
+
+        result.loops = controller.metrics.ticks
+        result.coil_writes = controller.coil_writes
+        result.fired = controller.metrics.fired
+    return result
+
+
+def build_parser() -> ArgumentParser:
+    parser = ArgumentParser(
+        prog="simulate",
+        description="Drive a net with random or scripted sensor edges,"
+        " without FlexFact, reporting events/s, deadlocks and the"
+        " transitions fired.",
+    )
+
+    parser.add_argument(
+        "-n",
+        "--net",
+        type=lambda _str: cli.is_valid_file(parser, _str, ".net"),
+        help="path to a Petri net file",
+        default=cli.DEFAULT_NETWORK_PATH,
+    )
+    parser.add_argument(
+        "-d",
+        "--device",
+        type=lambda _str: cli.is_valid_file(parser, _str, ".dev"),
+        help="path to a device config file",
+        default=cli.DEFAULT_DEVICE_PATH,
+    )
+    parser.add_argument(
+        "-s",
+        "--script",
+        type=Path,
+        help="run every instance on this script of sensor edges, as the"
+        " stand-in's, instead of random edges. Times are ignored",
+        default=None,
+    )
+    parser.add_argument(
+        "-e",
+        "--events",
+        type=int,
+        help="random sensor edges per instance",
+        default=DEFAULT_EVENTS,
+    )
+    parser.add_argument(
+        "-i",
+        "--instances",
+        type=int,
+        help="independent instances of the net, each from its initial"
+        " marking",
+        default=1,
+    )
+    parser.add_argument(
+        "-j",
+        "--processes",
+        type=int,
+        help="worker processes running the instances",
+        default=1,
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        help="seed of the random edges, each instance gets its own stream",
+        default=0,
+    )
+    parser.add_argument(
+        "--no-cache",
+        dest="use_cache",
+        action="store_false",
+        help="always parse the net and device files",
+    )
+
+    return parser
+
+
+def main():
+    parser = build_parser()
+    args = parser.parse_args()
+    if args.events < 0:
+        parser.error("--events should be positive or zero")
+    if args.instances < 1 or args.processes < 1:
+        parser.error("--instances and --processes must be at least 1")
+
+    script = None
+    if args.script is not None:
+        try:
+            script = parse_script(args.script)
+        except (OSError, ValueError) as e:
+            parser.error(f"Invalid script: {e}")
+
+    # Every process loads the net once and runs its instances in turn, this
+    # one too for the names in the report
+    init = (args.net, args.device, args.use_cache)
+    _init_worker(*init)
+    jobs = [
+        (instance, args.events, args.seed, script)
+        for instance in range(args.instances)
+    ]
+    start = time.perf_counter()
+    try:
+        if args.processes > 1:
+            with ProcessPoolExecutor(
+                min(args.processes, args.instances),
+                initializer=_init_worker,
+                initargs=init,
+            ) as pool:
+                results = list(pool.map(simulate, *zip(*jobs)))
+        else:
+            results = [simulate(*job) for job in jobs]
+    except ValueError as e:
+        print(f"Can't simulate {args.net}: {e}")
+        raise SystemExit(1)
+    elapsed = time.perf_counter() - start
+
+    petri_network = _worker_inputs[0]
+    names = [t.name for t in petri_network.transitions]
+    place_names = [p.name for p in petri_network.places]
+
+    events = sum(r.events for r in results)
+    fired = [sum(counts) for counts in zip(*(r.fired for r in results))]
+    print(
+        f"{len(results)} instances of {args.net}: {events} events,"
+        f" {sum(r.loops for r in results)} loops, {sum(fired)} firings,"
+        f" {sum(r.coil_writes for r in results)} coil writes"
+    )
+    print(
+        f"{events / elapsed if elapsed else 0.0:,.0f} events/s"
+        f" in {elapsed:.2f} s"
+    )
+
+    deadlocked = [r for r in results if r.deadlock is not None]
+    print(f"Deadlocks: {len(deadlocked)}")
+    for r in deadlocked[:MAX_REPORTED_DEADLOCKS]:
+        after, marking = r.deadlock
+        print(
+            f"  instance {r.instance} after {after} events:"
+            f" {format_marking(place_names, marking)}"
+        )
+
+    livelocked = [r for r in results if r.livelock is not None]
+    print(f"Livelocks: {len(livelocked)}")
+    for r in livelocked[:MAX_REPORTED_DEADLOCKS]:
+        print(f"  instance {r.instance} after {r.livelock} events")
+
+    never = [name for name, count in zip(names, fired) if not count]
+    print(f"Coverage: {len(names) - len(never)}/{len(names)} transitions")
+    print(f"Never fired: {', '.join(never) or '-'}")
+
+
+if __name__ == "__main__":
+    main()
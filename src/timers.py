@@ -0,0 +1,191 @@
+from heapq import heappop, heappush
+from typing import Dict, List, Set, Tuple, Union
+
+from petri_net import UNTIMED, InputArcTypes, PetriNet, Transition
+from transition_index import TransitionIndex
+
+
+# Seconds per time unit of the intervals when the device file doesn't
+# declare a TimeScale
+DEFAULT_TIME_UNIT_S = 1.0
+
+# Slack on the comparisons of clocks, so a transition due at a deadline
+# fires on the loop woken up for it
+EPSILON_S = 1e-9
+
+
+def time_unit(time_scale: Union[int, None]) -> float:
+    """Seconds per time unit, from the TimeScale of the device (in
+    milliseconds per time unit)"""
+    if time_scale is None or time_scale <= 0:
+        return DEFAULT_TIME_UNIT_S
+    return time_scale / 1000
+
+
+class Timers:
+    """
+    Enabling clocks of the timed transitions of a net, ie. the ones whose
+    interval isn't [0,w[, as in time Petri nets: the clock of a transition
+    starts when it becomes enabled, and it can only fire once its clock is
+    within its interval. Open and closed bounds are the same, the clocks
+    are only read once per loop anyway.
+
+    A transition is newly enabled, and its clock restarts, when it fires
+    or when a firing disables it for a moment, ie. it isn't enabled by the
+    marking once the transition that fired took its tokens but before it
+    produced new ones. Unconditional transitions fire at the start of
+    their interval (earliest firing), even if their loop runs after its
+    end: these deadlines are kept in a heap, so waiting costs nothing on
+    each loop and the scheduler can sleep until the next one. Transitions
+    of input events fire on an edge within their interval, the edges
+    before or after it are ignored.
+
+    Stopwatch arcs, which would suspend the clock of a transition, aren't
+    supported: a timed transition with any raises ValueError.
+    """
+
+    def __init__(
+        self,
+        petri_network: PetriNet,
+        index: TransitionIndex,
+        unit: float = DEFAULT_TIME_UNIT_S,
+    ):
+        transitions = petri_network.transitions
+        self.transitions = transitions
+        for t in transitions:
+            if t.stopwatch_arcs and t.interval != UNTIMED:
+                raise ValueError(
+                    f"Transition '{t.name}' has an interval and stopwatch"
+                    " arcs, clocks can't be suspended"
+                )
+
+        # Bounds of the interval of each timed transition, in seconds
+        self.bounds: Dict[int, Tuple[float, float]] = {
+            i: (
+                t.interval.low * unit,
+                float("inf")
+                if t.interval.high is None
+                else t.interval.high * unit,
+            )
+            for i, t in enumerate(transitions)
+            if t.interval != UNTIMED
+        }
+        self.unconditional: Set[int] = {
+            i for i in self.bounds if index.triggers[i] is None
+        }
+
+        # Timed transitions whose enabling may change when each transition
+        # fires: the ones reading from a place whose tokens it moves, and
+        # itself
+        by_place: Dict[str, Set[int]] = {}
+        for i in self.bounds:
+            for arc in transitions[i].input_arcs:
+                by_place.setdefault(arc.place.name, set()).add(i)
+        self.dependents: List[List[int]] = []
+        for i, transition in enumerate(transitions):
+            changed = [arc.place.name for arc in transition.input_arcs] + [
+                arc.place.name for arc in transition.output_arcs
+            ]
+            dependents = set(
+                j for name in changed for j in by_place.get(name, ())
+            )
+            if i in self.bounds:
+                dependents.add(i)
+            self.dependents.append(sorted(dependents))
+
+        # Tokens produced in each place by each transition, to tell whether
+        # a firing disabled another transition for a moment
+        self.produced: List[Dict[str, int]] = []
+        for transition in transitions:
+            produced: Dict[str, int] = {}
+            for arc in transition.output_arcs:
+                produced[arc.place.name] = (
+                    produced.get(arc.place.name, 0) + arc.weight
+                )
+            self.produced.append(produced)
+
+        # Time at which each enabled timed transition was enabled, and the
+        # (deadline, transition, enabled at) of the unconditional ones. An
+        # entry is stale once its transition was enabled again
+        self.enabled_at: Dict[int, float] = {}
+        self.deadlines: List[Tuple[float, int, float]] = []
+        self.started = False
+
+    def start(self, now: float):
+        """Start the clocks of the timed transitions enabled by the current
+        marking, eg. the initial one."""
+        self.enabled_at.clear()
+        self.deadlines.clear()
+        for i in self.bounds:
+            if self.transitions[i].is_enabled():
+                self.enable(i, now)
+        self.started = True
+
+    def enable(self, i: int, now: float):
+        self.enabled_at[i] = now
+        if i in self.unconditional:
+            heappush(self.deadlines, (now + self.bounds[i][0], i, now))
+
+    def due(self, now: float) -> List[int]:
+        """Unconditional transitions whose clock reached their interval
+        since the last call."""
+        due = []
+        deadlines = self.deadlines
+        while deadlines and deadlines[0][0] <= now + EPSILON_S:
+            _, i, enabled_at = heappop(deadlines)
+            if self.enabled_at.get(i) == enabled_at:
+                due.append(i)
+        return due
+
+    def next_deadline(self) -> Union[float, None]:
+        """Time of the next firing of an unconditional transition, if any."""
+        deadlines = self.deadlines
+        while deadlines:
+            deadline, i, enabled_at = deadlines[0]
+            if self.enabled_at.get(i) == enabled_at:
+                return deadline
+            heappop(deadlines)
+        return None
+
+    def can_fire(self, i: int, now: float) -> bool:
+        """Whether the clock of a timed transition is within its interval"""
+        enabled_at = self.enabled_at.get(i)
+        if enabled_at is None:
+            return False
+        low, high = self.bounds[i]
+        elapsed = now - enabled_at
+        if low > elapsed + EPSILON_S:
+            return False
+        # An unconditional transition fires on the loop run for its
+        # deadline, which is always a bit late: past its interval is only
+        # the jitter of the scheduler
+        return i in self.unconditional or elapsed <= high + EPSILON_S
+
+    def fired(self, i: int, now: float):
+        """Update the clocks of the timed transitions after [i] fired"""
+        transitions = self.transitions
+        produced = self.produced[i]
+        enabled_at = self.enabled_at
+        for j in self.dependents[i]:
+            transition = transitions[j]
+            if not transition.is_enabled():
+                enabled_at.pop(j, None)
+            elif (
+                j == i
+                or j not in enabled_at
+                or not enabled_before(transition, produced)
+            ):
+                self.enable(j, now)
+
+
+def enabled_before(transition: Transition, produced: Dict[str, int]) -> bool:
+    """Whether a transition was enabled by the marking before the tokens
+    of a firing were [produced]"""
+    for arc in transition.input_arcs:
+        tokens = arc.place.tokens - produced.get(arc.place.name, 0)
+        if arc.type == InputArcTypes.INHIBITOR:
+            if tokens >= arc.weight:
+                return False
+        elif tokens < arc.weight:
+            return False
+    return True
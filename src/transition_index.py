@@ -0,0 +1,99 @@
+from typing import Dict, List, Set, Union
+
+from parsers.device import InputEvent, OutputEvent, Trigger
+from petri_net import InputArcTypes, PetriNet
+from special_tokens import strip_name, COMMENT
+
+
+class TransitionIndex:
+    """Bindings between the transitions of a net and the FlexFact events,
+    computed once so the controller only looks at the transitions that can
+    fire on a given loop.
+
+    A transition named after an input event (and not starting with ;) only
+    fires on an edge of one of its triggers. Every other transition is
+    unconditional and fires as soon as it is enabled, so it only needs to
+    be checked again when one of the places it reads from changes.
+    """
+
+    def __init__(
+        self,
+        petri_network: PetriNet,
+        inputs: Dict[str, InputEvent],
+        outputs: Dict[str, OutputEvent],
+    ):
+        transitions = petri_network.transitions
+
+        # Triggers of each transition, None for unconditional ones
+        self.triggers: List[Union[List[Trigger], None]] = []
+
+        # Output events written when each transition fires. Note that ; is
+        # also used to separate between command in the name, so you can use
+        # less places
+        self.events: List[List[str]] = []
+
+        # Transitions that may fire on an edge of an input address
+        self.by_address: Dict[int, List[int]] = {}
+
+        for i, transition in enumerate(transitions):
+            name = strip_name(transition.name)
+            if not transition.name.startswith(COMMENT) and name in inputs:
+                triggers = inputs[name].triggers
+                for trigger in triggers:
+                    candidates = self.by_address.setdefault(
+                        trigger.address, []
+                    )
+                    if i not in candidates:
+                        candidates.append(i)
+                self.triggers.append(triggers)
+            else:
+                self.triggers.append(None)
+
+            events = []
+            if name in outputs:
+                values = transition.name.split(COMMENT)
+                if values[0]:
+                    events = [strip_name(v) for v in values]
+            self.events.append(events)
+
+        # Unconditional transitions whose enabling depends on each place,
+        # through any kind of input arc
+        by_place: Dict[str, Set[int]] = {}
+        for i, transition in enumerate(transitions):
+            if self.triggers[i] is None:
+                for arc in transition.input_arcs:
+                    by_place.setdefault(arc.place.name, set()).add(i)
+
+        # Unconditional transitions to check again after each transition
+        # fires, ie. the ones reading from a place whose tokens it moves
+        self.dependents: List[List[int]] = []
+        for transition in transitions:
+            changed = [
+                arc.place.name
+                for arc in transition.input_arcs
+                if arc.weight and arc.type == InputArcTypes.REGULAR
+            ] + [
+                arc.place.name for arc in transition.output_arcs if arc.weight
+            ]
+            self.dependents.append(
+                sorted(
+                    set(
+                        j
+                        for place_name in changed
+                        for j in by_place.get(place_name, ())
+                    )
+                )
+            )
+
+        self.unconditional = [
+            i for i, triggers in enumerate(self.triggers) if triggers is None
+        ]
+
+        # Unconditional transitions to check on the next loop. All of them
+        # are checked on the first one
+        self.pending: Set[int] = set(self.unconditional)
+
+    def invalidate(self):
+        """Check every unconditional transition on the next loop, eg. after
+        the marking was changed from outside the controller."""
+        self.pending.update(self.unconditional)
@@ -0,0 +1,84 @@
+import asyncio
+import socket
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from modbus.server import FlexFactStandIn  # noqa: E402
+from parsers import device  # noqa: E402
+
+
+def device_file(inputs: int, events: str) -> str:
+    return (
+        '<?xml version="1.0" encoding="ISO-8859-1" standalone="no"?>\n'
+        '<ModbusDevice name="test">\n'
+        '    <TimeScale value="10" />\n'
+        '    <SampleInterval value="10" />\n'
+        '    <SynchronousWrite value="true" />\n'
+        '    <Role value="master" />\n'
+        '    <SlaveAddress value="localhost:1502" />\n'
+        "    <RemoteImage>\n"
+        f'        <Inputs mbaddr="0" count="{inputs}" />\n'
+        '        <Outputs mbaddr="0" count="1" />\n'
+        "    </RemoteImage>\n"
+        f"    <EventConfiguration>\n{events}    </EventConfiguration>\n"
+        "</ModbusDevice>\n"
+    )
+
+
+@pytest.fixture
+def sensors(tmp_path):
+    """Device with events 'a' and 'b' on the rising edges of inputs 0 and
+    1, and 'on' and 'off' setting and clearing coil 0, as (inputs,
+    outputs, remote_image)"""
+    events = "".join(
+        f'        <Event name="{name}" iotype="input">\n'
+        "            <Triggers>\n"
+        f'                <PositiveEdge address="{address}" />\n'
+        "            </Triggers>\n"
+        "        </Event>\n"
+        for address, name in enumerate("ab")
+    ) + "".join(
+        f'        <Event name="{name}" iotype="output">\n'
+        "            <Actions>\n"
+        f'                <{action} address="0" />\n'
+        "            </Actions>\n"
+        "        </Event>\n"
+        for name, action in (("on", "Set"), ("off", "Clr"))
+    )
+    path = tmp_path / "sensors.dev"
+    path.write_text(device_file(2, events))
+    _, inputs, outputs, remote_image, _ = device.parse(path)
+    return inputs, outputs, remote_image
+
+
+@pytest.fixture
+def standin(sensors):
+    """Stand-in slave of the sensors device on a free port, served on its
+    own thread and event loop"""
+    with socket.socket() as free:
+        free.bind(("127.0.0.1", 0))
+        port = free.getsockname()[1]
+    standin = FlexFactStandIn(*sensors, ("127.0.0.1", port))
+
+    loop = asyncio.new_event_loop()
+    serving = loop.create_task(standin.serve())
+
+    def serve():
+        try:
+            loop.run_until_complete(serving)
+        except asyncio.CancelledError:
+            pass
+
+    thread = threading.Thread(target=serve)
+    thread.start()
+    asyncio.run_coroutine_threadsafe(standin.started(), loop).result(5)
+    yield standin
+
+    loop.call_soon_threadsafe(serving.cancel)
+    thread.join(5)
+    loop.close()
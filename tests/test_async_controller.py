@@ -0,0 +1,79 @@
+import asyncio
+
+from async_controller import AsyncController
+from parsers import network
+
+
+# 'a' turns the coil on, 'b' turns it off
+NET = """net switch
+tr a p -> q
+tr on q -> r
+tr b r -> s
+tr off s -> p
+pl p (1)
+"""
+
+
+def test_writes_are_awaited_by_the_next_loop(standin):
+    async def run():
+        async with AsyncController(
+            standin.address,
+            network.parse_text(NET),
+            standin.inputs,
+            standin.outputs,
+            standin.remote_image,
+        ) as controller:
+            assert not await controller.loop_async()
+
+            standin.set_input(0, True)
+            assert await controller.loop_async()
+            assert controller.marking() == [0, 0, 1, 0]
+
+            # The writes are sent in the background, after the coils are
+            # read once
+            assert controller.flushing is not None
+            await asyncio.sleep(0.2)
+            assert standin.get_coil(0)
+            assert controller.coils.pending == {}
+
+            standin.set_input(1, True)
+            assert await controller.loop_async()
+            assert controller.flushing is not None
+            assert controller.coils.values == {0: True}
+
+            # Waiting on the next loop, or on exit
+            assert not await controller.loop_async()
+            assert controller.coils.values == {0: False}
+            assert not standin.get_coil(0)
+            return controller.metrics
+
+    metrics = asyncio.run(run())
+    # Every loop reads both inputs in one request. The coils are read once,
+    # before the first write, and each edge writes the coil once
+    assert [address for _, address, _ in standin.coil_writes] == [0, 0]
+    assert metrics.modbus.requests == 4 + 1 + 2
+
+
+def test_read_while_writing(standin):
+    # The coil write of the first edge is in flight while the next loop
+    # reads the inputs, the edge of that read is not missed
+    async def run():
+        async with AsyncController(
+            standin.address,
+            network.parse_text(NET),
+            standin.inputs,
+            standin.outputs,
+            standin.remote_image,
+        ) as controller:
+            await controller.loop_async()
+            standin.set_input(0, True)
+            await controller.loop_async()
+            standin.set_input(1, True)
+            await controller.loop_async()
+            return controller.marking()
+
+    assert asyncio.run(run()) == [1, 0, 0, 0]
+    assert [values for _, _, values in standin.coil_writes] == [
+        [True],
+        [False],
+    ]
@@ -0,0 +1,43 @@
+import pytest
+from pymodbus.bit_read_message import (
+    ReadCoilsRequest,
+    ReadCoilsResponse,
+    ReadDiscreteInputsRequest,
+    ReadDiscreteInputsResponse,
+)
+from pymodbus.bit_write_message import (
+    WriteMultipleCoilsRequest,
+    WriteMultipleCoilsResponse,
+    WriteSingleCoilRequest,
+    WriteSingleCoilResponse,
+)
+from pymodbus.pdu import ExceptionResponse
+from pymodbus.register_read_message import ReadHoldingRegistersResponse
+
+from modbus.client import ADU_OVERHEAD, adu_size
+
+
+def decoded(response, data):
+    response.decode(data)
+    return response
+
+
+@pytest.mark.parametrize(
+    "pdu",
+    [
+        ReadDiscreteInputsRequest(3, 70),
+        ReadCoilsRequest(0, 1),
+        ReadCoilsResponse([True] * 9),
+        # Decoded responses have whole bytes of bits
+        decoded(ReadDiscreteInputsResponse(), b"\x02\xff\x01"),
+        WriteSingleCoilRequest(4, True),
+        WriteSingleCoilResponse(4, False),
+        WriteMultipleCoilsRequest(2, [True, False] * 5),
+        WriteMultipleCoilsResponse(2, 10),
+        ExceptionResponse(0x0F, 2),
+        # Sized by encoding it
+        ReadHoldingRegistersResponse([1, 2, 3]),
+    ],
+)
+def test_adu_size(pdu):
+    assert adu_size(pdu) == ADU_OVERHEAD + len(pdu.encode())
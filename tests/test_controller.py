@@ -0,0 +1,182 @@
+import asyncio
+
+import pytest
+from pymodbus.datastore import ModbusSequentialDataBlock
+
+from async_controller import AsyncController
+from conftest import device_file
+from controller import Controller, edge_masks
+from modbus.client import (
+    RECONNECT_MAX_DELAY_S,
+    RECONNECT_MIN_DELAY_S,
+    reconnect_delays,
+)
+from parsers import device, network
+from parsers.device import Trigger, TriggerTypes
+from simulate import SimulatedController
+
+
+def controller(sensors, text="tr a p -> p\ntr b p -> p\npl p (1)\n"):
+    inputs, outputs, remote_image = sensors
+    return SimulatedController(
+        network.parse_text(text), inputs, outputs, remote_image
+    )
+
+
+def test_edge_masks():
+    bits = {3: 0b001, 5: 0b010, 8: 0b100}
+    triggers = [
+        Trigger(3, TriggerTypes.POSITIVE_EDGE),
+        Trigger(8, TriggerTypes.POSITIVE_EDGE),
+        Trigger(5, TriggerTypes.NEGATIVE_EDGE),
+    ]
+    assert edge_masks(triggers, bits) == (0b101, 0b010)
+    assert edge_masks([], bits) == (0, 0)
+
+
+def test_edges_of_the_image(sensors):
+    with controller(sensors) as c:
+        c.update(0b01)
+        assert (c.rising, c.falling) == (0b01, 0)
+        assert c.edges() == [0]
+
+        c.update(0b10)
+        assert (c.rising, c.falling) == (0b10, 0b01)
+        assert c.edges() == [0, 1]
+        assert c.read_values == {0: (True, False), 1: (False, True)}
+
+        c.update(0b10)
+        assert (c.rising, c.falling) == (0, 0)
+        assert c.edges() == []
+        assert c.read_values == {0: (False, False), 1: (True, True)}
+
+
+@pytest.mark.parametrize(
+    "images, fired",
+    [
+        # Rising edges only
+        ([0b01, 0b00, 0b01], [2, 0]),
+        ([0b11], [1, 1]),
+        # A held input has no edge
+        ([0b10, 0b10, 0b10], [0, 1]),
+        ([0b10, 0b01, 0b10], [1, 2]),
+    ],
+)
+def test_transitions_fire_on_their_edges(sensors, images, fired):
+    with controller(sensors) as c:
+        for image in images:
+            c.step(image)
+        assert c.metrics.fired == fired
+
+
+def test_negative_edges_of_sparse_addresses(tmp_path):
+    # Addresses far apart still take one bit each in the image
+    events = "".join(
+        f'        <Event name="e{address}" iotype="input">\n'
+        "            <Triggers>\n"
+        f'                <NegativeEdge address="{address}" />\n'
+        "            </Triggers>\n"
+        "        </Event>\n"
+        for address in (0, 70, 129)
+    )
+    path = tmp_path / "wide.dev"
+    path.write_text(device_file(130, events))
+    _, inputs, outputs, remote_image, _ = device.parse(path)
+    text = "tr e0 p -> p\ntr e70 p -> p\ntr e129 p -> p\npl p (1)\n"
+    with SimulatedController(
+        network.parse_text(text), inputs, outputs, remote_image
+    ) as c:
+        assert c.bits == {0: 1, 70: 2, 129: 4}
+        assert c.edge_masks == [(0, 1), (0, 2), (0, 4)]
+        c.step(0b111)
+        c.step(0b010)
+        assert c.metrics.fired == [1, 0, 1]
+
+
+# 'a' turns the coil on, 'b' turns it off
+SWITCH = """net switch
+tr a p -> q
+tr on q -> r
+tr b r -> s
+tr off s -> p
+pl p (1)
+"""
+
+
+def restart_slave(standin):
+    """Clear the coils as a restarted slave would, without it being
+    recorded as a write"""
+    ModbusSequentialDataBlock.setValues(standin.coils, 0, [False])
+
+
+def test_reconnect_delays():
+    delays = reconnect_delays()
+    first = [next(delays) for _ in range(3)]
+    assert first == [
+        RECONNECT_MIN_DELAY_S,
+        RECONNECT_MIN_DELAY_S * 2,
+        RECONNECT_MIN_DELAY_S * 4,
+    ]
+    assert max(next(delays) for _ in range(20)) == RECONNECT_MAX_DELAY_S
+
+
+def test_reconnect_keeps_the_state(standin):
+    with Controller(
+        standin.address,
+        network.parse_text(SWITCH),
+        standin.inputs,
+        standin.outputs,
+        standin.remote_image,
+    ) as c:
+        c.loop()
+        standin.set_input(0, True)
+        c.loop()
+        assert standin.get_coil(0)
+
+        # A write staged when the connection was reset is sent once the
+        # coils are read again, as the slave may have cleared them
+        restart_slave(standin)
+        c.write("on")
+        c.reconnect()
+        assert c.metrics.modbus.reconnects == 1
+        c.loop()
+        assert standin.get_coil(0)
+
+        # The input image is kept, a held input isn't a new edge
+        assert c.metrics.fired == [1, 1, 0, 0]
+        assert c.marking() == [0, 0, 1, 0]
+        standin.set_input(1, True)
+        c.loop()
+        assert c.metrics.fired == [1, 1, 1, 1]
+        assert not standin.get_coil(0)
+
+
+def test_reconnect_async(standin):
+    async def run():
+        async with AsyncController(
+            standin.address,
+            network.parse_text(SWITCH),
+            standin.inputs,
+            standin.outputs,
+            standin.remote_image,
+        ) as c:
+            await c.loop_async()
+            standin.set_input(0, True)
+            await c.loop_async()
+
+            # The writes in flight are awaited first
+            await c.reconnect_async()
+            assert c.flushing is None
+            assert c.client.connected
+            assert standin.get_coil(0)
+
+            restart_slave(standin)
+            c.write("on")
+            await c.reconnect_async()
+            await c.loop_async()
+            return c.metrics
+
+    metrics = asyncio.run(run())
+    assert standin.get_coil(0)
+    assert metrics.modbus.reconnects == 2
+    assert metrics.fired == [1, 1, 0, 0]
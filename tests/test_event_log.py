@@ -0,0 +1,78 @@
+import io
+import json
+
+import pytest
+
+import event_log
+from event_log import HEADER, EventLog, read
+from parsers import network
+from simulate import SimulatedController
+from transition_index import TransitionIndex
+
+
+# ;u can fire forever, so every loop stops after too many firings
+LIVELOCK = "net livelock\ntr ;u p -> p\ntr a q -> q\npl p (1)\n"
+
+
+def livelocked(sensors, log: EventLog, name: str) -> SimulatedController:
+    inputs, outputs, remote_image = sensors
+    petri_network = network.parse_text(LIVELOCK)
+    index = TransitionIndex(petri_network, inputs, outputs)
+    return SimulatedController(
+        petri_network,
+        inputs,
+        outputs,
+        remote_image,
+        index=index,
+        log=log.add_channel(name, petri_network, index),
+    )
+
+
+@pytest.mark.parametrize("name", ["", "plant"])
+def test_livelock_warning_once(sensors, name):
+    output = io.StringIO()
+    log = EventLog(output, level="events")
+    with livelocked(sensors, log, name) as controller:
+        for _ in range(3):
+            controller.step(0)
+        assert controller.livelocked
+    log.flush()
+
+    lines = output.getvalue().splitlines()
+    assert len(lines) == 1
+    prefix = f"[{name}] " if name else ""
+    assert lines[0].startswith(f"{prefix}Warning: unconditional transitions")
+
+
+def test_livelock_warning_jsonl(sensors):
+    output = io.StringIO()
+    log = EventLog(output, format="jsonl", level="events")
+    with livelocked(sensors, log, "") as controller:
+        controller.step(0)
+    log.flush()
+
+    (entry,) = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert entry["warning"] == "livelock"
+    assert entry["tick"] == 0
+
+
+def test_binary_log_of_another_version(tmp_path, sensors):
+    path = tmp_path / "log.evl"
+    with open(path, "wb") as file:
+        log = EventLog(file, format="binary")
+        with livelocked(sensors, log, "plant") as controller:
+            log.start()
+            controller.step(0)
+        log.close()
+
+    channels, records = read(path)
+    assert [c.name for c in channels] == ["plant"]
+    *_, last = records
+    assert last[0] == event_log.LIVELOCK
+
+    # The version is the byte after the magic
+    data = bytearray(path.read_bytes())
+    data[HEADER.size - 5] = 1
+    path.write_bytes(data)
+    with pytest.raises(ValueError, match="version 1"):
+        read(path)
@@ -0,0 +1,131 @@
+import pytest
+
+from modbus.image import CoilImage
+from parsers import network
+from simulate import SimulatedController
+
+
+class Response:
+    def __init__(self, bits=(), error=False):
+        self.bits = list(bits)
+        self.error = error
+
+    def isError(self):  # noqa: N802
+        return self.error
+
+
+class CoilClient:
+    """Stand-in for the Modbus client, with coils at Modbus address 0"""
+
+    def __init__(self, coils):
+        self.coils = list(coils)
+        self.requests = []
+        self.fail = False
+
+    def read_coils(self, start, count):
+        self.requests.append(("read", start, count))
+        # Responses are padded to whole bytes
+        bits = self.coils[start : start + count]
+        return Response(bits + [False] * (-len(bits) % 8))
+
+    def write_coils(self, start, values):
+        self.requests.append(("write", start, list(values)))
+        if self.fail:
+            return Response(error=True)
+        self.coils[start : start + len(values)] = values
+        return Response()
+
+
+def test_last_staged_action_wins():
+    coils = CoilImage()
+    coils.stage(3, True)
+    coils.stage(3, False)
+    coils.stage(4, True)
+    assert coils.changes() == {3: False, 4: True}
+    assert coils.get(3) is False
+    assert coils.get(5) is None
+
+
+def test_only_changes_are_written():
+    coils = CoilImage(mbaddr=100)
+    coils.load(0, [True, False, True, False], 4)
+    for address, value in [(0, True), (1, True), (2, False), (3, False)]:
+        coils.stage(address, value)
+    assert coils.changes() == {1: True, 2: False}
+    assert coils.write_ranges() == [(101, [True, False])]
+
+    coils.commit()
+    assert coils.changes() == {}
+    assert [coils.get(a) for a in range(4)] == [True, True, False, False]
+
+
+def test_write_ranges_are_contiguous():
+    coils = CoilImage(max_count=2)
+    for address in (0, 1, 2, 5):
+        coils.stage(address, True)
+    assert coils.write_ranges() == [
+        (0, [True, True]),
+        (2, [True]),
+        (5, [True]),
+    ]
+
+
+def test_take_sent_and_restore():
+    coils = CoilImage()
+    coils.stage(0, True)
+    coils.stage(1, True)
+    taken = coils.take()
+    assert coils.pending == {}
+
+    # Staged while the taken writes are in flight, they win over the
+    # taken ones when these fail
+    coils.stage(1, False)
+    coils.restore(taken)
+    assert coils.pending == {0: True, 1: False}
+
+    taken = coils.take()
+    coils.sent(taken)
+    assert coils.changes() == {}
+    assert (coils.get(0), coils.get(1)) == (True, False)
+
+
+def test_sync_and_flush():
+    client = CoilClient([True, False, True])
+    coils = CoilImage()
+    coils.sync(client, 3)
+    assert client.requests == [("read", 0, 3)]
+    assert coils.values == {0: True, 1: False, 2: True}
+
+    coils.stage(0, True)
+    coils.stage(1, True)
+    assert coils.flush(client) == 1
+    assert client.requests[-1] == ("write", 1, [True])
+    assert client.coils == [True, True, True]
+    assert coils.flush(client) == 0
+
+
+def test_failed_flush_keeps_the_writes():
+    client = CoilClient([False])
+    client.fail = True
+    coils = CoilImage()
+    coils.load(0, [False], 1)
+    coils.stage(0, True)
+    with pytest.raises(ConnectionResetError):
+        coils.flush(client)
+    assert coils.changes() == {0: True}
+
+
+def test_controller_writes_once_per_loop(sensors):
+    inputs, outputs, remote_image = sensors
+    # 'a' turns the coil on and off in the same loop, then on again
+    net = network.parse_text(
+        "tr a p -> q\ntr on q -> r\ntr off r -> s\ntr onX2 s -> t\n"
+        "pl p (1)\n"
+    )
+    with SimulatedController(net, inputs, outputs, remote_image) as c:
+        c.step(0)
+        assert c.coil_writes == 0
+        c.step(0b01)
+        assert c.marking() == [0, 0, 0, 0, 1]
+        assert c.coil_writes == 1
+        assert c.coils.get(0) is True
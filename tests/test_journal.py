@@ -0,0 +1,38 @@
+import pytest
+
+import journal
+from journal import Journal, restore
+from parsers import network
+
+
+RING = """net ring
+tr t p -> q
+tr u q -> p
+pl p (1)
+"""
+
+
+@pytest.mark.parametrize("sync", journal.SYNC_POLICIES)
+def test_restore_after_snapshots(tmp_path, monkeypatch, sync):
+    monkeypatch.setattr(journal, "SNAPSHOT_FIRINGS", 8)
+    petri_network = network.parse_text(RING)
+    path = tmp_path / "ring.jnl"
+
+    # Loops firing t, u, t..., checking the journal in the middle of the
+    # background snapshots
+    written = Journal(path, petri_network, sync)
+    fired = 0
+    for loop in range(200):
+        for _ in range(loop % 3):
+            written.fired(fired % 2)
+            fired += 1
+        written.commit(lambda: [1 - fired % 2, fired % 2])
+        if loop % 10 == 0:
+            resumed = network.parse_text(RING)
+            restore(path, resumed)
+            assert resumed.get_marking() == [1 - fired % 2, fired % 2]
+
+    written.close([1 - fired % 2, fired % 2])
+    resumed = network.parse_text(RING)
+    assert restore(path, resumed) == 0
+    assert resumed.get_marking() == [1 - fired % 2, fired % 2]
@@ -0,0 +1,66 @@
+import os
+import subprocess
+import sys
+from multiprocessing import resource_tracker, shared_memory
+
+import pytest
+
+from live_view import HEADER, LiveReader, LiveView
+
+
+@pytest.fixture
+def name():
+    return f"ftlive-test-{os.getpid()}"
+
+
+def test_refuse_a_running_view(name):
+    view = LiveView(name, ["p"], [0], [0])
+    try:
+        with pytest.raises(FileExistsError, match=str(os.getpid())):
+            LiveView(name, ["p"], [0], [0])
+
+        # The view in use is left as it is
+        view.publish(3, 1, [2])
+        reader = LiveReader(name)
+        assert reader.read().marking == [2]
+        reader.close()
+    finally:
+        view.close()
+
+
+def test_replace_a_view_left_by_a_dead_controller(name):
+    dead = subprocess.Popen([sys.executable, "-c", "pass"])
+    dead.wait()
+
+    # Segment left as if written by the dead process, the pid is the last
+    # field of the header
+    stale = LiveView(name, ["p"], [0], [0])
+    fields = HEADER.unpack_from(stale.memory.buf)[:-1]
+    HEADER.pack_into(stale.memory.buf, 0, *fields, dead.pid)
+    view = LiveView(name, ["p", "q"], [0], [0])
+    try:
+        reader = LiveReader(name)
+        assert reader.place_names == ["p", "q"]
+        reader.close()
+    finally:
+        view.close()
+        stale.close()
+
+
+def test_refuse_a_segment_that_is_not_a_view(name):
+    other = shared_memory.SharedMemory(name, create=True, size=64)
+    try:
+        with pytest.raises(FileExistsError, match="isn't a live view"):
+            LiveView(name, ["p"], [0], [0])
+    finally:
+        # Taken as the segment of another process, which this one must not
+        # remove on exit
+        resource_tracker.register(other._name, "shared_memory")
+        other.close()
+        other.unlink()
+
+
+def test_close_a_removed_view(name):
+    view = LiveView(name, ["p"], [0], [0])
+    shared_memory.SharedMemory(name).unlink()
+    view.close()
@@ -0,0 +1,127 @@
+import pytest
+
+from conftest import device_file
+from lookup_table import SETTLE, LookupTable, compile_table
+from parsers import device, network
+from simulate import SimulatedController
+from transition_index import TransitionIndex
+
+
+# 'a' enables ;u, which comes before aX in the net: the controller checks
+# ;u first, and aX is no longer enabled when its turn comes
+RACE = """net race
+tr a p -> q
+tr ;u q -> s
+tr aX q -> r
+pl p (1)
+"""
+
+# Both edges at once, and unconditional transitions enabled by events of
+# either input
+BOTH = """net both
+tr ;v q r -> t
+tr a p -> q
+tr b p2 -> r
+tr aX t -> p
+tr ;w t -> u
+tr bX u -> p2 p
+pl p (1)
+pl p2 (1)
+"""
+
+# The initial marking isn't stable, and ;y enables ;x before it in the net
+CASCADE = """net cascade
+tr ;x q -> r
+tr ;y p -> q
+tr ;z p -> s
+tr a r -> p
+pl p (1)
+"""
+
+
+class FiredLog:
+    """Stand-in for the event log, keeping the fired transitions"""
+
+    def __init__(self):
+        self.transitions = []
+
+    def fired(self, tick: int, transition: int):
+        self.transitions.append(transition)
+
+    def coil(self, tick: int, address: int, value: bool):
+        pass
+
+
+def run(text, sensors, images, use_table):
+    """Names of the fired transitions and final marking of a net reading
+    each image in turn"""
+    inputs, outputs, remote_image = sensors
+    petri_network = network.parse_text(text)
+    table = None
+    if use_table:
+        table = compile_table(petri_network, inputs, outputs)
+    log = FiredLog()
+    with SimulatedController(
+        petri_network, inputs, outputs, remote_image, table=table, log=log
+    ) as controller:
+        for image in images:
+            controller.step(image)
+        marking = controller.marking()
+    names = [t.name for t in petri_network.transitions]
+    return [names[i] for i in log.transitions], marking
+
+
+def test_edge_fires_like_the_net(sensors):
+    net = run(RACE, sensors, [0, 1], use_table=False)
+    assert net == (["a", ";u"], [0, 0, 1, 0])
+    assert run(RACE, sensors, [0, 1], use_table=True) == net
+
+
+def test_edges_one_at_a_time(sensors):
+    images = [0, 1, 0, 2, 0, 1, 0, 2, 0, 1]
+    net = run(BOTH, sensors, images, use_table=False)
+    assert net[0]
+    assert run(BOTH, sensors, images, use_table=True) == net
+
+
+def test_initial_marking_settles_like_the_net(sensors):
+    images = [0, 1, 0, 1]
+    net = run(CASCADE, sensors, images, use_table=False)
+    assert net[0][:2] == [";y", ";x"]
+    assert run(CASCADE, sensors, images, use_table=True) == net
+
+
+def test_table_of_another_device(sensors, tmp_path):
+    inputs, outputs, _ = sensors
+    petri_network = network.parse_text(RACE)
+    table = compile_table(petri_network, inputs, outputs)
+    index = TransitionIndex(petri_network, inputs, outputs)
+    table.check(petri_network, index, outputs)
+
+    # 'a' moved to the other input
+    path = tmp_path / "moved.dev"
+    path.write_text(
+        device_file(
+            2,
+            '        <Event name="a" iotype="input">\n'
+            "            <Triggers>\n"
+            '                <PositiveEdge address="1" />\n'
+            "            </Triggers>\n"
+            "        </Event>\n",
+        )
+    )
+    _, moved, outputs, _, _ = device.parse(path)
+    index = TransitionIndex(petri_network, moved, outputs)
+    with pytest.raises(ValueError, match="other events"):
+        table.check(petri_network, index, outputs)
+
+
+def test_save_checks_the_sizes(sensors, tmp_path):
+    inputs, outputs, _ = sensors
+    table = compile_table(network.parse_text(RACE), inputs, outputs)
+    table.save(tmp_path / "race.tab")
+    assert LookupTable.load(tmp_path / "race.tab").steps == table.steps
+
+    table.edges = [f"{address}+" for address in range(SETTLE)]
+    with pytest.raises(ValueError, match="Too many input edges"):
+        table.save(tmp_path / "race.tab")
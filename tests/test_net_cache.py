@@ -0,0 +1,80 @@
+from net_cache import cache_path, code_digest, file_digest, load_inputs, read
+
+
+NET = "net cached\ntr a p -> q\ntr ;u q -> p\npl p (1)\n"
+
+# Every kind of arc, weight, interval, label, priority and note
+FULL_NET = """net full
+tr a : start [1,5] p*2 q?3 r?-1 s!2 t!-4 -> q u*3K
+tr ;u ]0,w[ q -> p
+tr b u -> s t
+pl p : stock (4)
+lb u buffer
+pr a > ;u
+nt n 1 some note
+"""
+
+
+def cached_files(tmp_path, text):
+    net = tmp_path / "cached.net"
+    net.write_text(text)
+    # Written by the sensors fixture
+    return net, tmp_path / "sensors.dev"
+
+
+def read_cache(net, dev):
+    digests = (file_digest(net), file_digest(dev))
+    return read(cache_path(net), *digests, code_digest())
+
+
+def test_round_trip(tmp_path, sensors):
+    net, dev = cached_files(tmp_path, FULL_NET)
+    parsed, parsed_device, index = load_inputs(net, dev)
+    cached, cached_device, cached_index = read_cache(net, dev)
+
+    assert cached.name == "full"
+    assert cached.places == parsed.places
+    # Arcs, weights, arc types, intervals, labels and stopwatch arcs
+    assert cached.transitions == parsed.transitions
+    assert cached.priorities == parsed.priorities == [("a", ";u")]
+    assert cached.notes == parsed.notes == {"n": "some note"}
+    assert cached_device == parsed_device
+    assert cached_index.by_address == index.by_address
+    assert cached_index.dependents == index.dependents
+
+    # The arcs share the places of the net, and behave like parsed ones
+    a = cached.get_transition("a")
+    assert all(
+        arc.place is cached.get_place(arc.place.name)
+        for arc in a.input_arcs + a.output_arcs + list(a.stopwatch_arcs)
+    )
+    assert not a.is_enabled()
+    cached.get_place("q").tokens = 3
+    assert a.try_fire()
+    assert cached.get_marking() == [2, 4, 0, 0, 0, 3000]
+
+
+def test_changed_source_is_parsed_again(tmp_path, sensors):
+    net, dev = cached_files(tmp_path, NET)
+    load_inputs(net, dev)
+    assert read_cache(net, dev) is not None
+
+    net.write_text(NET.replace("pl p (1)", "pl p (2)"))
+    # The old cache doesn't match the new file
+    assert read_cache(net, dev) is None
+    parsed, _, _ = load_inputs(net, dev)
+    assert parsed.get_marking() == [2, 0]
+    assert read_cache(net, dev)[0].get_marking() == [2, 0]
+
+
+def test_cache_of_other_code_is_stale(tmp_path, sensors):
+    net, dev = cached_files(tmp_path, NET)
+
+    parsed, _, _ = load_inputs(net, dev)
+    cached = read_cache(net, dev)
+    assert cached is not None
+    assert cached[0].get_marking() == parsed.get_marking()
+
+    # Written by another version of the code
+    digests = (file_digest(net), file_digest(dev))
+    assert read(cache_path(net), *digests, bytes(32)) is None
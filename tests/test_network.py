@@ -0,0 +1,143 @@
+import pytest
+
+from parsers import network
+from parsers.network import NetParseError
+from petri_net import UNTIMED, InputArcTypes, Interval
+
+
+def arcs(transition):
+    return [(a.place.name, a.type, a.weight) for a in transition.input_arcs]
+
+
+def outputs(transition):
+    return [(arc.place.name, arc.weight) for arc in transition.output_arcs]
+
+
+def test_descriptions():
+    net = network.parse_text(
+        "# comment\n"
+        "net plant\n"
+        "tr t : start [1,5] p*2 -> q\n"
+        "tr u q -> p\n"
+        "pl p : stock (3)\n"
+        "lb q buffer\n"
+        "pr t > u\n"
+        "nt n 1 some note\n"
+    )
+    assert net.name == "plant"
+    assert [p.name for p in net.places] == ["p", "q"]
+    assert [p.tokens for p in net.places] == [3, 0]
+    assert [p.label for p in net.places] == ["stock", "buffer"]
+
+    t, u = net.transitions
+    assert (t.name, t.label) == ("t", "start")
+    assert t.interval == Interval(1, 5, False, False)
+    assert arcs(t) == [("p", InputArcTypes.REGULAR, 2)]
+    assert outputs(t) == [("q", 1)]
+    assert (u.label, u.interval) == (None, UNTIMED)
+    assert net.priorities == [("t", "u")]
+    assert net.notes == {"n": "some note"}
+
+
+def test_priorities_between_groups():
+    net = network.parse_text("pr a b < c d\n")
+    assert net.priorities == [("c", "a"), ("c", "b"), ("d", "a"), ("d", "b")]
+
+
+def test_arcs_from_the_place():
+    net = network.parse_text("pl p (1) t u*2 -> v w?3 x?-1 y!2 z!-4\n")
+    t, u, v, w, x, y, z = net.transitions
+    assert outputs(t) == [("p", 1)]
+    assert outputs(u) == [("p", 2)]
+    assert arcs(v) == [("p", InputArcTypes.REGULAR, 1)]
+    assert arcs(w) == [("p", InputArcTypes.READ, 3)]
+    assert arcs(x) == [("p", InputArcTypes.INHIBITOR, 1)]
+    assert y.stopwatch_arcs[0].type == InputArcTypes.READ
+    assert z.stopwatch_arcs[0].type == InputArcTypes.INHIBITOR
+    assert z.stopwatch_arcs[0].weight == 4
+
+
+def test_arc_types():
+    net = network.parse_text("tr t a b*3 c?2 d?-1 e!1 f!-2 -> g h*2\n")
+    (t,) = net.transitions
+    assert arcs(t) == [
+        ("a", InputArcTypes.REGULAR, 1),
+        ("b", InputArcTypes.REGULAR, 3),
+        ("c", InputArcTypes.READ, 2),
+        ("d", InputArcTypes.INHIBITOR, 1),
+    ]
+    assert [
+        (arc.place.name, arc.type, arc.weight) for arc in t.stopwatch_arcs
+    ] == [("e", InputArcTypes.READ, 1), ("f", InputArcTypes.INHIBITOR, 2)]
+    assert outputs(t) == [("g", 1), ("h", 2)]
+
+
+def test_read_arc_of_weight_zero():
+    # Always met, it used to be parsed as an inhibitor arc that never was
+    (t,) = network.parse_text("tr t p?0 -> q\n").transitions
+    assert arcs(t) == [("p", InputArcTypes.READ, 0)]
+    assert t.is_enabled()
+
+
+def test_multipliers():
+    net = network.parse_text("tr t p*2K -> q*3M\npl p (4K)\n")
+    (t,) = net.transitions
+    assert arcs(t) == [("p", InputArcTypes.REGULAR, 2_000)]
+    assert outputs(t) == [("q", 3_000_000)]
+    assert net.places[0].tokens == 4_000
+
+
+@pytest.mark.parametrize(
+    "text, interval",
+    [
+        ("[0,w[", UNTIMED),
+        ("[2,2]", Interval(2, 2, False, False)),
+        ("]1,3[", Interval(1, 3, True, True)),
+        ("[0,4[", Interval(0, 4, False, True)),
+        ("]5,w[", Interval(5, None, True, True)),
+    ],
+)
+def test_intervals(text, interval):
+    (t,) = network.parse_text(f"tr t {text} p -> q\n").transitions
+    assert t.interval == interval
+
+
+def test_braced_names():
+    net = network.parse_text(
+        "tr {fill tank} {in put}*2 -> {a\\}b}\n"
+        "pl {in put} : {my \\{label\\}} (1)\n"
+        "lb {fill tank} {back\\\\slash}\n"
+    )
+    (t,) = net.transitions
+    assert t.name == "fill tank"
+    assert t.label == "back\\slash"
+    assert arcs(t) == [("in put", InputArcTypes.REGULAR, 2)]
+    assert outputs(t) == [("a}b", 1)]
+    assert net.places[0].label == "my {label}"
+    assert net.places[0].tokens == 1
+
+
+@pytest.mark.parametrize(
+    "text, column, message",
+    [
+        ("arc t\n", 1, "Expected one of"),
+        ("tr t p\n", 7, "Expected '->'"),
+        ("tr t p?x -> q\n", 6, "Invalid arc 'p\\?x'"),
+        ("tr t p -> q?1\n", 11, "Unexpected '\\?' arc"),
+        ("tr t [3,1] p -> q\n", 6, "Empty interval"),
+        ("tr t [0, 5] p -> q\n", 6, "Invalid interval '\\[0,'"),
+        ("pl p ( 1 )\n", 6, "Invalid marking '\\('"),
+        ("pl p (x)\n", 6, "Expected a number, found 'x'"),
+        ("net a b\n", 7, "Unexpected 'b'"),
+        ("lb p x\n", 4, "Unknown place or transition 'p'"),
+        ("pr a b\n", 1, "Expected 'pr"),
+        ("nt n 2 x\n", 6, "Expected 0 or 1"),
+        ("tr {a b\n", 4, "Invalid name"),
+        ("tr\n", 3, "Expected a name"),
+    ],
+)
+def test_error_locations(text, column, message):
+    with pytest.raises(NetParseError, match=message) as error:
+        network.parse_text("net n\n\n" + text, "plant.net")
+    assert (error.value.line, error.value.column) == (3, column)
+    assert str(error.value).startswith(f"plant.net:3:{column}: ")
@@ -0,0 +1,59 @@
+from parsers import network
+from petri_matrix import MatrixPetriNet
+from simulate import SimulatedController
+
+
+DUPLICATES = """net duplicates
+tr t p p -> q
+tr u p*2 p?3 -> q
+pl p (2)
+"""
+
+
+def test_duplicate_regular_arcs_need_their_sum():
+    petri_network = network.parse_text(DUPLICATES)
+    matrix = MatrixPetriNet(petri_network)
+    assert matrix.enabled().tolist() == [True, False]
+    assert matrix.is_enabled(0)
+
+    petri_network.places[0].tokens = 1
+    matrix.refresh()
+    assert matrix.enabled().tolist() == [False, False]
+    assert not matrix.try_fire(0)
+
+    petri_network.places[0].tokens = 3
+    matrix.refresh()
+    assert matrix.enabled().tolist() == [True, True]
+    assert matrix.try_fire(1)
+    assert petri_network.get_marking() == [1, 1]
+
+
+# A cascade of unconditional transitions on each edge of 'a'
+CASCADE = """net cascade
+tr a p -> q
+tr ;x q -> r r
+tr ;y r*2 s?-1 -> t
+tr ;z t -> p
+tr b t -> s
+pl p (1)
+"""
+
+
+def test_controller_engine(sensors, monkeypatch):
+    inputs, outputs, remote_image = sensors
+    markings = []
+    for use_engine in (False, True):
+        petri_network = network.parse_text(CASCADE)
+        engine = None
+        if use_engine:
+            engine = MatrixPetriNet(petri_network)
+            # Only the candidates are checked, never the whole net
+            monkeypatch.setattr(engine, "enabled", None)
+        with SimulatedController(
+            petri_network, inputs, outputs, remote_image, engine=engine
+        ) as c:
+            for image in (0b01, 0, 0b01, 0b11):
+                c.step(image)
+            markings.append((c.marking(), c.metrics.fired))
+    assert markings[0] == markings[1]
+    assert markings[1] == ([1, 0, 0, 0, 0], [2, 2, 2, 2, 0])
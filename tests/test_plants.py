@@ -0,0 +1,55 @@
+import json
+
+import pytest
+
+from plants import load_manifest
+
+
+@pytest.fixture
+def manifest(tmp_path, sensors):
+    """Write a manifest of plants on the sensors device, returning its
+    path"""
+    (tmp_path / "cell.net").write_text("net cell\ntr a p -> q\npl p (1)\n")
+
+    def write(*plants):
+        path = tmp_path / "plants.json"
+        path.write_text(
+            json.dumps(
+                {
+                    "plants": [
+                        {"device": "sensors.dev", "net": "cell.net", **plant}
+                        for plant in plants
+                    ]
+                }
+            )
+        )
+        return path
+
+    return write
+
+
+def test_plants(manifest):
+    path = manifest(
+        {"name": "one", "journal": "one.jnl", "record": "one.rec"},
+        {"name": "two", "journal": "two.jnl"},
+    )
+    one, two = load_manifest(path)
+    assert (one.name, two.name) == ("one", "two")
+    assert one.device == path.parent / "sensors.dev"
+    assert one.journal == path.parent / "one.jnl"
+    assert (two.record, two.table) == (None, None)
+
+
+def test_default_names_must_differ(manifest):
+    with pytest.raises(ValueError, match=r"duplicate plant names \['sensors'"):
+        load_manifest(manifest({}, {}))
+
+
+@pytest.mark.parametrize("key", ["journal", "record"])
+def test_files_written_by_several_plants(manifest, key):
+    path = manifest(
+        {"name": "one", key: "shared"},
+        {"name": "two", key: "logs/../shared"},
+    )
+    with pytest.raises(ValueError, match=f"'{key}' .* several plants"):
+        load_manifest(path)
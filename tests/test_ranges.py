@@ -0,0 +1,58 @@
+import pytest
+
+from modbus.ranges import coalesce
+from parsers import network
+from simulate import SimulatedController
+
+
+@pytest.mark.parametrize(
+    "addresses, max_gap, max_count, ranges",
+    [
+        ([], 4, 10, []),
+        ([3], 4, 10, [(3, 1)]),
+        # Unsorted, with repeats
+        ([5, 1, 3, 1], 4, 10, [(1, 5)]),
+        # A gap of exactly max_gap is merged, one more isn't
+        ([0, 5], 4, 10, [(0, 6)]),
+        ([0, 6], 4, 10, [(0, 1), (6, 1)]),
+        ([0, 1, 2], 0, 10, [(0, 3)]),
+        # Ranges are split at max_count
+        ([0, 9], 10, 10, [(0, 10)]),
+        ([0, 10], 10, 10, [(0, 1), (10, 1)]),
+        ([0, 2, 4, 6], 4, 4, [(0, 3), (4, 3)]),
+        (range(5), 0, 1, [(a, 1) for a in range(5)]),
+    ],
+)
+def test_coalesce(addresses, max_gap, max_count, ranges):
+    assert coalesce(addresses, max_gap, max_count) == ranges
+
+
+@pytest.mark.parametrize("max_gap, max_count", [(-1, 10), (0, 0)])
+def test_coalesce_limits(max_gap, max_count):
+    with pytest.raises(ValueError):
+        coalesce([0], max_gap, max_count)
+
+
+@pytest.mark.parametrize(
+    "max_count, ranges",
+    [
+        # Both inputs in one request, each bit of the response going to
+        # its bit of the image
+        (2, [(0, 2, [(0, 1), (1, 2)])]),
+        (1, [(0, 1, [(0, 1)]), (1, 1, [(0, 2)])]),
+    ],
+)
+def test_read_ranges(sensors, max_count, ranges):
+    inputs, outputs, remote_image = sensors
+    with SimulatedController(
+        network.parse_text("tr a p -> q\ntr b q -> p\n"),
+        inputs,
+        outputs,
+        remote_image,
+        max_count=max_count,
+    ) as controller:
+        assert controller.read_ranges == ranges
+        image = 0
+        for _, count, offsets in ranges:
+            image |= controller.pack(offsets, [True] * count)
+        assert image == 0b11
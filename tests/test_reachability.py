@@ -0,0 +1,60 @@
+from parsers import network
+from reachability import Explorer
+
+
+def explore(text, max_states=1000):
+    return Explorer(network.parse_text(text), max_states).run()
+
+
+def test_bounded_net():
+    report = explore(
+        """net ring
+tr a p -> q
+tr b q -> p
+tr c q r -> p
+pl p (1)
+"""
+    )
+    assert report.complete
+    assert (report.states, report.edges) == (2, 2)
+    assert report.dead_transitions == ["c"]
+    assert report.unbounded_places == []
+
+
+def test_covered_ancestor_far_up():
+    # s and q only grow after p went round the whole cycle
+    report = explore(
+        """net pump
+tr a p -> p1
+tr b p1 -> p2
+tr c p2 -> p3 s
+tr d p3 s?2 -> p
+tr e s*2 -> q
+tr f p3 -> p q
+pl p (1)
+"""
+    )
+    assert not report.complete
+    assert sorted(report.unbounded_places) == ["q", "s"]
+
+
+def test_unbounded_net():
+    report = explore("net grow\ntr a p -> p q\npl p (1)\n", max_states=5)
+    assert not report.complete
+    assert report.unbounded_places == ["q"]
+    assert report.marking_bytes == 1
+
+
+def test_duplicate_regular_arcs():
+    # c needs both tokens it takes from x, there is only one
+    report = explore(
+        """net duplicates
+tr a p -> q
+tr c x x -> y
+pl p (1)
+pl x (1)
+"""
+    )
+    assert report.complete
+    assert report.states == 2
+    assert report.dead_transitions == ["c"]
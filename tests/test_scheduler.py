@@ -0,0 +1,102 @@
+import pytest
+
+import scheduler
+from scheduler import TickScheduler
+
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(scheduler.time, "perf_counter", clock)
+    return clock
+
+
+def test_deadlines_dont_drift(clock):
+    ticks = TickScheduler(0.01)
+    # Each loop takes 3 ms, the wait makes up for it
+    for i in range(1, 6):
+        clock.now += 0.003
+        delay = ticks.delay()
+        assert delay == pytest.approx(0.007)
+        clock.now += delay
+        assert clock.now == pytest.approx(100.0 + i * 0.01)
+    assert ticks.overruns == 0
+
+
+def test_overruns_skip_missed_deadlines(clock):
+    ticks = TickScheduler(0.01)
+    clock.now += 0.035
+    assert ticks.delay() == 0.0
+    assert (ticks.overruns, ticks.missed) == (1, 2)
+
+    # The next deadlines count from the overrun
+    clock.now += 0.002
+    assert ticks.delay() == pytest.approx(0.008)
+
+
+def test_backoff(clock):
+    ticks = TickScheduler(0.01, 0.05, 2.0)
+    periods = []
+    for active in [False, False, False, False, True, False]:
+        start = clock.now
+        clock.now += ticks.delay(active)
+        periods.append(round(clock.now - start, 6))
+    assert periods == [0.02, 0.04, 0.05, 0.05, 0.01, 0.02]
+
+
+def test_until(clock):
+    ticks = TickScheduler(0.01, 0.08)
+    # A timed transition is due before the deadline
+    assert ticks.delay(False, 100.005) == pytest.approx(0.005)
+    clock.now = 100.005
+    assert ticks.delay(False, 200.0) == pytest.approx(0.04)
+
+    # Already past, the loop runs right away
+    clock.now = 100.05
+    assert ticks.delay(True, 100.0) == 0.0
+    assert ticks.overruns == 0
+
+
+def test_restart(clock):
+    ticks = TickScheduler(0.01, 0.08)
+    ticks.delay(False)
+    clock.now += 5.0
+    ticks.restart()
+    assert ticks.period == 0.01
+    assert ticks.delay() == pytest.approx(0.01)
+
+
+def test_report(clock):
+    ticks = TickScheduler(0.01)
+    assert ticks.report() is None
+    clock.now += 0.025
+    ticks.delay()
+    clock.now += scheduler.REPORT_PERIOD_S
+    assert ticks.report() == (
+        "1 loops overran their 10 ms period (1 deadlines skipped in total)"
+    )
+
+    # At most once a period, and only when there are new overruns
+    clock.now += 0.025
+    ticks.delay()
+    assert ticks.report() is None
+    clock.now += scheduler.REPORT_PERIOD_S
+    assert ticks.report() is not None
+    clock.now += scheduler.REPORT_PERIOD_S
+    assert ticks.report() is None
+
+
+@pytest.mark.parametrize(
+    "period, max_period, backoff", [(0, None, 2), (1, 0.5, 2), (1, 2, 0.5)]
+)
+def test_invalid(period, max_period, backoff):
+    with pytest.raises(ValueError):
+        TickScheduler(period, max_period, backoff)
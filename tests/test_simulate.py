@@ -0,0 +1,12 @@
+from simulate import _init_worker, simulate
+
+
+def test_dead_initial_marking(tmp_path, sensors):
+    net = tmp_path / "dead.net"
+    net.write_text("net dead\ntr a q -> p\npl p (1)\n")
+    # Written by the sensors fixture
+    _init_worker(net, tmp_path / "sensors.dev", False)
+
+    result = simulate(0, 100, 0)
+    assert result.deadlock == (0, [0, 1])
+    assert result.events == 0
@@ -0,0 +1,32 @@
+import pytest
+
+from parsers import network
+from simulate import SimulatedController
+
+
+def controller(text, sensors):
+    inputs, outputs, remote_image = sensors
+    return SimulatedController(
+        network.parse_text(text), inputs, outputs, remote_image
+    )
+
+
+def test_timed_transition_fires_after_its_interval(sensors):
+    with controller("net t\ntr t [1,2] p -> q\npl p (1)\n", sensors) as c:
+        c.step(0)
+        assert c.marking() == [1, 0]
+        c.now = 1.0
+        c.step(0)
+        assert c.marking() == [0, 1]
+
+
+@pytest.mark.parametrize("arc", ["r!1", "r!-1"])
+def test_stopwatch_arcs_of_timed_transitions(sensors, arc):
+    with pytest.raises(ValueError, match="stopwatch"):
+        controller(f"net t\ntr t [1,2] p {arc} -> q\npl p (1)\n", sensors)
+
+
+def test_stopwatch_arcs_of_untimed_transitions(sensors):
+    with controller("net t\ntr t p r!1 -> q\npl p (1)\n", sensors) as c:
+        c.step(0)
+        assert c.marking() == [0, 0, 1]
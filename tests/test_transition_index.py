@@ -0,0 +1,63 @@
+from parsers import network
+from simulate import SimulatedController
+from transition_index import TransitionIndex
+
+
+# a and aX fire on the edges of input 0, ;c and on are unconditional
+NET = """net index
+tr a p -> q
+tr ;c q r?1 -> s
+tr aX s -> p
+tr on s t?-1 -> u
+tr b u*0 -> v
+"""
+
+
+def index(sensors, text=NET):
+    inputs, outputs, _ = sensors
+    return TransitionIndex(network.parse_text(text), inputs, outputs)
+
+
+def test_bindings(sensors):
+    built = index(sensors)
+    assert built.by_address == {0: [0, 2], 1: [4]}
+    assert built.events == [[], [], [], ["on"], []]
+    assert built.unconditional == [1, 3]
+
+
+def test_dependents(sensors):
+    # The unconditional transitions reading from the places each one
+    # changes, through any kind of arc. Read arcs and arcs of weight 0
+    # change nothing
+    assert index(sensors).dependents == [[1], [1, 3], [3], [3], []]
+
+
+def test_pending(sensors):
+    built = index(sensors)
+    assert built.pending == {1, 3}
+    built.pending = set()
+    built.invalidate()
+    assert built.pending == {1, 3}
+
+
+def test_only_candidates_are_checked(sensors):
+    inputs, outputs, remote_image = sensors
+    with SimulatedController(
+        network.parse_text(NET + "pl p (1)\npl r (1)\n"),
+        inputs,
+        outputs,
+        remote_image,
+    ) as c:
+        # Every unconditional transition is checked on the first loop only
+        c.step(0)
+        assert c.metrics.checks == [0, 1, 0, 1, 0]
+        c.step(0)
+        assert c.metrics.checks == [0, 1, 0, 1, 0]
+
+        # The edge makes a and aX candidates. a fires, then ;c which reads
+        # from q, and ;c and on which read from s are checked again, on
+        # after aX emptied s. b is never checked
+        c.step(0b01)
+        assert c.metrics.checks == [1, 3, 1, 2, 0]
+        assert c.marking() == [1, 0, 1, 0, 0, 0, 0]
+        assert c.index.pending == set()